@@ -1,9 +1,16 @@
-import pandas as pd
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
 from math import pi
 from bokeh.io import output_file, show, save
 from bokeh.plotting import figure
 from bokeh.models import ColumnDataSource, HoverTool, FactorRange, CustomJS
 # import bokeh.palettes as bp # uncomment it if you need special colors that are pre-defined
+from dvc_common.cube import CategoricalCube
+from dvc_common.fetch import read_csv
+from dvc_common.timing import stage
+
+# Run using: python dvc_ex1_15915085.py
 
 
 # Task 1: Data Preprocessing
@@ -17,87 +24,105 @@ from bokeh.models import ColumnDataSource, HoverTool, FactorRange, CustomJS
 #original_url = 'https://github.com/daenuprobst/covid19-cases-switzerland/blob/master/demographics_switzerland_bag.csv'
 # changed URL to raw view
 original_url = 'https://raw.githubusercontent.com/daenuprobst/covid19-cases-switzerland/master/demographics_switzerland_bag.csv'
-df = pd.read_csv(original_url)
-# print(df.head(5))
-
-
-# T1.2 Prepare data for a grouped vbar_stack plot
-# Reference link, read first before starting:
-# https://docs.bokeh.org/en/latest/docs/user_guide/categorical.html#stacked-and-grouped
-
-
-# Filter out rows containing 'CH'
-df = df[df.canton != 'CH']
-# print(df.head(5))
-
-
-# Extract unique value lists of canton, age_group and sex
-canton = df.canton.unique()
-# print(canton)
-age_group = df.age_group.unique()
-# print(age_group)
-sex = df.sex.unique()
-# print(sex)
-
-# Create a list of categories in the form of [(canton1,age_group1), (canton2,age_group2), ...]
-factors = []
-for c in canton:
-    for a in age_group:
-        factors.append((c, a))
-# print(factors)
-
-# Use genders as stack names
-stacks = ['male', 'female']
-
-# Calculate total population size as the value for each stack identified by canton,age_group and sex stack_val
-stack_val = df.groupby(['canton', 'age_group', 'sex']).sum().unstack()
-# print(stack_val.head(100))
-
-# Build a ColumnDataSource using above information
-source = ColumnDataSource(data=dict(
-    x=factors,
-    male=stack_val.pop_size.Männlich,
-    female=stack_val.pop_size.Weiblich)
-)
-print(source)
-
-# Task 2: Data Visualization
-
-
-# T2.1: Visualize the data using bokeh plot functions
-p = figure(x_range=FactorRange(*factors), plot_height=500,
-           plot_width=800, title='Canton Population Visualization')
-p.yaxis.axis_label = "Population Size"
-p.xaxis.axis_label = "Canton"
-p.sizing_mode = "stretch_both"
-p.xgrid.grid_line_color = None
-
-
-p.vbar_stack(
-    stacks,
-    x='x',
-    source=source,
-    legend_label=stacks,
-    width=0.9,
-    alpha=0.5,
-    color=['blue', 'red']
-)
-
-# T2.2 Add the hovering tooltips to the plot using HoverTool
-# To be specific, the hover tooltips should display “gender”, canton, age group”, and “population” when hovering.
-# https://docs.bokeh.org/en/latest/docs/user_guide/tools.html#hovertool
-# read more if you want to create fancy hover text: https://stackoverflow.com/questions/58716812/conditional-tooltip-bokeh-stacked-chart
-
-hover = HoverTool(
-    tooltips=[("gender", "$name"),
-              ("canton, age group", "@x"),
-              ("population", "@$name")])
-              
-p.add_tools(hover)
-show(p)
-p.add_tools(hover)
-show(p)
-
-
-# T2.3 Save the plot as "dvc_ex1.html" using output_file """
-output_file("dvc_ex1.html")
\ No newline at end of file
+
+
+# Read the file and aggregate it into the population cube (T1.1 and T1.2)
+def load_data(url=original_url):
+    # read_csv keeps a local copy of the file and only downloads it again when it changed upstream
+    with stage('ex1.load'):
+        df = read_csv(url)
+    # print(df.head(5))
+
+
+    # T1.2 Prepare data for a grouped vbar_stack plot
+    # Reference link, read first before starting:
+    # https://docs.bokeh.org/en/latest/docs/user_guide/categorical.html#stacked-and-grouped
+
+
+    # Aggregate the population once into a canton x age_group x sex cube (dvc_common/cube.py).
+    # Slices such as cube.sum('canton') (national) or cube.select(canton='ZH') are plain array indexing,
+    # and every value stays tied to its labels instead of its row position
+    with stage('ex1.preprocess'):
+        cube = CategoricalCube.from_frame(df, ['canton', 'age_group', 'sex'], 'pop_size')
+
+        # Filter out rows containing 'CH'
+        cube = cube.exclude('canton', ['CH'])
+    return cube
+
+
+# Build the chart from the cube of load_data(), for all cantons or only the given ones
+def build_plot(cube, cantons=None):
+    if cantons is not None:
+        cube = cube.select(canton=list(cantons))
+
+    # Extract unique value lists of canton, age_group and sex (in the order of the file)
+    canton = cube.levels['canton']
+    # print(canton)
+    age_group = cube.levels['age_group']
+    # print(age_group)
+    sex = cube.levels['sex']
+    # print(sex)
+
+    # Categories in the form of [(canton1,age_group1), (canton2,age_group2), ...],
+    # and the population of each sex for every category, in the same order
+    factors, stack_val = cube.stack_columns('sex')
+    # print(factors)
+
+    # Use genders as stack names
+    stacks = ['male', 'female']
+
+    # Build a ColumnDataSource using above information
+    with stage('ex1.build'):
+        source = ColumnDataSource(data=dict(
+            x=factors,
+            male=stack_val['Männlich'],
+            female=stack_val['Weiblich'])
+        )
+
+    # Task 2: Data Visualization
+
+
+    # T2.1: Visualize the data using bokeh plot functions
+    p = figure(x_range=FactorRange(*factors), plot_height=500,
+               plot_width=800, title='Canton Population Visualization')
+    p.yaxis.axis_label = "Population Size"
+    p.xaxis.axis_label = "Canton"
+    p.sizing_mode = "stretch_both"
+    p.xgrid.grid_line_color = None
+
+
+    p.vbar_stack(
+        stacks,
+        x='x',
+        source=source,
+        legend_label=stacks,
+        width=0.9,
+        alpha=0.5,
+        color=['blue', 'red']
+    )
+
+    # T2.2 Add the hovering tooltips to the plot using HoverTool
+    # To be specific, the hover tooltips should display “gender”, canton, age group”, and “population” when hovering.
+    # https://docs.bokeh.org/en/latest/docs/user_guide/tools.html#hovertool
+    # read more if you want to create fancy hover text: https://stackoverflow.com/questions/58716812/conditional-tooltip-bokeh-stacked-chart
+
+    hover = HoverTool(
+        tooltips=[("gender", "$name"),
+                  ("canton, age group", "@x"),
+                  ("population", "@$name")])
+
+    p.add_tools(hover)
+    return p
+
+
+if __name__ == '__main__':
+    p = build_plot(load_data())
+    print(p.select_one({'type': ColumnDataSource}))
+
+    # show() serializes the document and writes the HTML file
+    with stage('ex1.save'):
+        show(p)
+
+
+    # T2.3 Save the plot as "dvc_ex1.html" using output_file """
+    output_file("dvc_ex1.html")
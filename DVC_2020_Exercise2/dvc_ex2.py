@@ -1,10 +1,19 @@
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
 import pandas as pd
 from math import pi
 import numpy as np
 from bokeh.io import output_file, show, save
-from bokeh.plotting import figure
-from bokeh.models import ColumnDataSource, HoverTool, FactorRange, Line
+from bokeh.plotting import figure, curdoc
+from bokeh.models import ColumnDataSource, HoverTool, FactorRange, Line, Range1d
 import bokeh.palettes as bp
+from dvc_common.loaders import load_cases, table_dir
+from dvc_common.coalesce import Coalescer, document_scheduler
+from dvc_common.incremental import SmoothedCases
+from dvc_common.downsample import minmax_envelope, window_rows
+from dvc_common.timecube import TimeCube
+from dvc_common.timing import footprint, stage, timed_callback
 
 # Goal: Draw a line chart displaying averaged daily new cases for all cantons in Switzerland.
 # Dataset: covid19_cases_switzerland_openzh-phase2.csv
@@ -17,99 +26,187 @@ import bokeh.palettes as bp
 # T1.1 Read data into a dataframe, set column "Date" to be the index
 
 url = 'https://raw.githubusercontent.com/daenuprobst/covid19-cases-switzerland/master/covid19_cases_switzerland_openzh-phase2.csv'
-raw = pd.read_csv(url, error_bad_lines=False)
-raw = raw.set_index('Date')
 
-
-# Initialize the first row with zeros, and remove the last column 'CH' from dataframe
-raw.iloc[0, :] = 0
-raw = raw.drop(columns=['CH'])
-
-
-# Fill null with the value of previous date from same canton
-# https://pandas.pydata.org/pandas-docs/stable/reference/api/pandas.DataFrame.fillna.html
-raw = raw.fillna(method='ffill')
-print(raw.head(10))
-
-# T1.2 Calculate and smooth daily case changes
-
-# Compute daily new cases (dnc) for each canton, e.g. new case on Tuesday = case on Tuesday - case on Monday;
-# Fill null with zeros as well
-dnc = raw.diff(axis=0, periods=1).fillna(0)
-print(dnc.head(10))
-
-# Smooth daily new case by the average value in a rolling window, and the window size is defined by step
-# Why do we need smoothing? How does the window size affect the result?
-# https://pandas.pydata.org/pandas-docs/stable/reference/api/pandas.DataFrame.rolling.html
-#TODO: find out why smoothing is required, check mean() again
+# Window size of the rolling mean in T1.2
 step = 3
-dnc_avg = dnc.rolling(step).mean()
-dnc_avg = dnc_avg.fillna(0)
-print(dnc_avg.head())
-
-
-# T1.3 Build a ColumnDataSource
-
-# Extract all canton names and dates
-# NOTE: be careful with the format of date when it is used as x input for a plot
-cantons = raw.columns.tolist()
-date = raw.index.values.tolist()
-date = pd.to_datetime(date)
-print(cantons)
-print(date)
-
-
-# Create a color list to represent different cantons in the plot, you can either construct your own color patette or use the Bokeh color pallete
-#TODO: adjust color palette
-color_palette = list(bp.magma(26))
-
-# Build a dictionary with date and each canton name as a key, i.e., {'date':[], 'AG':[], ..., 'ZH':[]}
-# For each canton, the value is a list containing the averaged daily new cases
-source_dict = {}
-source_dict["date"] = date
-for canton in cantons:
-	source_dict[canton] = dnc_avg[canton]
-
-# print(source_dict)
-source = ColumnDataSource(data=source_dict)
-
-
-# Task 2: Data Visualization
-
-# T2.1: Draw a group of lines, each line represents a canton, using date, dnc_avg as x,y. Add proper legend.
-# https://docs.bokeh.org/en/latest/docs/reference/models/glyphs/line.html?highlight=line#bokeh.models.glyphs.Line
-# https://docs.bokeh.org/en/latest/docs/user_guide/interaction/legends.html
-
-p = figure(plot_width=1000, plot_height=800,
-           x_axis_type="datetime", toolbar_location="above")
-p.title.text = 'Daily New Cases in Switzerland'
-
-lines = []
-for canton, color in zip(cantons, color_palette):
-	p.line(date, dnc_avg[canton], line_width=2,
-	       color=color, alpha=1, legend_label=canton, name=canton)
-
-
-# Make the legend of the plot clickable, and set the click_policy to be "hide"
-p.legend.location = "top_left"
-p.legend.click_policy = "hide"
-
-# T2.2 Add hovering tooltips to display date, canton and averaged daily new case
-
-# (Hovertip doc) https://docs.bokeh.org/en/latest/docs/user_guide/tools.html#hovertool
-# (Date hover)https://stackoverflow.com/questions/41380824/python-bokeh-hover-date-time
-hover = HoverTool(
-         tooltips=[
-            ('date', '@x{%F}'), 
-            ("canton", "$name"),
-            ("cases", "@y")
-        ],
-        formatters={'@x': 'datetime'}
-)
-
-p.add_tools(hover)
-
-show(p)
 
-output_file("dvc_ex2.html")
-save(p)
\ No newline at end of file
+# Averaged daily new cases per canton (T1.1 and T1.2), indexed by date
+def load_data(url=url, incremental=False):
+	# load_cases parses 'Date' while reading, uses float64 for all case columns and caches the parsed table
+	with stage('ex2.load'):
+		raw = load_cases(url)
+	raw = raw.set_index('Date')
+
+
+	# Keep only the canton columns
+	# (removes the last column 'CH' as well as the *_diff / *_pc columns of the file)
+	cantons = [c for c in raw.columns if c != 'CH' and not c.endswith(('_diff', '_pc'))]
+
+	# python dvc_ex2.py --incremental: T1.1/T1.2 only process the days that are newer than the persisted 
+	# result table in .cache/tables, which is appended to and matches the full recompute below
+	# (both compute in float64 and round the result to float32 once)
+	if incremental:
+		smoothed = SmoothedCases(os.path.join(table_dir, 'ex2_dnc_avg_%d.csv' % step), step)
+		with stage('ex2.preprocess', incremental=True):
+			smoothed.update(raw[cantons])
+			dnc_avg = TimeCube.from_frame(smoothed.read()).frame()
+		print(dnc_avg.tail())
+		footprint('ex2.preprocess', raw=raw, dnc_avg=dnc_avg)
+		return dnc_avg
+
+	# The canton columns go into one dates x cantons block (dvc_common/timecube.py), which T1.2
+	# below overwrites step by step instead of keeping a copy per step. It is float64, so the
+	# cumulative counts stay exact, and only the result is rounded to float32.
+	# DVC_TIMING=1 also prints the bytes each step holds
+	cube = TimeCube.from_frame(raw, cantons, dtype=np.float64)
+	footprint('ex2.load', raw=raw, cube=cube)
+	del raw
+
+	# Initialize the first row with zeros
+	cube.values[0, :] = 0
+
+
+	# Fill null with the value of previous date from same canton
+	# https://pandas.pydata.org/pandas-docs/stable/reference/api/pandas.DataFrame.fillna.html
+	with stage('ex2.ffill'):
+		cube.ffill()
+	print(cube.frame().head(10))
+
+	# T1.2 Calculate and smooth daily case changes
+
+	# Compute daily new cases (dnc) for each canton, e.g. new case on Tuesday = case on Tuesday - case on Monday;
+	# Fill null with zeros as well
+	with stage('ex2.diff'):
+		dnc = cube.diff().fillna(0)
+	print(dnc.frame().head(10))
+
+	# Smooth daily new case by the average value in a rolling window, and the window size is defined by step
+	# Why do we need smoothing? How does the window size affect the result?
+	# https://pandas.pydata.org/pandas-docs/stable/reference/api/pandas.DataFrame.rolling.html
+	#TODO: find out why smoothing is required, check mean() again
+	with stage('ex2.rolling'):
+		dnc_avg = dnc.rolling_mean(step).fillna(0).astype(np.float32)
+	footprint('ex2.rolling', dnc=dnc, dnc_avg=dnc_avg)
+
+	# A DataFrame over the float32 block, without copying it
+	dnc_avg = dnc_avg.frame()
+	print(dnc_avg.head())
+	return dnc_avg
+
+
+# Long histories are downsampled to a min/max envelope with about 2 points per screen pixel and series
+plot_width = 1000
+
+# The line chart of load_data(), for all cantons or only the given ones, initially showing start..end.
+# With server=True, zooming or panning re-queries the visible window (T2.3)
+def build_plot(dnc_avg, start=None, end=None, cantons=None, server=False):
+
+	# T1.3 Build a ColumnDataSource
+
+	# Extract all canton names and dates
+	# NOTE: be careful with the format of date when it is used as x input for a plot
+	if cantons is None:
+		cantons = dnc_avg.columns.tolist()
+	cantons = list(cantons)
+	date = pd.to_datetime(dnc_avg.index)
+	print(cantons)
+	print(date)
+
+
+	# Create a color list to represent different cantons in the plot, you can either construct your own color patette or use the Bokeh color pallete
+	#TODO: adjust color palette
+	# One color per canton, spread over magma (bp.magma(n) only goes up to 256 colors)
+	color_palette = [bp.Magma256[int(i)] for i in np.linspace(0, 255, len(cantons))]
+
+	# Build a dictionary with date and each canton name as a key, i.e., {'date':[], 'AG':[], ..., 'ZH':[]}
+	# For each canton, the value is an array containing the averaged daily new cases
+	# All lines share this one source, so the date column is sent only once. NumPy float32/float64 columns
+	# go through Bokeh's binary array encoding (datetime64 is sent as float64 milliseconds; int64 is not binary encoded)
+	with stage('ex2.columns'):
+		source_dict = {}
+		source_dict["date"] = date.values
+		for canton in cantons:
+			source_dict[canton] = dnc_avg[canton].values.astype(np.float32)
+
+	# window_data() returns the rows between start and end (plus half a window on each side for panning),
+	# at full resolution when they fit and as an envelope otherwise. The buckets are sized to the visible
+	# span, so the part on screen gets about 2 points per pixel and the margins are as fine
+	def window_data(start=None, end=None):
+		lo, hi = 0, len(date)
+		buckets = plot_width
+		if start is not None and end is not None:
+			lo, hi = window_rows(source_dict["date"], start, end)
+			v_lo, v_hi = window_rows(source_dict["date"], start, end, margin=0)
+			buckets = max(plot_width * (hi - lo) // max(v_hi - v_lo, 1), plot_width)
+		x, columns = minmax_envelope(source_dict["date"], {c: source_dict[c] for c in cantons}, buckets, lo, hi)
+		return dict(date=x, **columns)
+
+	x_start = date[0] if start is None else pd.Timestamp(start)
+	x_end = date[-1] if end is None else pd.Timestamp(end)
+
+	# print(source_dict)
+	with stage('ex2.build'):
+		source = ColumnDataSource(data=window_data() if start is None and end is None else
+			window_data(x_start, x_end))
+
+
+	# Task 2: Data Visualization
+
+	# T2.1: Draw a group of lines, each line represents a canton, using date, dnc_avg as x,y. Add proper legend.
+	# https://docs.bokeh.org/en/latest/docs/reference/models/glyphs/line.html?highlight=line#bokeh.models.glyphs.Line
+	# https://docs.bokeh.org/en/latest/docs/user_guide/interaction/legends.html
+
+	p = figure(plot_width=plot_width, plot_height=800,
+	           x_axis_type="datetime", toolbar_location="above",
+	           x_range=Range1d(x_start, x_end))
+	p.title.text = 'Daily New Cases in Switzerland'
+
+	lines = []
+	for canton, color in zip(cantons, color_palette):
+		lines.append(p.line(x='date', y=canton, source=source, line_width=2,
+		       color=color, alpha=1, legend_label=canton, name=canton))
+
+
+	# Make the legend of the plot clickable, and set the click_policy to be "hide"
+	p.legend.location = "top_left"
+	p.legend.click_policy = "hide"
+
+	# T2.2 Add hovering tooltips to display date, canton and averaged daily new case
+
+	# (Hovertip doc) https://docs.bokeh.org/en/latest/docs/user_guide/tools.html#hovertool
+	# (Date hover)https://stackoverflow.com/questions/41380824/python-bokeh-hover-date-time
+	hover = HoverTool(
+	         tooltips=[
+	            ('date', '@date{%F}'), 
+	            ("canton", "$name"),
+	            ("cases", "@$name")
+	        ],
+	        formatters={'@date': 'datetime'}
+	)
+
+	p.add_tools(hover)
+
+
+	# T2.3 With bokeh serve (bokeh serve --show dvc_ex2.py), zooming or panning re-queries the visible window 
+	# at full resolution, so the browser never holds more than about 2 points per pixel and series
+	# The start and end events of one zoom or pan are coalesced into one query
+	@timed_callback('ex2.update_window')
+	def update_window(_):
+		source.data = window_data(p.x_range.start, p.x_range.end)
+
+	if server:
+		window_updates = Coalescer(update_window, document_scheduler(p), interval=0)
+		p.x_range.on_change('start', lambda attr, old, new: window_updates.submit(None))
+		p.x_range.on_change('end', lambda attr, old, new: window_updates.submit(None))
+	return p
+
+
+if __name__ == '__main__':
+	p = build_plot(load_data(incremental='--incremental' in sys.argv))
+	show(p)
+
+	output_file("dvc_ex2.html")
+	with stage('ex2.save'):
+		save(p)
+elif __name__.startswith('bokeh_app_'):
+	curdoc().add_root(build_plot(load_data(incremental='--incremental' in sys.argv), server=True))
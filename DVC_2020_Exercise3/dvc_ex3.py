@@ -1,11 +1,19 @@
+import argparse
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
 import pandas as pd 
 import numpy as np
 import bokeh.palettes as bp
-from bokeh.plotting import figure
+from bokeh.plotting import figure, curdoc
 from bokeh.io import output_file, show, save
 from bokeh.models import ColumnDataSource, HoverTool, ColorBar, RangeTool
 from bokeh.transform import linear_cmap
 from bokeh.layouts import gridplot
+from dvc_common.coalesce import Coalescer, document_scheduler
+from dvc_common.downsample import as_datetime64, minmax_envelope, window_rows
+from dvc_common.tail import shared_tail
+from dvc_common.timing import stage, timed_callback
 
 
 # ==========================================================================
@@ -26,102 +34,275 @@ from bokeh.layouts import gridplot
 ## T1.1 Read the data to the dataframe "raw"
 # You can read the latest data from the url, or use the data provided in the folder (update Nov.3, 2020)
 url = 'https://github.com/daenuprobst/covid19-cases-switzerland/blob/master/covid19_tests_switzerland_bag.csv'
-raw = pd.read_csv('covid19_tests_switzerland_bag.csv',index_col=[0])
-print(raw.head())
-
-
-## T1.2 Create a ColumnDataSource containing: date, positive number, positive rate, total tests
-# All the data can be extracted from the raw dataframe.
-
-date = raw.date 
-pos_num = raw.n_positive
-pos_rate = raw.frac_positive
-test_num = raw.n_tests
-
-
-source = ColumnDataSource(data=dict(
-    x=pd.to_datetime(date),
-    test_num=test_num,
-    pos_num=pos_num,
-    pos_rate=pos_rate,
-))
-
-
-## T1.3 Map the range of positive rate to a colormap using module "linear_cmap"
-# "low" should be the minimum value of positive rates, and "high" should be the maximum value
-
-mapper = linear_cmap("P-Rate", bp.magma(len(pos_rate.unique())), pos_rate.min(), pos_rate.max(), low_color=None, high_color=None, nan_color='gray')
-
-
-### Task2: Data Visualization
-# Reference link:
-# (range tool example) https://docs.bokeh.org/en/latest/docs/gallery/range_tool.html?highlight=rangetool
-
-
-## T2.1 Covid-19 Total Tests Scatter Plot
-# x axis is the time, and y axis is the total test number. 
-# Set the initial x_range to be the first 30 days.
-
-TOOLS = "box_select,lasso_select,wheel_zoom,pan,reset,help"
-p = figure(plot_height=300, plot_width=800, 
-            tools=TOOLS, toolbar_location=None, 
-            x_axis_location="above",
-            background_fill_color="#efefef", x_range=(source.data['x'][0], source.data['x'][30]))
+path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'covid19_tests_switzerland_bag.csv')
+
+def load_data(path=path):
+	with stage('ex3.load'):
+		raw = pd.read_csv(path,index_col=[0])
+	print(raw.head())
+	return raw
+
+
+# Width of the overview plot in pixels, its line is downsampled to about 2 points per pixel
+select_width = 1200
+
+# The linked plots of load_data(), the scatter plot initially showing start..end (default: the first 30 days).
+# With server=True (bokeh serve --show dvc_ex3.py) the scatter only holds the rows of the selected window (T2.5),
+# with a dvc_common.tail.CsvTail rows appended to its file are streamed in every `interval` ms (T2.6)
+def build_plot(raw, start=None, end=None, server=False, tail=None, rollover=None, interval=1000):
+
+	## T1.2 Create a ColumnDataSource containing: date, positive number, positive rate, total tests
+	# All the data can be extracted from the raw dataframe.
+
+	# A live session can start before the first row arrives (an empty folder or a file with
+	# only the header); it starts from empty columns and fills them on the first poll
+	if not len(raw):
+		raw = pd.DataFrame(dict(date=pd.Series(dtype=object), n_tests=pd.Series(dtype=float),
+			n_positive=pd.Series(dtype=float), frac_positive=pd.Series(dtype=float)))
+
+	pos_rate = raw.frac_positive
+
+	# Time-indexed store: the columns as arrays sorted by date, a window is found by binary search
+	def sorted_columns(frame):
+		x = pd.to_datetime(frame.date).values
+		order = np.argsort(x, kind='stable')
+		return dict(
+			x=x[order],
+			test_num=frame.n_tests.values[order],
+			pos_num=frame.n_positive.values[order],
+			pos_rate=frame.frac_positive.values[order],
+		)
+
+	store = sorted_columns(raw)
+
+	# Rows of the store between start and end (plus half a window on each side for dragging)
+	def window_data(start, end):
+		lo, hi = window_rows(store['x'], start, end)
+		return {k: v[lo:hi] for k, v in store.items()}
+
+	# Initial range of the scatter plot, the first 30 days unless given (the last 30 days until today without rows)
+	def first_days():
+		if not len(store['x']):
+			today = pd.Timestamp.now().normalize()
+			return today - pd.Timedelta(days=30), today
+		return pd.Timestamp(store['x'][0]), pd.Timestamp(store['x'][min(30, len(store['x']) - 1)])
+
+	x_start, x_end = first_days()
+	x_start = x_start if start is None else pd.Timestamp(start)
+	x_end = x_end if end is None else pd.Timestamp(end)
+
+
+	with stage('ex3.build'):
+		if server:
+			# the overview line gets a min/max envelope of the full history,
+			# the scatter only the window selected with the RangeTool
+			x, columns = minmax_envelope(store['x'], dict(pos_num=store['pos_num']), select_width)
+			overview = ColumnDataSource(data=dict(x=x, **columns))
+			source = ColumnDataSource(data=window_data(x_start, x_end))
+		else:
+			source = overview = ColumnDataSource(data=store)
+
+
+	## T1.3 Map the range of positive rate to a colormap using module "linear_cmap"
+	# "low" should be the minimum value of positive rates, and "high" should be the maximum value
+
+	# (magma() has at most 256 colors, long histories have more distinct rates;
+	# without any rate yet the colors span 0..1 and widen with the first rows)
+	rate_low, rate_high = (pos_rate.min(), pos_rate.max()) if pos_rate.notna().any() else (0, 1)
+	mapper = linear_cmap("P-Rate", bp.magma(min(len(pos_rate.unique()) or 256, 256)), rate_low, rate_high, low_color=None, high_color=None, nan_color='gray')
+
+
+	### Task2: Data Visualization
+	# Reference link:
+	# (range tool example) https://docs.bokeh.org/en/latest/docs/gallery/range_tool.html?highlight=rangetool
+
+
+	## T2.1 Covid-19 Total Tests Scatter Plot
+	# x axis is the time, and y axis is the total test number. 
+	# Set the initial x_range to be the first 30 days.
+
+	TOOLS = "box_select,lasso_select,wheel_zoom,pan,reset,help"
+	p = figure(plot_height=300, plot_width=800, 
+	            tools=TOOLS, toolbar_location=None, 
+	            x_axis_location="above",
+	            background_fill_color="#efefef", x_range=(x_start, x_end))
             
-p.scatter(x="x",y="test_num",
-          source=source,
-          color=linear_cmap('pos_rate', bp.Magma256, pos_rate.min(), pos_rate.max()),
-          fill_alpha=0.5, size=10)
-
-p.title.text = 'Covid-19 Tests in Switzerland'
-p.yaxis.axis_label = "Total Tests"
-p.xaxis.axis_label = "Date"
-p.sizing_mode = "stretch_both"
-
-
-# Add a hovertool to display date, total test number
-hover = HoverTool(tooltips=[
-            ('date', '@x{%F}'),
-            ("test", "@test_num")
-        ],
-        formatters={'@x': 'datetime'}
-)
-p.add_tools(hover)
-
-## T2.2 Add a colorbar to the above scatter plot, and encode positve rate values with colors; please use the color mapper defined in T1.3
-
-color_bar = ColorBar(color_mapper=mapper['transform'], width=16, location=(0,0), title="P_rate")
-p.add_layout(color_bar, 'right')
-
-## T2.3 Covid-19 Positive Number Plot using RangeTool
-# In this range plot, x axis is the time, and y axis is the positive test number.
-
-select = figure(title="Drag the middle and edges of the selection box to change the range above",
-                plot_height=300,
-                plot_width=1200,
-                x_axis_type="datetime")
-
-# Define a RangeTool to link with x_range in the scatter plot
-range_tool = RangeTool(x_range=p.x_range)
-range_tool.overlay.fill_color = "green"
-range_tool.overlay.fill_alpha = 0.2
-
-
-# Draw a line plot and add the RangeTool to the plot
-select.line(x="x",y="pos_num",source=source)
-select.yaxis.axis_label = "Positive Cases"
-select.xaxis.axis_label = "Date"
-select.add_tools(range_tool)
-select.toolbar.active_multi = range_tool
-
-
-# Add a hovertool to the range plot and display date, positive test number
-hover2 = HoverTool(tooltips=[("date", "@x{%F}"), ("pos_num", "@pos_num"), ],  formatters={'@date': 'datetime'})
-select.add_tools(hover2)
-
-
-## T2.4 Layout arrangement and display
-linked_p = gridplot([[p],[select]])
-show(linked_p)
-output_file("dvc_ex3.html")
-save(linked_p)
\ No newline at end of file
+	rate_mapper = linear_cmap('pos_rate', bp.Magma256, rate_low, rate_high)
+	p.scatter(x="x",y="test_num",
+	          source=source,
+	          color=rate_mapper,
+	          fill_alpha=0.5, size=10)
+
+	p.title.text = 'Covid-19 Tests in Switzerland'
+	p.yaxis.axis_label = "Total Tests"
+	p.xaxis.axis_label = "Date"
+	p.sizing_mode = "stretch_both"
+
+
+	# Add a hovertool to display date, total test number
+	hover = HoverTool(tooltips=[
+	            ('date', '@x{%F}'),
+	            ("test", "@test_num")
+	        ],
+	        formatters={'@x': 'datetime'}
+	)
+	p.add_tools(hover)
+
+	## T2.2 Add a colorbar to the above scatter plot, and encode positve rate values with colors; please use the color mapper defined in T1.3
+
+	color_bar = ColorBar(color_mapper=mapper['transform'], width=16, location=(0,0), title="P_rate")
+	p.add_layout(color_bar, 'right')
+
+	## T2.3 Covid-19 Positive Number Plot using RangeTool
+	# In this range plot, x axis is the time, and y axis is the positive test number.
+
+	select = figure(title="Drag the middle and edges of the selection box to change the range above",
+	                plot_height=300,
+	                plot_width=select_width,
+	                x_axis_type="datetime")
+
+	# Define a RangeTool to link with x_range in the scatter plot
+	range_tool = RangeTool(x_range=p.x_range)
+	range_tool.overlay.fill_color = "green"
+	range_tool.overlay.fill_alpha = 0.2
+
+
+	# Draw a line plot and add the RangeTool to the plot
+	select.line(x="x",y="pos_num",source=overview)
+	select.yaxis.axis_label = "Positive Cases"
+	select.xaxis.axis_label = "Date"
+	select.add_tools(range_tool)
+	select.toolbar.active_multi = range_tool
+
+
+	# Add a hovertool to the range plot and display date, positive test number
+	hover2 = HoverTool(tooltips=[("date", "@x{%F}"), ("pos_num", "@pos_num"), ],  formatters={'@date': 'datetime'})
+	select.add_tools(hover2)
+
+
+	## T2.4 Layout arrangement and display
+	linked_p = gridplot([[p],[select]])
+
+
+	## T2.5 In server mode, moving the RangeTool (or zooming and panning the scatter plot) 
+	# replaces the scatter rows with the rows of the new window, so the detail view never holds
+	# more than about twice the rows of the selected window.
+	# The start and end events of one drag are coalesced into one query
+	following = False
+
+	@timed_callback('ex3.update_window')
+	def update_window(_):
+		if p.x_range.start is not None and p.x_range.end is not None:
+			source.data = window_data(p.x_range.start, p.x_range.end)
+
+	def range_changed(attr, old, new):
+		if not following:
+			window_updates.submit(None)
+
+	if server:
+		window_updates = Coalescer(update_window, document_scheduler(p), interval=0)
+		p.x_range.on_change('start', range_changed)
+		p.x_range.on_change('end', range_changed)
+
+
+	## T2.6 Live mode (bokeh serve --show dvc_ex3.py --args --watch [file or folder]):
+	# every session polls the shared tail and streams only the rows appended since its last poll.
+	# The color mappers widen when new rates fall outside them; a window that shows the latest row
+	# moves along with the new rows, which then replace the oldest rows of the scatter (rollover).
+	# With rollover the overview line keeps at most that many points.
+	if tail is None:
+		return linked_p
+
+	seen, generation = tail.count, tail.generation
+
+	def widen_colors(rate):
+		rate = rate[~np.isnan(rate)]
+		if not len(rate):
+			return
+		for m in (mapper, rate_mapper):
+			m['transform'].low = min(m['transform'].low, rate.min())
+			m['transform'].high = max(m['transform'].high, rate.max())
+
+	# All rows of the tail, which has none (and no columns) right after the file was replaced
+	def all_rows():
+		frame = tail.frame()
+		return sorted_columns(frame if len(frame) else raw.iloc[:0])
+
+	# Everything changed (file replaced, rows out of order or the first rows): load the store again,
+	# a session that started without rows moves to the first 30 days
+	def reload(columns):
+		nonlocal following
+		was_empty = not len(store['x'])
+		store.update(columns)
+		x, columns = minmax_envelope(store['x'], dict(pos_num=store['pos_num']), select_width)
+		overview.data = dict(x=x, **columns)
+		if was_empty and len(store['x']):
+			following = True
+			p.x_range.start, p.x_range.end = first_days()
+			following = False
+		source.data = window_data(p.x_range.start, p.x_range.end)
+		widen_colors(store['pos_rate'])
+
+	@timed_callback('ex3.stream')
+	def poll():
+		nonlocal seen, generation, following
+		tail.poll()
+		if tail.generation != generation:
+			seen, generation = tail.count, tail.generation
+			reload(all_rows())
+			return
+		new = tail.since(seen)
+		seen = tail.count
+		if not len(new):
+			return
+		rows = sorted_columns(new)
+		if not len(store['x']) or rows['x'][0] < store['x'][-1]:
+			reload(all_rows())
+			return
+		last = store['x'][-1]
+		for k in store:
+			store[k] = np.concatenate([store[k], rows[k]])
+		overview.stream(dict(x=rows['x'], pos_num=rows['pos_num']), rollover)
+		widen_colors(rows['pos_rate'])
+
+		r = p.x_range
+		if as_datetime64(r.end) >= last:
+			# follow the newest rows without querying the window again
+			shift = rows['x'][-1] - last
+			following = True
+			r.start, r.end = as_datetime64(r.start) + shift, as_datetime64(r.end) + shift
+			following = False
+			lo, hi = window_rows(store['x'], r.start, r.end)
+			source.stream(rows, hi - lo)
+		else:
+			lo, hi = window_rows(rows['x'], r.start, r.end)
+			if hi > lo:
+				source.stream({k: v[lo:hi] for k, v in rows.items()}, rollover)
+
+	curdoc().add_periodic_callback(poll, interval)
+	return linked_p
+
+
+# bokeh serve --show dvc_ex3.py --args --watch [file or folder] [--rollover N] [--interval ms]
+def live_args(argv):
+	parser = argparse.ArgumentParser(prog='dvc_ex3.py')
+	parser.add_argument('--watch', nargs='?', const=path, help='CSV file or folder of CSV files to stream from')
+	parser.add_argument('--rollover', type=int, help='points kept by the overview line')
+	parser.add_argument('--interval', type=int, default=1000, help='poll interval in ms')
+	return parser.parse_known_args(argv[1:])[0]
+
+
+if __name__ == '__main__':
+	linked_p = build_plot(load_data())
+	show(linked_p)
+	output_file("dvc_ex3.html")
+	with stage('ex3.save'):
+		save(linked_p)
+elif __name__.startswith('bokeh_app_'):
+	args = live_args(sys.argv)
+	if args.watch:
+		tail = shared_tail(args.watch, index_col=[0])
+		tail.poll()
+		curdoc().add_root(build_plot(tail.frame(), server=True, tail=tail, rollover=args.rollover, interval=args.interval))
+	else:
+		curdoc().add_root(build_plot(load_data(), server=True))
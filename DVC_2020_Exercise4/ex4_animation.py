@@ -0,0 +1,121 @@
+import time
+
+# ====================================================================
+# Server-side playback of the ex4 slider (T2.6 in ex4_play.py)
+#
+#   animation = Animation(frame, show, schedule, count, speed=2, direction=-1)
+#   animation.play(index)    start at frame index
+#   animation.pause()
+#
+# frame(i) computes the payload of frame i, show(i, payload) sends it,
+# schedule(callback, seconds) runs a callback later on the server loop
+# (dvc_common.coalesce.document_scheduler).
+#
+# Playback follows the wall clock: whenever a tick runs, the position
+# advances by `speed` frames per second in `direction` (-1 back, +1
+# forward, wrapping around at both ends). A tick that runs late skips
+# the frames it missed instead of queueing them, so a loaded server
+# shows fewer frames at the same speed rather than falling behind.
+#
+# The tick measures what a frame costs (computing plus sending) and
+# waits at least `load` times that cost before the next one, and at
+# least 1/speed seconds, so playback takes at most 1/load of the server
+# loop. Right after a frame is sent, the payloads of the next `ahead`
+# frames at the current speed and pacing are computed on the next tick
+# of the loop, so the tick itself only sends a precomputed frame.
+# ====================================================================
+
+
+class Animation:
+
+	def __init__(self, frame, show, schedule, count, speed=2, direction=-1, ahead=4, load=2, clock=time.monotonic):
+		self.frame = frame
+		self.show = show
+		self.schedule = schedule
+		self.count = count
+		self.speed = speed
+		self.direction = direction
+		self.ahead = ahead
+		self.load = load
+		self.clock = clock
+		self.playing = False
+		self.generation = 0
+		self.position = 0.0
+		self.index = 0
+		self.last = None
+		self.frames = {}
+		# moving averages of the seconds to compute and to send one frame
+		self.compute_cost = 0.0
+		self.show_cost = 0.0
+		self.shown = 0
+		self.skipped = 0
+		self.misses = 0
+
+	def play(self, index):
+		self.generation += 1
+		self.playing = True
+		self.seek(index)
+		self.last = self.clock()
+		self._later(self._tick, self.interval())
+		self._later(self._prefetch, 0)
+
+	def pause(self):
+		# callbacks scheduled for an older generation do nothing
+		self.generation += 1
+		self.playing = False
+		self.frames.clear()
+
+	# Continue from frame index (e.g. after the slider was dragged during playback)
+	def seek(self, index):
+		self.position = float(index)
+		self.index = index
+
+	# Seconds between two ticks at the current speed and cost
+	def interval(self):
+		return max(1.0 / self.speed, self.load * (self.compute_cost + self.show_cost))
+
+	def _later(self, fn, seconds):
+		generation = self.generation
+
+		def run():
+			if generation == self.generation:
+				fn()
+		self.schedule(run, seconds)
+
+	def _average(self, average, seconds, first):
+		return seconds if first else 0.8 * average + 0.2 * seconds
+
+	def _compute(self, i):
+		start = time.perf_counter()
+		payload = self.frame(i)
+		self.compute_cost = self._average(self.compute_cost, time.perf_counter() - start, self.compute_cost == 0)
+		return payload
+
+	def _tick(self):
+		now = self.clock()
+		self.position = (self.position + self.direction * self.speed * (now - self.last)) % self.count
+		self.last = now
+		index = int(round(self.position)) % self.count
+		moved = (index - self.index) * self.direction % self.count
+		if moved:
+			self.skipped += moved - 1
+			payload = self.frames.pop(index, None)
+			if payload is None:
+				self.misses += 1
+				payload = self._compute(index)
+			start = time.perf_counter()
+			self.show(index, payload)
+			self.show_cost = self._average(self.show_cost, time.perf_counter() - start, self.shown == 0)
+			self.shown += 1
+			self.index = index
+			self._later(self._prefetch, 0)
+		self._later(self._tick, max(self.interval() - (self.clock() - now), 0))
+
+	# Compute the frames the next ticks will show, drop those that are no longer coming
+	def _prefetch(self):
+		step = self.speed * self.interval()
+		wanted = [int(round(self.position + self.direction * step * k)) % self.count for k in range(1, self.ahead + 1)]
+		self.frames = {i: self.frames[i] for i in wanted if i in self.frames}
+		for i in wanted:
+			if i not in self.frames and i != self.index:
+				self.frames[i] = self._compute(i)
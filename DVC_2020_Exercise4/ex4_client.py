@@ -0,0 +1,90 @@
+from bokeh.models import ColumnDataSource, CustomJS
+
+# ====================================================================
+# Browser-side slider, Play button and color switch for the ex4 map.
+# Everything runs in BokehJS, so it also works in a standalone saved
+# HTML file without a bokeh server behind it.
+# ====================================================================
+
+day_ms = 86400000
+
+
+# ColumnDataSource with the flat float32 daily frames of MapData.frames (ex4_data.py)
+def frame_source(frames):
+	return ColumnDataSource(data=dict(dnc=frames))
+
+
+# Copy frame i into the 'dnc' and 'size' columns of source, region j takes the value of canton index[j]
+update_frame = """
+const n = source.data.dnc.length
+const index = regions.data.index
+const count = frames.data.dnc.length / width
+const i = Math.min(Math.max(Math.round((slider.value - slider.start) / %(day_ms)d), 0), count - 1)
+const frame = frames.data.dnc.subarray(i * width, (i + 1) * width)
+const dnc = new Float32Array(n)
+const size = new Float32Array(n)
+for (let j = 0; j < n; j++) {
+	const value = frame[index[j]]
+	dnc[j] = value
+	size[j] = (value * 1e5 / 5 + 10) * scale   // circle_size() in ex4_data.py
+}
+source.data.dnc = dnc
+source.data.size = size
+source.change.emit()
+""" % dict(day_ms=day_ms)
+
+# Play at speeds[speed_buttons.active] days per second, back or forward by direction_buttons, wrapping around.
+# Like the server-side animation (ex4_animation.py) the position follows the clock, so a slow browser
+# skips days instead of slowing down; a slider moved during playback becomes the new position.
+toggle_play = """
+if (button.label == '► Play') {
+	button.label = '❚❚ Pause'
+	const count = Math.round((slider.end - slider.start) / %(day_ms)d) + 1
+	const day = function() { return (slider.value - slider.start) / %(day_ms)d }
+	let position = day()
+	let last = performance.now()
+	const tick = function() {
+		const now = performance.now()
+		const speed = speeds[speed_buttons.active]
+		const direction = direction_buttons.active == 0 ? -1 : 1
+		if (Math.abs(day() - Math.round(position) %% count) > 0.5)
+			position = day()
+		position = ((position + direction * speed * (now - last) / 1000) %% count + count) %% count
+		last = now
+		slider.value = slider.start + Math.round(position) %% count * %(day_ms)d
+		button._timer = setTimeout(tick, 1000 / speed)
+	}
+	button._timer = setTimeout(tick, 1000 / speeds[speed_buttons.active])
+} else {
+	button.label = '► Play'
+	clearTimeout(button._timer)
+}
+""" % dict(day_ms=day_ms)
+
+# Switch the patches and the colorbar between the Density and BedsPerCapita mappers
+switch_color = """
+const label = labels[cb_obj.active]
+color_bar.color_mapper = mappers[label]
+color_bar.title = label
+cantons.glyph.fill_color = {field: label, transform: mappers[label]}
+"""
+
+
+# Attach the browser-side callbacks to the slider, the Play button and the radio buttons.
+# canton_index gives the frame column of every row of source (MapData.canton_index),
+# speed_buttons selects one of speeds (days per second), direction_buttons back or forward.
+def add_client_callbacks(source, frames, timeslider, button, buttons, cantons, color_bar, mappers,
+		canton_index, speed_buttons, direction_buttons, speeds, circle_scale=1):
+	regions = ColumnDataSource(data=dict(index=canton_index))
+	width = int(canton_index.max()) + 1 if len(canton_index) else 0
+	timeslider.js_on_change('value', CustomJS(
+		args=dict(source=source, frames=frames, regions=regions, width=width, scale=circle_scale, slider=timeslider),
+		code=update_frame))
+	button.js_on_click(CustomJS(
+		args=dict(button=button, slider=timeslider, speeds=speeds, speed_buttons=speed_buttons,
+			direction_buttons=direction_buttons),
+		code=toggle_play))
+	buttons.js_on_click(CustomJS(
+		args=dict(labels=list(mappers), mappers={k: m['transform'] for k, m in mappers.items()},
+			color_bar=color_bar, cantons=cantons),
+		code=switch_color))
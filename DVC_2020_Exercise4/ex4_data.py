@@ -0,0 +1,411 @@
+import hashlib
+import importlib.util
+import os
+import sys
+from collections import namedtuple
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import numpy as np
+import pandas as pd
+
+# geopandas (with shapely and pyproj) is imported by the functions reading or simplifying shapes,
+# so importing this module only to build documents from a MapData does not load it
+from dvc_common.fetch import MissingInput, read_csv, run_concurrently, write_atomic
+from dvc_common.loaders import load_cases, load_distinct
+from dvc_common.timecube import TimeCube
+from dvc_common.timing import footprint, stage
+
+# ====================================================================
+# Data preprocessing for the ex4 dashboard (Task 1 of ex4_play.py).
+#
+# preprocess() reads and merges all inputs and returns a MapData with
+# read-only arrays; every read and merge step is a dvc_common.timing
+# stage (DVC_TIMING=1 prints them). shared_data() keeps one MapData per
+# process and map level, so a bokeh server builds it once (see
+# server_lifecycle.py) and every session only creates its own document
+# on top of it.
+#
+# The map has two levels (LEVELS): the 26 cantons of gadm36_CHE_1 and
+# the about 2,100 municipalities of gadm36_CHE_3. Demographics and case
+# numbers only exist per canton, so every municipality shows the values
+# of its canton (canton_index maps map rows to canton columns).
+# ====================================================================
+
+
+# Convert polygon geometries into the flat 'xs'/'ys' lists used by p.patches.
+# Multi-polygons are concatenated with NaN separators (the same layout
+# GeoJSONDataSource builds in the browser), holes are ignored.
+# Coordinates are float32 (about 1 m at Swiss latitudes), which halves the payload.
+def geometry_columns(geoms):
+	xs, ys = [], []
+	for geom in geoms:
+		parts = list(geom.geoms) if geom.geom_type == 'MultiPolygon' else [geom]
+		x, y = [], []
+		for k, part in enumerate(parts):
+			if k > 0:
+				x.append(np.nan)
+				y.append(np.nan)
+			px, py = part.exterior.coords.xy
+			x.extend(px)
+			y.extend(py)
+		xs.append(np.asarray(x, dtype=np.float32))
+		ys.append(np.asarray(y, dtype=np.float32))
+	return xs, ys
+
+
+# Circle size for a daily-new-cases-per-capita value, scaled down for the denser map levels
+def circle_size(dnc, scale=1):
+	return (dnc*1e5/5+10)*scale
+
+
+# Build the days x cantons TimeCube of daily new cases per capita, one float32 row per day.
+# Columns are selected by name ('<Canton>_diff_pc'), so column j always belongs to cantons[j];
+# cantons without data and days missing from the file end up as NaN.
+def case_cube(case_raw, cantons):
+	columns = [c + '_diff_pc' for c in cantons]
+	return TimeCube.from_frame(case_raw, columns, dates=pd.to_datetime(case_raw.Date), regions=cantons).daily()
+
+
+# Row index into the case matrix for a slider value.
+# The value may be a datetime or a timestamp in milliseconds (what DateSlider sends).
+def day_index(dates, value):
+	if isinstance(value, (int, float, np.number)):
+		day = pd.Timestamp(value, unit='ms')
+	else:
+		day = pd.Timestamp(value)
+	i = dates.searchsorted(day.normalize())
+	return int(min(i, len(dates) - 1))
+
+
+# ====================================================================
+# Level-of-detail canton outlines
+# ====================================================================
+
+# Simplification tolerances in degrees, from coarsest to finest; 0 is the full resolution shape file
+LOD_TOLERANCES = (0.005, 0.002, 0.0005, 0)
+
+cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'cache')
+
+
+# Simplify all outlines together so neighbouring cantons keep their shared borders (no gaps or overlaps).
+# shapely < 2.1 has no coverage_simplify, then every polygon is simplified on its own.
+def simplify_geometry(geoms, tolerance):
+	if tolerance == 0:
+		return geoms
+	import geopandas as gpd
+	try:
+		from shapely import coverage_simplify
+	except ImportError:
+		return geoms.simplify(tolerance, preserve_topology=True)
+	return gpd.GeoSeries(coverage_simplify(geoms.values, tolerance), index=geoms.index, crs=geoms.crs)
+
+
+# Version of the files in data/cache, increase it when their columns change
+GEO_CACHE_VERSION = 1
+
+
+# The files making up a shape file (.shp, .shx, .dbf, .prj, ...)
+def _shape_files(shape_dir):
+	stem = os.path.splitext(shape_dir)[0]
+	folder = os.path.dirname(shape_dir) or '.'
+	name = os.path.basename(stem)
+	return sorted(os.path.join(folder, f) for f in os.listdir(folder) if os.path.splitext(f)[0] == name)
+
+
+# Short key of the name, size and modification time of every file of the given shape files.
+# Cache files carry it in their name, so a changed, added or removed file is never read from an old cache.
+def _source_key(*shape_dirs):
+	h = hashlib.sha256()
+	for shape_dir in shape_dirs:
+		for path in _shape_files(shape_dir):
+			st = os.stat(path)
+			h.update(('%s %d %d\n' % (os.path.basename(path), st.st_size, st.st_mtime_ns)).encode('utf-8'))
+	return h.hexdigest()[:16]
+
+
+def _has_pyarrow():
+	return importlib.util.find_spec('pyarrow') is not None
+
+
+# Cache file in data/cache for `name` and the source key; Feather with pyarrow, GeoJSON otherwise
+def _cache_path(name, key):
+	return os.path.join(cache_dir, '%s-v%d-%s.%s' % (name, GEO_CACHE_VERSION, key, 'feather' if _has_pyarrow() else 'geojson'))
+
+
+# The Feather files hold the attributes, the geometry as WKB and the CRS as WKT in the schema metadata.
+# (geopandas' own GeoParquet/Feather files store the CRS as PROJJSON, which takes pyproj about
+# 40 ms to parse on every read, longer than reading the whole canton shape file.)
+def _read_cache(path):
+	import geopandas as gpd
+	if not path.endswith('.feather'):
+		return gpd.read_file(path)
+	import pyarrow.feather as feather
+	table = feather.read_table(path)
+	crs = table.schema.metadata.get(b'crs', b'').decode('utf-8') or None
+	geometry = gpd.GeoSeries.from_wkb(table.column('geometry').to_pylist(), crs=crs)
+	return gpd.GeoDataFrame(table.drop(['geometry']).to_pandas(), geometry=geometry)
+
+
+# Write frame to the cache file at path (through a temporary file) and remove older versions of it
+def _write_cache(path, frame):
+	if path.endswith('.feather'):
+		import pyarrow as pa
+		import pyarrow.feather as feather
+		table = pa.Table.from_pandas(pd.DataFrame(frame.drop(columns='geometry')), preserve_index=False)
+		table = table.append_column('geometry', pa.array(frame.geometry.to_wkb().values, type=pa.binary()))
+		crs = frame.crs.to_wkt() if frame.crs is not None else ''
+		table = table.replace_schema_metadata(dict(table.schema.metadata or {}, crs=crs))
+		write_atomic(path, lambda f: feather.write_feather(table, f))
+	else:
+		# (GeoJSON coordinates are WGS84 like the GADM shape files, which is what read_file assumes)
+		write_atomic(path, frame.to_json(drop_id=True).encode('utf-8'))
+	prefix = os.path.basename(path).rsplit('-', 2)[0] + '-'
+	for f in os.listdir(cache_dir):
+		if f.startswith(prefix) and f.count('-') == prefix.count('-') + 1 and f != os.path.basename(path):
+			os.remove(os.path.join(cache_dir, f))
+
+
+# Only the given attribute columns (and the geometry) of a shape file.
+# pyogrio, the default engine of geopandas >= 1.0, skips the other columns while reading
+# and reads in Arrow batches when pyarrow is installed; the fiona engine reads every
+# attribute row by row, the other columns are dropped afterwards.
+def read_shape_file(shape_dir, columns, geometry=True):
+	import geopandas as gpd
+	try:
+		import pyogrio
+	except ImportError:
+		frame = gpd.read_file(shape_dir, ignore_geometry=not geometry)
+		return frame[columns + (['geometry'] if geometry else [])]
+	return pyogrio.read_dataframe(shape_dir, columns=columns, read_geometry=geometry, use_arrow=_has_pyarrow())
+
+
+# Simplified outlines of shape_dir for every tolerance, as GeoSeries indexed by `key`.
+# Each level is cached in data/cache and rebuilt when a file of the shape file changes.
+def lod_geometry(shape_dir, shape_raw=None, tolerances=LOD_TOLERANCES, key='HASC_1'):
+	import geopandas as gpd
+	name = os.path.splitext(os.path.basename(shape_dir))[0]
+	source = _source_key(shape_dir)
+	levels = {}
+	for tol in tolerances:
+		path = _cache_path('%s_lod%s' % (name, tol), source)
+		if tol != 0 and os.path.exists(path):
+			levels[tol] = _read_cache(path).set_index(key).geometry
+			continue
+		if shape_raw is None:
+			shape_raw = read_shape_file(shape_dir, [key])
+		geoms = simplify_geometry(shape_raw.set_index(key).geometry, tol)
+		if tol != 0:
+			_write_cache(path, gpd.GeoDataFrame({key: geoms.index}, geometry=geoms.values, crs=geoms.crs))
+		levels[tol] = geoms
+	return levels
+
+
+# The municipality shape file is not in the repo
+class MissingRegionFile(MissingInput):
+	pass
+
+
+# Fail early when the shape file of a map level below cantons is not on disk
+def _require_region_dir(region_dir):
+	if region_dir is not None and not os.path.exists(region_dir):
+		raise MissingRegionFile('%s is missing, see LEVELS in ex4_data.py for where to get it' % region_dir)
+
+
+# The regions of a map level with the columns prepare() uses: geometry, 'HASC_1' and 'Canton',
+# plus 'GID_3' and 'NAME_3' for municipalities (region_dir), whose 'HASC_1' is looked up
+# through 'GID_1' in shape_dir. Cached in data/cache until a file of either shape file changes.
+def read_shape(shape_dir, region_dir=None):
+	_require_region_dir(region_dir)
+	sources = [shape_dir] if region_dir is None else [shape_dir, region_dir]
+	name = os.path.splitext(os.path.basename(sources[-1]))[0]
+	path = _cache_path(name + '_regions', _source_key(*sources))
+	if os.path.exists(path):
+		return _read_cache(path)
+
+	if region_dir is None:
+		shape_raw = read_shape_file(shape_dir, ['HASC_1'])
+	else:
+		cantons = read_shape_file(shape_dir, ['GID_1', 'HASC_1'], geometry=False)
+		shape_raw = read_shape_file(region_dir, ['GID_1', 'GID_3', 'NAME_3']).merge(cantons, how='left', on='GID_1')
+
+	# Extract canton name abbreviations from the attribute 'HASC_1', e.g. CH.AG --> AG, CH.ZH --> ZH
+	shape_raw['Canton'] = shape_raw['HASC_1'].str[-2:]
+	_write_cache(path, shape_raw)
+	return shape_raw
+
+
+# Coarsest tolerance that stays below one screen pixel when `span` degrees are shown on `pixels` pixels
+def pick_lod(span, pixels, tolerances=LOD_TOLERANCES):
+	pixel = span / pixels
+	for tol in tolerances:
+		if tol <= pixel:
+			return tol
+	return tolerances[-1]
+
+
+# ====================================================================
+# Task 1: Data Preprocessing
+# ====================================================================
+
+demo_url = 'https://raw.githubusercontent.com/daenuprobst/covid19-cases-switzerland/master/demographics.csv'
+local_url = 'https://raw.githubusercontent.com/daenuprobst/covid19-cases-switzerland/master/covid_19_cases_switzerland_standard_format.csv'
+case_url = 'https://raw.githubusercontent.com/daenuprobst/covid19-cases-switzerland/master/covid19_cases_switzerland_openzh-phase2.csv'
+data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+shape_dir = os.path.join(data_dir, 'gadm36_CHE_1.shp')
+
+# Map levels: shape file in data/, the column identifying a region, and the circle size scale.
+# gadm36_CHE_3 is not part of the repository, get it from the GADM 3.6 shapefile download
+# (https://gadm.org/download_country_v3.html) and put the gadm36_CHE_3.* files into data/.
+LEVELS = {
+	'canton': dict(shape='gadm36_CHE_1.shp', key='HASC_1', circle_scale=1),
+	'municipality': dict(shape='gadm36_CHE_3.shp', key='GID_3', circle_scale=0.3),
+}
+
+# Everything the documents need, shared by all sessions and never modified:
+#   level         'canton' or 'municipality', a key of LEVELS
+#   columns       static per-region columns (Canton, Density, BedsPerCapita, long, lat, plus Name for municipalities)
+#   lod           {tolerance: (xs, ys)} region outlines for every level of detail
+#   bounds        (minx, miny, maxx, maxy) of all regions
+#   region_bounds regions x (minx, miny, maxx, maxy)
+#   dates         DatetimeIndex of the rows of dnc_pc, one per day
+#   dnc_pc        days x cantons float32 daily new cases per capita (the values of a TimeCube)
+#   canton_index  column of dnc_pc for every region (0..25 in order at canton level)
+#   frames        dnc_pc as flat daily frames for the browser-side animation (a view, not a copy)
+#   ranges        {'Density': (low, high), 'BedsPerCapita': (low, high)} for the color mappers
+MapData = namedtuple('MapData', ['level', 'columns', 'lod', 'bounds', 'region_bounds', 'dates', 'dnc_pc', 'canton_index', 'frames', 'ranges'])
+
+
+def _readonly(a):
+	a = np.asarray(a)
+	a.flags.writeable = False
+	return a
+
+
+# Seconds per download attempt of every source (see dvc_common/fetch.py), the standard-format table is the largest
+FETCH_TIMEOUTS = dict(demo=30, local=120, cases=60)
+
+
+# T1.1 Read the four data sources, returns (demo_raw, local_raw, case_raw, shape_raw)
+# With region_dir (the municipality shape file), shape_raw holds its regions, 
+# each with the 'HASC_1' of its canton looked up through 'GID_1' in shape_dir.
+# The sources are independent and read concurrently, workers=1 reads them one after another.
+def load_inputs(demo_url=demo_url, local_url=local_url, case_url=case_url, shape_dir=shape_dir, region_dir=None,
+		workers=None, timeouts=FETCH_TIMEOUTS):
+	# Four data sources:
+	# Demographics.csv: the statistics data about population density and hospital beds per capita in each canton
+	# covid_19_cases_switzerland_standard_format.csv: the location(longitude, latitude) of the capital city in each canton
+	# covid19_cases_switzerland_openzh-phase2.csv: same as in ex2, daily new cases in each canton
+	# gadm36_CHE_1.shp: the shape file contains geometry data of swiss cantons, and is provided in the "data" folder. 
+
+	# The files are read through dvc_common.fetch, which keeps local copies and revalidates them,
+	# set DVC_OFFLINE=1 to start from the cached copies only
+	def read_demo():
+		with stage('ex4.read_demo'):
+			return read_csv(demo_url, timeout=timeouts.get('demo'))
+
+	# Only the canton locations of the long standard-format table are used (see prepare()),
+	# load_distinct reads just these three columns in chunks and keeps their distinct rows
+	def read_local():
+		with stage('ex4.read_local'):
+			return load_distinct(local_url, ['abbreviation_canton', 'lat', 'long'], timeout=timeouts.get('local'))
+
+	# Read the case table using the typed loader shared with ex2
+	def read_cases():
+		with stage('ex4.read_cases'):
+			return load_cases(case_url, timeout=timeouts.get('cases'))
+
+	# Read the needed columns of the shape file from shape_dir (cached as Feather in data/cache)
+	def read_shapes():
+		with stage('ex4.read_shape', level='canton' if region_dir is None else 'municipality'):
+			return read_shape(shape_dir, region_dir)
+
+	# Each source is downloaded and parsed in its own thread, so a parse overlaps with the other
+	# downloads and the stage takes about as long as the slowest source.
+	# A missing municipality shape file fails before anything is downloaded
+	_require_region_dir(region_dir)
+	with stage('ex4.read_inputs', workers=workers or 4):
+		inputs = run_concurrently(dict(demo=read_demo, local=read_local, cases=read_cases, shape=read_shapes), workers)
+	demo_raw, local_raw, case_raw, shape_raw = inputs['demo'], inputs['local'], inputs['cases'], inputs['shape']
+	return demo_raw, local_raw, case_raw, shape_raw
+
+
+# T1.2 Merge the inputs of load_inputs() into a MapData
+def prepare(demo_raw, local_raw, case_raw, shape_raw, shape_dir=shape_dir, level='canton'):
+	key = LEVELS[level]['key']
+
+	# Extract unique 'abbreviation_canton','lat','long' combinations from local_raw
+	canton_point = local_raw.groupby(['abbreviation_canton','lat','long']).size().reset_index()
+
+	# shape_raw already holds the canton name abbreviations ('Canton', see read_shape())
+	canton_poly = shape_raw[['geometry','Canton',key] + (['NAME_3'] if level == 'municipality' else [])]
+
+	# Merge canton_poly with demo_raw on attribute name 'Canton' into dataframe merged,
+	# then merge the result with canton_point on 'Canton' and 'abbreviation_canton' respectively.
+	# Municipalities get their circle at a point inside their own outline instead of the capital of the canton
+	with stage('ex4.merge'):
+		merged = canton_poly.merge(demo_raw, how="left", on="Canton")
+		if level == 'municipality':
+			points = merged.geometry.representative_point()
+			merged['long'], merged['lat'] = points.x.values, points.y.values
+			merged = merged.rename(columns={'NAME_3': 'Name'})
+		else:
+			merged = merged.merge(canton_point, how="left", left_on="Canton", right_on="abbreviation_canton")
+
+	# Extract the daily new cases per capita of all cantons (e.g. 'AG_diff_pc', 'AI_diff_pc', etc.) 
+	# into one days x cantons float32 block, row i holds the values of dates[i] in the canton order of merged;
+	# canton_index points every row of merged to its canton column
+	with stage('ex4.case_cube'):
+		cantons = pd.unique(merged.Canton)
+		cases = case_cube(case_raw, cantons)
+		canton_index = pd.Index(cantons).get_indexer(merged.Canton).astype(np.int32)
+
+	# Simplify the region outlines at several levels of detail (cached in data/cache),
+	# and convert each level to 'xs'/'ys' lists in the row order of merged
+	with stage('ex4.lod'):
+		lod = {}
+		for tol, geoms in lod_geometry(shape_dir, shape_raw, key=key).items():
+			xs, ys = geometry_columns(geoms.reindex(merged[key]))
+			lod[tol] = ([_readonly(x) for x in xs], [_readonly(y) for y in ys])
+
+	# Numbers go out as float32, which Bokeh sends as binary arrays
+	columns = {c: _readonly(merged[c].values.astype(np.float32)) for c in ['Density', 'BedsPerCapita', 'long', 'lat']}
+	columns['Canton'] = _readonly(merged.Canton.values)
+	if level == 'municipality':
+		columns['Name'] = _readonly(merged.Name.values)
+	ranges = {
+		'Density': (demo_raw.Density.min(), demo_raw.Density.max()),
+		'BedsPerCapita': (demo_raw.BedsPerCapita.min(), demo_raw.BedsPerCapita.max()),
+	}
+	# Row k of the cube is day k, so its flat values are already the daily frames of the animation
+	dnc_pc = _readonly(cases.values)
+	data = MapData(level=level, columns=columns, lod=lod, bounds=tuple(merged.total_bounds),
+		region_bounds=_readonly(merged.bounds.to_numpy()), dates=cases.dates,
+		dnc_pc=dnc_pc, canton_index=_readonly(canton_index), frames=dnc_pc.ravel(), ranges=ranges)
+	# DVC_TIMING=1 also prints what the inputs and the shared MapData hold
+	footprint('ex4.prepare', case_raw=case_raw, shape_raw=shape_raw, data=data)
+	return data
+
+
+# Map level selected on the command line (python ex4_play.py --municipality, bokeh serve ... --args --municipality)
+def level_from_argv(argv):
+	return 'municipality' if '--municipality' in argv else 'canton'
+
+
+# Shape file of a map level in data/
+def level_shape(level):
+	return os.path.join(data_dir, LEVELS[level]['shape'])
+
+
+def preprocess(demo_url=demo_url, local_url=local_url, case_url=case_url, shape_dir=shape_dir, level='canton'):
+	region_dir = level_shape(level) if level != 'canton' else None
+	inputs = load_inputs(demo_url, local_url, case_url, shape_dir, region_dir)
+	return prepare(*inputs, shape_dir=region_dir or shape_dir, level=level)
+
+
+_shared = {}
+
+# The MapData of this process and map level, preprocessed on first use
+def shared_data(level='canton'):
+	if level not in _shared:
+		_shared[level] = preprocess(level=level)
+	return _shared[level]
@@ -1,20 +1,27 @@
-import numpy as np
-import pandas as pd
-import geopandas as gpd
-from datetime import datetime,timedelta
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
 
+import numpy as np
 import bokeh.palettes as bp
 from bokeh.plotting import figure,curdoc
+from bokeh.io import output_file, save
 from bokeh.transform import linear_cmap
 from bokeh.layouts import column, row
 from bokeh.models import (CDSView, 
 						HoverTool,ColorBar,
-						GeoJSONDataSource, 
+						ColumnDataSource, 
 						Patches,
 						RadioButtonGroup,
 						DateSlider,
 						Button)
 
+from ex4_data import LEVELS, circle_size, day_index, level_from_argv, pick_lod, shared_data
+from ex4_client import frame_source, add_client_callbacks
+from ex4_animation import Animation
+from dvc_common.coalesce import Coalescer, document_scheduler
+from dvc_common.timing import stage, timed_callback
+
 
 # ====================================================================
 # Goal: Visualize demographics and daily new cases statistics in Switzerland
@@ -35,195 +42,272 @@ from bokeh.models import (CDSView,
 # ====================================================================
 
 # Run using: bokeh serve --show ex4_play.py
+# As a directory app with the data loaded once at server start: bokeh serve --show ../DVC_2020_Exercise4
+# Slider and Play button in the browser: add --args --client to either command
+# Municipality map (data/gadm36_CHE_3.shp, see ex4_data.LEVELS): add --args --municipality
+# Standalone ex4_play.html (no server needed): python ex4_play.py [--municipality]
 
 # ====================================================================
 
 ### Task 1: Data Preprocessing
 
-## T1.1 Read and filter data 
-# Four data sources:
-# Demographics.csv: the statistics data about population density and hospital beds per capita in each canton
-# covid_19_cases_switzerland_standard_format.csv: the location(longitude, latitude) of the capital city in each canton
-# covid19_cases_switzerland_openzh-phase2.csv: same as in ex2, daily new cases in each canton
-# gadm36_CHE_1.shp: the shape file contains geometry data of swiss cantons, and is provided in the "data" folder. 
-# Please do not submit any data file with your solution, and you can asssume your solution is at the same directory as data 
-
-
-#demo_url = 'https://github.com/daenuprobst/covid19-cases-switzerland/blob/master/demographics.csv'
-#local_url = 'https://github.com/daenuprobst/covid19-cases-switzerland/blob/master/covid_19_cases_switzerland_standard_format.csv'
-#case_url = 'https://github.com/daenuprobst/covid19-cases-switzerland/blob/master/covid19_cases_switzerland_openzh-phase2.csv'
-demo_url = 'https://raw.githubusercontent.com/daenuprobst/covid19-cases-switzerland/master/demographics.csv'
-local_url = 'https://raw.githubusercontent.com/daenuprobst/covid19-cases-switzerland/master/covid_19_cases_switzerland_standard_format.csv'
-case_url = 'https://raw.githubusercontent.com/daenuprobst/covid19-cases-switzerland/master/covid19_cases_switzerland_openzh-phase2.csv'
-shape_dir = 'data/gadm36_CHE_1.shp'
-
-# Read from demo_url into a dataframe using pandas
-demo_raw = pd.read_csv(demo_url)
-#print(demo_raw.head(5))
-
-# Read from local_url into a dataframe using pandas
-local_raw = pd.read_csv(local_url)
-#print(local_raw.head(5))
-
-# Extract unique 'abbreviation_canton','lat','long' combinations from local_raw
-canton_point = local_raw.groupby(['abbreviation_canton','lat','long']).size().reset_index()
-#print(canton_point)
-
-
-# Read from case_url into a dataframe using pandas
-case_raw = pd.read_csv(case_url)
-#print(case_raw.head(5))
-# Create a date list from case_raw and convert to datatime form
-dates_raw = list(case_raw.Date)
-dates = pd.to_datetime(dates_raw)
-#print(dates)
-
-
-# Read shape file from shape_dir using geopandas
-shape_raw = gpd.read_file(shape_dir)
-#print(shape_raw)
-
-# Extract canton name abbreviations from the attribute 'HASC_1', e.g. CH.AG --> AG, CH.ZH --> ZH
-# And save into a new column named 'Canton' 
-shape_raw['Canton'] = shape_raw['HASC_1'].str[-2:]
-#print(shape_raw.Canton)
-canton_poly = shape_raw[['geometry','Canton']]
-
-## T1.2 Merge data and build a GeoJSONDataSource
-
-# Merge canton_poly with demo_raw on attribute name 'Canton' into dataframe merged,
-# then merge the result with canton_point on 'Canton' and 'abbreviation_canton' respectively
-
-
-# Potential issue: 
-# https://stackoverflow.com/questions/57045479/is-there-a-way-to-fix-maximum-recursion-level-in-python-3
-merged = canton_poly.merge(demo_raw, how="left", on="Canton")
-merged = merged.merge(canton_point, how="left", left_on="Canton", right_on="abbreviation_canton")
-
-# For each date, extract a list of daily new cases per capita from all cantons(e.g. 'AG_diff_pc', 'AI_diff_pc', etc.), and add as a new column in merged
-# For instance, in the column['2020-10-31'], there are: [0.0005411327220155498, nan, nan, 0.000496300306803826, ...]
-
-for i,d in enumerate(dates_raw):
-	dnc = case_raw.loc[[i],:].filter(regex=(".*_diff_pc")).values
-	merged[d] = dnc[0][:-1]
-
-# Calculate circle sizes that are proportional to dnc per capita
-# Set the latest dnc as default 
-merged['size'] = merged.iloc[:,-1]*1e5/5+10
-merged['dnc'] = merged.iloc[:,-2]
-
-# Build a GeoJSONDataSource from merged
-geosource = GeoJSONDataSource(geojson=merged.to_json())
+# Task 1 lives in ex4_data.preprocess(). It reads the four data sources 
+# (demographics, canton locations, daily new cases and the gadm36_CHE_1 shape file),
+# merges them and returns read-only arrays, which shared_data() keeps for the whole process.
+# build_document() below only creates the models of one document on top of that.
 
 
 # Task 2: Data Visualization
 
-# T2.1 Create linear color mappers for 2 attributes in demo_raw: population density, hospital beds per capita 
-# Map their maximum values to the high, and mimimum to the low
-labels = ['Density','BedsPerCapita']
-
-mappers = {} 
-mappers['Density'] = linear_cmap(field_name='Density',palette=bp.inferno(256)[::-1], low=min(demo_raw.Density), high=max(demo_raw.Density))
-mappers['BedsPerCapita'] = linear_cmap(field_name='BedsPerCapita',palette=bp.inferno(256)[::-1], low=demo_raw.BedsPerCapita.min(), high=demo_raw.BedsPerCapita.max())
-
-# T2.2 Draw a Switzerland Map on canton level
-
-# Define a figure 
-p1 = figure(title = 'Demographics in Switzerland', 
-					 plot_height = 600 ,
-					 plot_width = 950, 
-					 toolbar_location = 'above',
-					 tools = "pan, wheel_zoom, box_zoom, reset")
-
-p1.xgrid.grid_line_color = None
-p1.ygrid.grid_line_color = None
-
-# Plot the map using patches, set the fill_color as mappers['Density']
-cantons = p1.patches(xs="xs", ys="ys", fill_color=mappers['Density'], source=geosource, line_width=0.25,fill_alpha=0.5)
-
-
-# Create a colorbar with mapper['Density'] and add it to above figure
-color_bar = ColorBar(color_mapper=mappers['Density']['transform'], width=16, location=(0,0), title="Density")
-p1.add_layout(color_bar, 'right')
-
-
-# Add a hovertool to display canton, density, bedspercapita and dnc 
-hover = HoverTool(tooltips=[("canton", "@Canton"),("Populationd Density", "@Density"),("BedsPerCapita", "@BedsPerCapita"),("Daily New Cases per Capita", "@dnc"),] ,renderers=[cantons])
-
-p1.add_tools(hover)
-
-
-# T2.3 Add circles at the locations of capital cities for each canton, and the sizes are proportional to daily new cases per capita
-sites = p1.circle('long', 'lat', source=geosource, color='blue', size='size', alpha=0.5)
-
-
-# T2.4 Create a radio button group with labels 'Density', and 'BedsPerCapita'
-buttons = RadioButtonGroup(labels=['Density', 'BedsPerCapita'],active=0)
- 
-# Define a function to update color mapper used in both patches and colorbar 
-def update_bar(new):
-	for i,d in enumerate(labels):
-		if i == new:
-			color_bar.color_mapper = mappers[d]["transform"]
-			color_bar.title = d
-			cantons.glyph.fill_color = mappers[d] # d is either 'Density' or 'BedsPerCapita'
-
-
-buttons.on_click(update_bar)
-
-
-# T2.5 Add a dateslider to control which per capita daily new cases information to display
-
-# Define a dateslider using maximum and mimimum dates, set value to be the latest date
-timeslider = DateSlider(title='Date',start=dates.min(), end=dates.max(), value=dates.max())
-
-# Complete the callback function 
-# Hints: 
-# 	convert the timestamp value from the slider to datetime and format it in the form of '%Y-%m-%d'
-#	update columns 'size', 'dnc' with the column named '%Y-%m-%d' in merged
-#	update geosource with new merged
-
-def callback(attr,old,new):
-	# Convert timestamp to datetime
-	# https://stackoverflow.com/questions/9744775/how-to-convert-integer-timestamp-to-python-datetime
-	#date = datetime.fromtimestamp(new)
-	i = new.strftime('%Y-%m-%d')
-	merged.size = merged[i]*1e5/5+10
-	merged.dnc = merged[i]
-	geosource.geojson = merged.to_json()
-
-# Circles change on mouse move
-timeslider.on_change('value', callback)
-
-
-# T2.6 Add a play button to change slider value and update the map plot dynamically
-# https://stackoverflow.com/questions/46420606/python-bokeh-add-a-play-button-to-a-slider
-# https://stackoverflow.com/questions/441147/how-to-subtract-a-day-from-a-date
-
-# Update the slider value with one day before current date
-def animate_update_slider():
-	# Extract date from slider's current value 
-	date = timeslider.value
-	# Subtract one day from date and do not exceed the allowed date range
-	day =  date - timedelta(days=1)
-	# Handle out of range
-	if not day in dates:
-		day = dates[-1]
-	# Update timeslide value
-	timeslider.value = day
-
-# Define the callback function of button
-def animate():
-	global callback_id
-	if button.label == '► Play':
-		button.label = '❚❚ Pause'
-		callback_id = curdoc().add_periodic_callback(animate_update_slider, 500)
-	else:
-		button.label = '► Play'
-		curdoc().remove_periodic_callback(callback_id)
-
-button = Button(label='► Play', width=80, height=40)
-button.on_click(animate)
-
-curdoc().add_root(column(p1,buttons, row(timeslider,button)))
-
+# Build the models of one document from the shared MapData.
+# With client_side the slider, Play button and color switch run as CustomJS in the browser,
+# standalone leaves out the Python callbacks that need a bokeh server.
+# The municipality level draws about 2,100 patches and circles and renders the circles with WebGL.
+# The slider starts at date (default: the latest date), e.g. for the weekly snapshots of dvc_common.batch.
+# While the slider is dragged, the server updates the circles at most every slider_interval seconds;
+# with slider_interval=None the map only changes when the slider is released.
+def build_document(data, client_side=False, standalone=False, date=None, slider_interval=0.05):
+	dates, dnc_pc, index = data.dates, data.dnc_pc, data.canton_index
+	scale = LEVELS[data.level]['circle_scale']
+	first = len(dates) - 1 if date is None else day_index(dates, date)
+
+	# Daily new cases per capita of every region on row i of dnc_pc (municipalities show their canton)
+	def region_values(i):
+		return dnc_pc[i][index].astype('float32')
+
+	# Start with the coarsest level of detail that looks right for the whole country
+	plot_width = 950
+	lod_level = pick_lod(data.bounds[2] - data.bounds[0], plot_width)
+
+	# Build a ColumnDataSource for this document
+	# The outlines are sent once and only the rows that change their level of detail are patched later, 
+	# the slider only replaces the 'size' and 'dnc' columns (see callback below),
+	# which therefore get their own copies, as do the outline lists; all arrays are shared between sessions
+	xs, ys = data.lod[lod_level]
+	geosource = ColumnDataSource(data=dict(
+		xs=list(xs),
+		ys=list(ys),
+		size=circle_size(region_values(first), scale),
+		dnc=region_values(first),
+		**data.columns
+	))
+
+	# T2.1 Create linear color mappers for 2 attributes in demo_raw: population density, hospital beds per capita 
+	# Map their maximum values to the high, and mimimum to the low (precomputed in data.ranges)
+	labels = ['Density','BedsPerCapita']
+
+	mappers = {} 
+	for d in labels:
+		low, high = data.ranges[d]
+		mappers[d] = linear_cmap(field_name=d,palette=bp.inferno(256)[::-1], low=low, high=high)
+
+	# T2.2 Draw a Switzerland Map on canton level
+
+	# Define a figure 
+	p1 = figure(title = 'Demographics in Switzerland', 
+						 plot_height = 600 ,
+						 plot_width = plot_width, 
+						 toolbar_location = 'above',
+						 output_backend = 'webgl' if data.level == 'municipality' else 'canvas',
+						 tools = "pan, wheel_zoom, box_zoom, reset")
+
+	p1.xgrid.grid_line_color = None
+	p1.ygrid.grid_line_color = None
+
+	# Plot the map using patches, set the fill_color as mappers['Density']
+	cantons = p1.patches(xs="xs", ys="ys", fill_color=mappers['Density'], source=geosource, line_width=0.25,fill_alpha=0.5)
+
+
+	# Create a colorbar with mapper['Density'] and add it to above figure
+	color_bar = ColorBar(color_mapper=mappers['Density']['transform'], width=16, location=(0,0), title="Density")
+	p1.add_layout(color_bar, 'right')
+
+
+	# Add a hovertool to display canton, density, bedspercapita and dnc 
+	tooltips = [("canton", "@Canton"),("Populationd Density", "@Density"),("BedsPerCapita", "@BedsPerCapita"),("Daily New Cases per Capita", "@dnc"),]
+	if 'Name' in data.columns:
+		tooltips.insert(0, ("municipality", "@Name"))
+	hover = HoverTool(tooltips=tooltips ,renderers=[cantons])
+
+	p1.add_tools(hover)
+
+
+	# T2.3 Add circles at the locations of capital cities for each canton, and the sizes are proportional to daily new cases per capita
+	sites = p1.circle('long', 'lat', source=geosource, color='blue', size='size', alpha=0.5)
+
+
+	# T2.4 Create a radio button group with labels 'Density', and 'BedsPerCapita'
+	buttons = RadioButtonGroup(labels=['Density', 'BedsPerCapita'],active=0)
+
+	# Define a function to update color mapper used in both patches and colorbar 
+	# (the server callbacks record their latency in dvc_common.timing histograms)
+	@timed_callback('ex4.update_bar')
+	def update_bar(new):
+		for i,d in enumerate(labels):
+			if i == new:
+				color_bar.color_mapper = mappers[d]["transform"]
+				color_bar.title = d
+				cantons.glyph.fill_color = mappers[d] # d is either 'Density' or 'BedsPerCapita'
+
+
+	if not client_side:
+		buttons.on_click(update_bar)
+
+
+	# Swap in finer outlines when zooming in (wheel_zoom, box_zoom) and coarser ones when zooming out.
+	# Only regions within the view (plus half a view on every side) get the level of the current zoom,
+	# the others keep what they have; only rows whose level changes are patched, so panning
+	# at municipality level sends the few regions coming into view and not all 2,100 outlines.
+	# Patches go out as JSON number lists, rounding to 5 decimals (about 1 m) keeps the numbers short
+	shown = np.full(len(index), lod_level)
+
+	def outline(a):
+		return np.round(a.astype(float), 5)
+
+	minx, miny, maxx, maxy = data.region_bounds.T
+
+	@timed_callback('ex4.update_lod')
+	def update_lod(_):
+		x, y = p1.x_range, p1.y_range
+		if x.start is None or x.end is None:
+			return
+		level = pick_lod(x.end - x.start, plot_width)
+		dx = (x.end - x.start) / 2
+		near = (minx <= x.end + dx) & (maxx >= x.start - dx)
+		if y.start is not None and y.end is not None:
+			dy = (y.end - y.start) / 2
+			near &= (miny <= y.end + dy) & (maxy >= y.start - dy)
+		rows = np.flatnonzero(near & (shown != level))
+		if len(rows):
+			shown[rows] = level
+			fine_xs, fine_ys = data.lod[level]
+			geosource.patch({
+				'xs': [(int(j), outline(fine_xs[j])) for j in rows],
+				'ys': [(int(j), outline(fine_ys[j])) for j in rows],
+			})
+
+	# The four range bounds changed by one zoom or pan are coalesced into one outline update
+	lod_updates = Coalescer(update_lod, document_scheduler(p1), interval=0)
+
+	if not standalone:
+		for r in (p1.x_range, p1.y_range):
+			r.on_change('start', lambda attr, old, new: lod_updates.submit(None))
+			r.on_change('end', lambda attr, old, new: lod_updates.submit(None))
+
+
+	# T2.5 Add a dateslider to control which per capita daily new cases information to display
+
+	# Define a dateslider using maximum and mimimum dates, set value to be the latest date (or the requested one)
+	timeslider = DateSlider(title='Date',start=dates.min(), end=dates.max(), value=dates[first])
+
+	# Complete the callback function 
+	# Hints: 
+	# 	convert the timestamp value from the slider to a row index into dnc_pc
+	#	replace only the 'size' and 'dnc' columns of geosource, the geometry stays on the client;
+	#	data.update() sends just these two columns as binary float32 arrays, which is several times
+	#	smaller than a patch (patches go out as JSON number lists)
+
+	@timed_callback('ex4.callback')
+	def callback(attr,old,new):
+		# Convert timestamp to a row of dnc_pc
+		i = day_index(dates, new)
+		values = region_values(i)
+		geosource.data.update(size=circle_size(values, scale), dnc=values)
+
+	# Preview while dragging: only the circle sizes, the hover values follow when the slider is released
+	@timed_callback('ex4.preview')
+	def preview(new):
+		geosource.data.update(size=circle_size(region_values(day_index(dates, new)), scale))
+
+	# A drag sends a value for every mouse move, far more than can be computed and drawn.
+	# The previews are coalesced (dvc_common/coalesce.py): at most one every slider_interval seconds,
+	# always for the newest value, the values in between are dropped.
+	# value_throttled only changes when the slider is released and then gets the full update.
+	previews = Coalescer(preview, document_scheduler(timeslider), interval=slider_interval or 0)
+
+	# A slider released during playback also moves the animation there
+	def release(attr, old, new):
+		previews.cancel()
+		callback(attr, old, new)
+		if animation.playing:
+			animation.seek(day_index(dates, new))
+
+	# Circles change on mouse move (the previews, unless slider_interval is None) and fully on release
+	if not client_side:
+		if slider_interval is not None:
+			timeslider.on_change('value', lambda attr, old, new: previews.submit(new))
+		timeslider.on_change('value_throttled', release)
+
+
+	# T2.6 Add a play button to change slider value and update the map plot dynamically
+	# https://stackoverflow.com/questions/46420606/python-bokeh-add-a-play-button-to-a-slider
+	# https://stackoverflow.com/questions/441147/how-to-subtract-a-day-from-a-date
+
+	# Playback speeds in days per second, and the direction buttons (back is the default, as before)
+	speeds = [2, 5, 10, 20]
+	speed_buttons = RadioButtonGroup(labels=['%d days/s' % v for v in speeds], active=speeds.index(10 if client_side else 2))
+	direction_buttons = RadioButtonGroup(labels=['◄ Back', 'Forward ►'], active=0)
+
+	# Payload of one animation frame, computed ahead of time by the animation
+	def frame(i):
+		values = region_values(i)
+		return dict(size=circle_size(values, scale), dnc=values)
+
+	# Move the slider to frame i and send its precomputed columns (the preview of the slider change is dropped)
+	@timed_callback('ex4.animation_frame')
+	def show_frame(i, payload):
+		timeslider.value = dates[i]
+		previews.cancel()
+		geosource.data.update(**payload)
+
+	# The animation (ex4_animation.py) follows the wall clock at the selected speed and skips frames
+	# when the server falls behind, instead of stepping one day every 500 ms however long a step takes
+	animation = Animation(frame, show_frame, document_scheduler(timeslider), len(dates),
+		speed=speeds[speed_buttons.active], direction=-1)
+
+	# Define the callback function of button
+	def animate():
+		if button.label == '► Play':
+			button.label = '❚❚ Pause'
+			animation.play(day_index(dates, timeslider.value))
+		else:
+			button.label = '► Play'
+			animation.pause()
+
+	def set_speed(attr, old, new):
+		animation.speed = speeds[new]
+
+	def set_direction(attr, old, new):
+		animation.direction = -1 if new == 0 else 1
+
+	button = Button(label='► Play', width=80, height=40)
+	if not client_side:
+		button.on_click(animate)
+		speed_buttons.on_change('active', set_speed)
+		direction_buttons.on_change('active', set_direction)
+
+
+	# T2.7 Browser-side mode: all per-date canton values are preloaded as one float32 array,
+	# the slider, the Play button and the color switch run as CustomJS without any server round trip
+	if client_side:
+		frames = frame_source(data.frames)
+		add_client_callbacks(geosource, frames, timeslider, button, buttons, cantons, color_bar, mappers,
+			canton_index=index, circle_scale=scale, speed_buttons=speed_buttons, speeds=speeds,
+			direction_buttons=direction_buttons)
+
+	return column(p1,buttons, row(timeslider,button), row(direction_buttons, speed_buttons))
+
+
+# Running as a script writes a standalone HTML file, which always uses the browser-side callbacks;
+# bokeh serve runs this file as 'bokeh_app_...' (main.py of the directory app imports build_document instead)
+if __name__ == '__main__':
+	level = level_from_argv(sys.argv)
+	output_file("ex4_play.html" if level == 'canton' else "ex4_play_%s.html" % level)
+	layout = build_document(shared_data(level), client_side=True, standalone=True)
+	with stage('ex4.save'):
+		save(layout)
+elif __name__.startswith('bokeh_app_'):
+	data = shared_data(level_from_argv(sys.argv))
+	with stage('ex4.build_document'):
+		layout = build_document(data, client_side='--client' in sys.argv)
+	curdoc().add_root(layout)
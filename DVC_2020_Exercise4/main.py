@@ -0,0 +1,20 @@
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from bokeh.plotting import curdoc
+
+from ex4_data import level_from_argv, shared_data
+from ex4_play import build_document
+from dvc_common.timing import stage
+
+# ====================================================================
+# Session entry point of the ex4 directory app, run for every new session:
+#   bokeh serve --show DVC_2020_Exercise4 [--args [--client] [--municipality]]
+# The preprocessed data comes from server_lifecycle.py and is shared by all sessions.
+# ====================================================================
+
+data = shared_data(level_from_argv(sys.argv))
+with stage('ex4.build_document'):
+	layout = build_document(data, client_side='--client' in sys.argv)
+curdoc().add_root(layout)
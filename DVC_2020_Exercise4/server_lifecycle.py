@@ -0,0 +1,25 @@
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from ex4_data import level_from_argv, shared_data
+from dvc_common import timing
+
+# ====================================================================
+# Server lifecycle hooks of the ex4 directory app
+# (bokeh serve --show DVC_2020_Exercise4)
+# ====================================================================
+
+# bokeh serve only sets sys.argv to the --args while this module is executed
+level = level_from_argv(sys.argv)
+
+
+# Read, merge and preprocess all inputs once when the server starts,
+# every session then only builds its own document in main.py
+def on_server_loaded(server_context):
+	shared_data(level)
+
+
+# Write the stage records and callback latency histograms (DVC_TIMING, see dvc_common/timing.py)
+def on_server_unloaded(server_context):
+	timing.flush()
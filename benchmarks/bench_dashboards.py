@@ -0,0 +1,146 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ex4_dir = os.path.join(repo_dir, 'DVC_2020_Exercise4')
+sys.path.insert(0, repo_dir)
+sys.path.insert(0, ex4_dir)
+
+from bokeh.document import Document
+from bokeh.embed import file_html
+from bokeh.resources import CDN
+
+from dvc_common import timing
+from dvc_common.batch import dashboard_module
+import ex4_data
+import ex4_play
+
+from synthetic import dimensions, generate, scratch_caches
+
+# ====================================================================
+# Stage timings of all four dashboards on synthetic inputs
+#
+# benchmarks/synthetic.py writes inputs with the schemas of the real
+# files at the requested scales (cached in .cache/bench/scale<s>).
+# Every dashboard is run through the same stages:
+#
+#   load        read the input files
+#   preprocess  the Task 1 code of the exercise
+#   build       ColumnDataSource / outlines and the bokeh models
+#   serialize   Document.to_json() and json.dumps
+#   save        standalone HTML (bokeh.embed.file_html with CDN resources)
+#
+# ex1-ex3 call load_data() and build_plot() of their scripts (load is the
+# '<name>.load' stage recorded inside load_data, preprocess the rest), ex4
+# calls ex4_data.load_inputs/prepare and ex4_play.build_document. The parsed
+# table and outline caches go to a temporary folder, so load and
+# preprocess are always measured cold.
+#
+# Run: python benchmarks/bench_dashboards.py [--scales 1 10 100 1000] [--json out.jsonl]
+# ====================================================================
+
+STAGES = ['load', 'preprocess', 'build', 'serialize', 'save']
+
+
+class Stages:
+
+    def __init__(self):
+        self.seconds = {}
+        self.bytes = {}
+
+    # the scripts print their intermediate tables, which is not part of the output here
+    def run(self, stage, fn, *args):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = fn(*args)
+        self.seconds[stage] = time.perf_counter() - start
+        return result
+
+    # load_data() of a dashboard script: its '<name>.load' stage is the load,
+    # the rest of load_data() (the Task 1 code) the preprocess stage
+    def load_data(self, name, fn, *args):
+        result = self.run('preprocess', fn, *args)
+        load = [r for r in timing.records if r['kind'] == 'stage' and r['name'] == name + '.load'][-1]['seconds']
+        self.seconds['load'] = load
+        self.seconds['preprocess'] -= load
+        return result
+
+    def serialize_and_save(self, root, title):
+        doc = Document()
+        doc.add_root(root)
+        payload = self.run('serialize', lambda: json.dumps(doc.to_json()))
+        self.bytes['json'] = len(payload.encode('utf-8'))
+        html = self.run('save', file_html, root, CDN, title)
+        self.bytes['html'] = len(html.encode('utf-8'))
+
+
+# ex1: grouped and stacked population bars per region and age group
+def bench_ex1(paths, stages):
+    module = dashboard_module('ex1')
+    cube = stages.load_data('ex1', module.load_data, paths['demo_bag'])
+    stages.serialize_and_save(stages.run('build', module.build_plot, cube), 'ex1')
+
+
+# ex2: one line of smoothed daily new cases per region, min/max envelope over the full range
+def bench_ex2(paths, stages):
+    module = dashboard_module('ex2')
+    dnc_avg = stages.load_data('ex2', module.load_data, paths['cases'])
+    stages.serialize_and_save(stages.run('build', module.build_plot, dnc_avg), 'ex2')
+
+
+# ex3: tests scatter plot linked to a positive cases line with a RangeTool
+def bench_ex3(paths, stages):
+    module = dashboard_module('ex3')
+    raw = stages.load_data('ex3', module.load_data, paths['tests'])
+    stages.serialize_and_save(stages.run('build', module.build_plot, raw), 'ex3')
+
+
+# ex4: the map dashboard, standalone with the browser-side callbacks (what python ex4_play.py writes)
+def bench_ex4(paths, stages):
+    inputs = stages.run('load', ex4_data.load_inputs,
+                        paths['demo'], paths['standard'], paths['cases'], paths['shape'])
+    data = stages.run('preprocess', lambda: ex4_data.prepare(*inputs, shape_dir=paths['shape']))
+    root = stages.run('build', ex4_play.build_document, data, True, True)
+    stages.serialize_and_save(root, 'ex4')
+
+
+DASHBOARDS = {'ex1': bench_ex1, 'ex2': bench_ex2, 'ex3': bench_ex3, 'ex4': bench_ex4}
+
+
+def report(record):
+    print('%-4s %6g %s %9.1f KiB json %9.1f KiB html' % (
+        record['dashboard'], record['scale'],
+        ' '.join('%10.1f' % (1000 * record['seconds'][s]) for s in STAGES),
+        record['bytes']['json'] / 1024, record['bytes']['html'] / 1024))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stage timings of the dashboards on synthetic inputs')
+    parser.add_argument('--scales', type=float, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--dashboards', nargs='+', default=sorted(DASHBOARDS), choices=sorted(DASHBOARDS))
+    parser.add_argument('--data-dir', default=os.path.join(repo_dir, '.cache', 'bench'))
+    parser.add_argument('--json', help='append one JSON line per dashboard and scale to this file')
+    args = parser.parse_args()
+
+    print('%-4s %6s %s %18s %18s' % ('', 'scale', ' '.join('%10s' % (s + ' ms') for s in STAGES), 'json', 'html'))
+    for scale in args.scales:
+        dims = dimensions(scale)
+        paths = generate(scale, os.path.join(args.data_dir, 'scale%g' % scale))
+        for name in args.dashboards:
+            stages = Stages()
+            with scratch_caches():
+                DASHBOARDS[name](paths, stages)
+            record = dict(dashboard=name, scale=scale, seconds=stages.seconds, bytes=stages.bytes, **dims)
+            report(record)
+            if args.json:
+                with open(args.json, 'a') as f:
+                    f.write(json.dumps(record) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ex4_dir = os.path.join(repo_dir, 'DVC_2020_Exercise4')
+sys.path.insert(0, repo_dir)
+sys.path.insert(0, ex4_dir)
+
+from bokeh.document import Document
+from bokeh.embed import file_html
+from bokeh.models import DateSlider, RadioButtonGroup
+from bokeh.protocol import Protocol
+from bokeh.resources import CDN
+
+import ex4_data
+import ex4_play
+
+from synthetic import generate, load_map, scratch_caches
+
+# ====================================================================
+# Render and update costs of the ex4 map at canton and municipality level
+#
+# Both levels are built from the synthetic inputs of synthetic.py
+# (26 regions, 2,106 municipalities at scale 1) and measured as a
+# bokeh server session:
+#
+#   preprocess  load_inputs + prepare, cold shape and outline caches
+#   warm        the same again, reading the caches in data/cache
+#   build       build_document
+#   serialize   Document.to_json (what a new session pulls), with bytes
+#   html        standalone file with the browser-side callbacks, with bytes
+#   slider      one server-side slider step: callback time and message bytes
+#   color       Density -> BedsPerCapita switch
+#   zoom        box zoom to a tenth of the map, which swaps in finer outlines
+#   pan         pan the zoomed view by half its width
+#
+# Drawing in the browser (canvas patches, WebGL circles) is not covered,
+# the message bytes are what the browser has to decode and re-render.
+# Run: python benchmarks/bench_ex4_levels.py [--scale 1] [--steps 50] [--json out.jsonl]
+# ====================================================================
+
+
+def message_bytes(events):
+    protocol = Protocol()
+    total = 0
+    for event in events:
+        if not hasattr(event, 'generate'):
+            continue  # session callbacks added or removed, not sent to the browser
+        msg = protocol.create('PATCH-DOC', [event])
+        total += len(json.dumps(msg.content)) + sum(len(b) for _, b in msg.buffers)
+    return total
+
+
+# Run fn and the callbacks it scheduled on the document (pending, see bench_level),
+# return (seconds, bytes of the document changes they caused)
+def measure_change(doc, fn, pending=()):
+    events = []
+    doc.on_change(events.append)
+    start = time.perf_counter()
+    fn()
+    while pending:
+        pending.pop(0)()
+    seconds = time.perf_counter() - start
+    doc.remove_on_change(events.append)
+    return seconds, message_bytes(events)
+
+
+def bench_level(paths, level, steps):
+    result = dict(level=level)
+
+    start = time.perf_counter()
+    data = load_map(paths, level)
+    result['preprocess_ms'] = 1000 * (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    data = load_map(paths, level)
+    result['warm_ms'] = 1000 * (time.perf_counter() - start)
+    result['regions'] = len(data.canton_index)
+    result['vertices'] = {str(tol): sum(len(x) for x in xs) for tol, (xs, ys) in data.lod.items()}
+
+    # the server would run next-tick and timeout callbacks on its IOLoop, here they run right after each change
+    doc = Document()
+    pending = []
+    doc.add_next_tick_callback = pending.append
+    doc.add_timeout_callback = lambda fn, ms: pending.append(fn)
+    start = time.perf_counter()
+    root = ex4_play.build_document(data)
+    doc.add_root(root)
+    result['build_ms'] = 1000 * (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    payload = json.dumps(doc.to_json())
+    result['serialize_ms'] = 1000 * (time.perf_counter() - start)
+    result['document_bytes'] = len(payload)
+
+    start = time.perf_counter()
+    html = file_html(ex4_play.build_document(data, client_side=True, standalone=True), CDN, 'ex4')
+    result['html_ms'] = 1000 * (time.perf_counter() - start)
+    result['html_bytes'] = len(html.encode('utf-8'))
+
+    slider = doc.select_one({'type': DateSlider})
+    days = data.dates[-steps:]
+
+    def step():
+        # every day as a released slider, the full update of build_document
+        for day in days:
+            slider.value = day
+            slider.trigger('value_throttled', None, day)
+    seconds, size = measure_change(doc, step, pending)
+    result['slider_ms'] = 1000 * seconds / len(days)
+    result['slider_bytes'] = size / len(days)
+
+    buttons = [b for b in doc.select({'type': RadioButtonGroup}) if 'Density' in b.labels][0]
+    seconds, size = measure_change(doc, lambda: setattr(buttons, 'active', 1), pending)
+    result['color_ms'], result['color_bytes'] = 1000 * seconds, size
+
+    p = root.children[0]
+    minx, miny, maxx, maxy = data.bounds
+    cx, cy = (minx + maxx) / 2, (miny + maxy) / 2
+    hx, hy = (maxx - minx) / 20, (maxy - miny) / 20
+
+    def zoom():
+        # in the order the browser sends them
+        p.x_range.start, p.x_range.end = cx - hx, cx + hx
+        p.y_range.start, p.y_range.end = cy - hy, cy + hy
+    seconds, size = measure_change(doc, zoom, pending)
+    result['zoom_ms'], result['zoom_bytes'] = 1000 * seconds, size
+
+    def pan():
+        p.x_range.start, p.x_range.end = cx, cx + 2 * hx
+    seconds, size = measure_change(doc, pan, pending)
+    result['pan_ms'], result['pan_bytes'] = 1000 * seconds, size
+    return result
+
+
+def report(r):
+    print('%-12s %6d regions %8.0f ms preprocess %8.0f ms warm %6.1f ms build %6.1f ms serialize %8.1f KiB doc %8.1f KiB html'
+          % (r['level'], r['regions'], r['preprocess_ms'], r['warm_ms'], r['build_ms'], r['serialize_ms'],
+             r['document_bytes'] / 1024, r['html_bytes'] / 1024))
+    print('%-12s slider %6.2f ms %8.1f KiB   color %6.2f ms %8.1f KiB   zoom %6.2f ms %8.1f KiB   pan %6.2f ms %8.1f KiB'
+          % ('', r['slider_ms'], r['slider_bytes'] / 1024, r['color_ms'], r['color_bytes'] / 1024,
+             r['zoom_ms'], r['zoom_bytes'] / 1024, r['pan_ms'], r['pan_bytes'] / 1024))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ex4 map costs at canton and municipality level')
+    parser.add_argument('--scale', type=float, default=1)
+    parser.add_argument('--steps', type=int, default=50, help='slider steps to average over')
+    parser.add_argument('--data-dir', default=os.path.join(repo_dir, '.cache', 'bench'))
+    parser.add_argument('--json', help='append one JSON line per level to this file')
+    args = parser.parse_args()
+
+    paths = generate(args.scale, os.path.join(args.data_dir, 'scale%g' % args.scale))
+    for level in ex4_data.LEVELS:
+        with scratch_caches():
+            result = bench_level(paths, level, args.steps)
+        result['scale'] = args.scale
+        report(result)
+        if args.json:
+            with open(args.json, 'a') as f:
+                f.write(json.dumps(result) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+import argparse
+import os
+import sys
+import time
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ex4_dir = os.path.join(repo_dir, 'DVC_2020_Exercise4')
+sys.path.insert(0, repo_dir)
+sys.path.insert(0, ex4_dir)
+
+from bokeh.document import Document
+from bokeh.events import ButtonClick
+from bokeh.models import Button, ColumnDataSource, DateSlider, RadioButtonGroup
+
+import ex4_data
+import ex4_play
+
+from bench_ex4_slider import Loop
+from synthetic import generate, map_data
+
+# ====================================================================
+# ex4 Play on a busy server
+#
+# Plays the map for --seconds at --speed days per second on the event
+# loop of bench_ex4_slider.py. With --load-ms, the loop also runs a
+# competing callback of that many milliseconds every --load-every ms
+# (other sessions, slider drags, ...).
+#
+#   fixed     the Play button before: a periodic callback every 1/speed
+#             seconds that computes and sends the next day (like
+#             tornado's PeriodicCallback, missed runs are skipped)
+#   adaptive  build_document's Play button (ex4_animation.py)
+#
+# days is how far playback got compared to speed x seconds, frames the
+# frames sent, gap the longest time between two frames, and busy the
+# loop time spent on the animation.
+# Run: python benchmarks/bench_ex4_play.py [--level municipality] [--speed 20] [--load-ms 150]
+# ====================================================================
+
+
+def play(data, adaptive, speed, seconds, load_ms, load_every):
+    loop = Loop()
+    doc = Document()
+    doc.add_next_tick_callback = lambda fn: loop.call_later(0, fn)
+    doc.add_timeout_callback = lambda fn, ms: loop.call_later(ms / 1000, fn)
+    root = ex4_play.build_document(data, client_side=not adaptive)
+    doc.add_root(root)
+    slider = doc.select_one({'type': DateSlider})
+    source = [s for s in doc.select({'type': ColumnDataSource}) if 'size' in s.data][0]
+    dates, count = data.dates, len(data.dates)
+
+    frames = []
+    slider.on_change('value', lambda attr, old, new: frames.append((time.monotonic(), ex4_data.day_index(dates, new))))
+    start = time.monotonic()
+    end = start + seconds
+
+    if adaptive:
+        speed_buttons = [b for b in doc.select({'type': RadioButtonGroup}) if 'days/s' in b.labels[0]][0]
+        speed_buttons.active = speed_buttons.labels.index('%d days/s' % speed)
+        button = doc.select_one({'type': Button})
+        loop.call_at(start, lambda: button._trigger_event(ButtonClick(button)))
+        loop.call_at(end, lambda: button._trigger_event(ButtonClick(button)))
+    else:
+        scale = ex4_data.LEVELS[data.level]['circle_scale']
+        period = 1.0 / speed
+        state = dict(next=start)
+
+        def step():
+            i = ex4_data.day_index(dates, slider.value) - 1
+            if i < 0:
+                i = count - 1
+            slider.value = dates[i]
+            values = data.dnc_pc[i][data.canton_index]
+            source.data.update(size=ex4_data.circle_size(values, scale), dnc=values)
+            now = time.monotonic()
+            while state['next'] <= now:
+                state['next'] += period
+            if state['next'] < end:
+                loop.call_at(state['next'], step)
+        loop.call_at(start, step)
+
+    # the competing callbacks, their time is not counted as the animation's
+    loaded = []
+    if load_ms:
+        def busy():
+            loaded.append(load_ms / 1000)
+            stop = time.perf_counter() + load_ms / 1000
+            while time.perf_counter() < stop:
+                pass
+            if time.monotonic() < end:
+                loop.call_later(load_every / 1000, busy)
+        loop.call_at(start, busy)
+
+    loop.run()
+
+    days = 0
+    previous = ex4_data.day_index(dates, dates[-1])
+    for _, i in frames:
+        days += (previous - i) % count
+        previous = i
+    gaps = [b[0] - a[0] for a, b in zip(frames, frames[1:])]
+    return dict(days=days, frames=len(frames), gap=max(gaps) if gaps else 0.0, busy=loop.busy - sum(loaded))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ex4 Play with and without adaptive pacing')
+    parser.add_argument('--level', choices=sorted(ex4_data.LEVELS), default='municipality')
+    parser.add_argument('--scale', type=float, default=1)
+    parser.add_argument('--speed', type=int, default=20, choices=[2, 5, 10, 20], help='days per second')
+    parser.add_argument('--seconds', type=float, default=3)
+    parser.add_argument('--load-ms', type=float, default=150, help='competing callback length, 0 for none')
+    parser.add_argument('--load-every', type=float, default=50, help='ms between competing callbacks')
+    parser.add_argument('--data-dir', default=os.path.join(repo_dir, '.cache', 'bench'))
+    args = parser.parse_args()
+
+    paths = generate(args.scale, os.path.join(args.data_dir, 'scale%g' % args.scale))
+    expected = args.speed * args.seconds
+    with map_data(paths, args.level) as data:
+        for load_ms in (0, args.load_ms):
+            for name, adaptive in (('fixed', False), ('adaptive', True)):
+                r = play(data, adaptive, args.speed, args.seconds, load_ms, args.load_every)
+                print('%-9s load %3.0f ms: %4d of %4.0f days  %4d frames  gap %5.0f ms  busy %6.1f ms' % (
+                    name, load_ms, r['days'], expected, r['frames'], 1000 * r['gap'], 1000 * r['busy']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ex4_dir = os.path.join(repo_dir, 'DVC_2020_Exercise4')
+sys.path.insert(0, ex4_dir)
+
+from bokeh.application import Application
+from bokeh.application.handlers import DirectoryHandler, ScriptHandler
+
+import ex4_data
+
+# ====================================================================
+# Session creation benchmark for the ex4 dashboard
+#
+#   before: single-file app (bokeh serve ex4_play.py) where every session
+#           reads and preprocesses all inputs again
+#   after:  directory app (bokeh serve DVC_2020_Exercise4) where the
+#           server lifecycle hook preprocesses once and sessions share it
+#
+# Each session creates the document the way the server does and
+# serializes it once (what the browser pulls when it connects).
+# Run: python benchmarks/bench_ex4_sessions.py [--sessions 20] [--client]
+# Set DVC_OFFLINE=1 to measure from the local data cache only.
+# ====================================================================
+
+
+def create_sessions(app, n, reset_data):
+    docs = []
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    for _ in range(n):
+        if reset_data:
+            ex4_data._shared.clear()
+        doc = app.create_document()
+        doc.to_json()
+        docs.append(doc)
+    elapsed = time.perf_counter() - start
+    per_session = (tracemalloc.get_traced_memory()[0] - base) / n
+    tracemalloc.stop()
+    return elapsed, per_session
+
+
+def report(name, n, elapsed, per_session):
+    print('%-7s %8.1f ms/session %8.2f sessions/s %10.1f KiB/session'
+          % (name, 1000 * elapsed / n, n / elapsed, per_session / 1024))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sessions', type=int, default=20)
+    parser.add_argument('--client', action='store_true', help='use the browser-side callbacks')
+    args = parser.parse_args()
+    argv = ['--client'] if args.client else []
+
+    # Warm the download and table caches so both variants measure the same work
+    ex4_data.preprocess()
+
+    before = Application(ScriptHandler(filename=os.path.join(ex4_dir, 'ex4_play.py'), argv=argv))
+    elapsed, per_session = create_sessions(before, args.sessions, reset_data=True)
+    report('before', args.sessions, elapsed, per_session)
+
+    after = Application(DirectoryHandler(filename=ex4_dir, argv=argv))
+    ex4_data._shared.clear()
+    start = time.perf_counter()
+    after.on_server_loaded(None)
+    print('server start (preprocess once): %.1f ms' % (1000 * (time.perf_counter() - start)))
+    elapsed, per_session = create_sessions(after, args.sessions, reset_data=False)
+    report('after', args.sessions, elapsed, per_session)
+
+
+if __name__ == '__main__':
+    main()
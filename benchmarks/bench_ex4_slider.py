@@ -0,0 +1,152 @@
+import argparse
+import heapq
+import os
+import sys
+import time
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ex4_dir = os.path.join(repo_dir, 'DVC_2020_Exercise4')
+sys.path.insert(0, repo_dir)
+sys.path.insert(0, ex4_dir)
+
+from bokeh.document import Document
+from bokeh.models import ColumnDataSource, DateSlider
+
+import ex4_data
+import ex4_play
+
+from bench_ex4_levels import message_bytes
+from synthetic import generate, map_data
+
+# ====================================================================
+# A burst of slider events against the ex4 server callbacks
+#
+# A drag is simulated as --events slider values, one every --spacing ms,
+# followed by the release (value_throttled). Callbacks run on a small
+# event loop standing in for the server's: document timeout and
+# next-tick callbacks are queued on it and run in time order, with the
+# real time the callbacks take.
+#
+#   direct     every value runs the full update (the behaviour before
+#              coalescing, ex4.callback on every 'value' change)
+#   coalesced  build_document's slider callbacks: previews at most every
+#              slider_interval seconds, the full update on release
+#   release    build_document(slider_interval=None): no previews, only
+#              the full update on release
+#
+# Every document change is one message to the browser, which is modelled
+# as a pipe that takes --message-ms per message (sending and redrawing),
+# one message after another. lag is the time from the last slider event
+# until the browser shows its value. The run fails when the coalesced
+# callbacks do more than one update per interval (plus the release) or
+# lag behind by more than an interval plus two messages, or when release
+# sends anything but the one update on release. The Coalescer alone,
+# without geopandas or bokeh, is tested in tests/test_coalesce.py.
+# Run: python benchmarks/bench_ex4_slider.py [--level municipality] [--events 100]
+# ====================================================================
+
+
+class Loop:
+
+    def __init__(self):
+        self.queue = []
+        self.count = 0
+        self.busy = 0.0
+
+    def call_at(self, when, fn):
+        heapq.heappush(self.queue, (when, self.count, fn))
+        self.count += 1
+
+    def call_later(self, seconds, fn):
+        self.call_at(time.monotonic() + seconds, fn)
+
+    def run(self):
+        while self.queue:
+            when, _, fn = heapq.heappop(self.queue)
+            delay = when - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            start = time.perf_counter()
+            fn()
+            self.busy += time.perf_counter() - start
+
+
+def drag(data, coalesced, events, spacing, message_ms, interval):
+    loop = Loop()
+    doc = Document()
+    # the server would run these on its IOLoop
+    doc.add_next_tick_callback = lambda fn: loop.call_later(0, fn)
+    doc.add_timeout_callback = lambda fn, ms: loop.call_later(ms / 1000, fn)
+    root = ex4_play.build_document(data, client_side=not coalesced, slider_interval=interval)
+    doc.add_root(root)
+    slider = doc.select_one({'type': DateSlider})
+    source = [s for s in doc.select({'type': ColumnDataSource}) if 'size' in s.data][0]
+
+    if not coalesced:
+        scale = ex4_data.LEVELS[data.level]['circle_scale']
+
+        def callback(attr, old, new):
+            values = data.dnc_pc[ex4_data.day_index(data.dates, new)][data.canton_index]
+            source.data.update(size=ex4_data.circle_size(values, scale), dnc=values)
+        slider.on_change('value', callback)
+
+    # every change of the circle source: (time, bytes); the browser takes message_ms for each, in order.
+    # (The slider values themselves come from the browser and are not sent back.)
+    messages = []
+
+    def sent(event):
+        if getattr(event, 'model', None) is source:
+            messages.append((time.monotonic(), message_bytes([event])))
+    doc.on_change(sent)
+
+    days = data.dates[-events:]
+    start = time.monotonic() + 0.01
+    for k, day in enumerate(days):
+        loop.call_at(start + k * spacing, lambda day=day: setattr(slider, 'value', day))
+    last_event = start + (len(days) - 1) * spacing
+    loop.call_at(last_event, lambda: slider.trigger('value_throttled', None, days[-1]))
+
+    loop.run()
+
+    shown = 0.0
+    for when, _ in messages:
+        shown = max(shown, when) + message_ms / 1000
+    return dict(updates=len(messages), bytes=sum(n for _, n in messages), lag=shown - last_event,
+                seconds=loop.busy, drag=last_event - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ex4 slider drag with and without coalescing')
+    parser.add_argument('--level', choices=sorted(ex4_data.LEVELS), default='municipality')
+    parser.add_argument('--scale', type=float, default=1)
+    parser.add_argument('--events', type=int, default=100)
+    parser.add_argument('--spacing', type=float, default=5, help='ms between slider events')
+    parser.add_argument('--message-ms', type=float, default=20, help='ms the browser takes per update message')
+    parser.add_argument('--interval', type=float, default=0.05, help='slider_interval of build_document')
+    parser.add_argument('--data-dir', default=os.path.join(repo_dir, '.cache', 'bench'))
+    args = parser.parse_args()
+
+    paths = generate(args.scale, os.path.join(args.data_dir, 'scale%g' % args.scale))
+    results = {}
+    with map_data(paths, args.level) as data:
+        for name, coalesced, interval in (('direct', False, args.interval), ('coalesced', True, args.interval),
+                                          ('release', True, None)):
+            r = results[name] = drag(data, coalesced, args.events, args.spacing / 1000, args.message_ms, interval)
+            print('%-10s %4d events in %5.0f ms: %4d updates %9.1f KiB  callbacks %6.1f ms  lag %7.0f ms' % (
+                name, args.events, 1000 * r['drag'], r['updates'], r['bytes'] / 1024,
+                1000 * r['seconds'], 1000 * r['lag']))
+
+    r = results['coalesced']
+    max_updates = int(r['drag'] / args.interval) + 2
+    max_lag = args.interval + 2 * args.message_ms / 1000
+    ok = r['updates'] <= max_updates and r['lag'] <= max_lag
+    print('coalesced: %d <= %d updates, lag %.0f <= %.0f ms: %s' % (
+        r['updates'], max_updates, 1000 * r['lag'], 1000 * max_lag, 'ok' if ok else 'FAILED'))
+    released = results['release']['updates'] == 1
+    print('release: %d update: %s' % (results['release']['updates'], 'ok' if released else 'FAILED'))
+    ok = ok and released
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
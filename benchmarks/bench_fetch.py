@@ -0,0 +1,221 @@
+import argparse
+import hashlib
+import http.server
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ex4_dir = os.path.join(repo_dir, 'DVC_2020_Exercise4')
+sys.path.insert(0, repo_dir)
+sys.path.insert(0, ex4_dir)
+
+from dvc_common import fetch, timing
+import ex4_data
+
+from synthetic import generate, scratch_caches
+
+# ====================================================================
+# Sequential vs concurrent loading of the ex4 inputs from a slow server
+#
+# The synthetic inputs of synthetic.py are served by a local HTTP server
+# that waits --delay seconds before every response and sends bodies at
+# --rate KiB/s. The first --fail requests of every file get a 503, so
+# every source also goes through fetch()'s retries. DVC_DATA_MIRROR
+# points the upstream URLs at the server, and every run starts with
+# empty download, table and shape caches.
+#
+#   sequential   load_inputs(workers=1), the sources one after another
+#   concurrent   load_inputs(), one thread per source
+#   per source   the ex4.read_* stages of the concurrent run
+#
+# A last run stalls the demographics file for longer than its timeout
+# and checks that load_inputs gives up after the retries (the run fails
+# when it does not raise).
+#
+# check_cache() then goes through the cache states of fetch() against
+# the server, which answers If-None-Match with 304 when the ETag (a hash
+# of the file) still matches: offline miss, download, fresh copy (no
+# request), revalidation (304), changed file (new ETag, new body),
+# offline hit, and the cached copy when the server is gone. The run
+# fails (exit status 1) when one of them does not behave as expected.
+# Run: python benchmarks/bench_fetch.py [--scale 1] [--delay 0.5] [--rate 2048] [--fail 1]
+# ====================================================================
+
+
+class SlowHandler(http.server.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        server = self.server
+        name = os.path.basename(self.path)
+        path = os.path.join(server.root, name)
+        with server.lock:
+            server.requests[name] = server.requests.get(name, 0) + 1
+            count = server.requests[name]
+        if not os.path.exists(path):
+            self.send_error(404)
+            return
+        if count <= server.fail:
+            self.send_error(503)
+            return
+        time.sleep(server.stall.get(name, server.delay))
+        with open(path, 'rb') as f:
+            body = f.read()
+        etag = '"%s"' % hashlib.sha256(body).hexdigest()[:16]
+        if self.headers.get('If-None-Match') == etag:
+            with server.lock:
+                server.not_modified += 1
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        try:
+            self.send_response(200)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            # send 10 chunks per second at server.rate bytes per second
+            chunk = max(int(server.rate / 10), 1)
+            for i in range(0, len(body), chunk):
+                self.wfile.write(body[i:i + chunk])
+                time.sleep(0.1)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client gave up (timeout)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server(root, delay, rate, fail, stall=None):
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), SlowHandler)
+    server.daemon_threads = True
+    server.root, server.delay, server.rate, server.fail = root, delay, rate, fail
+    server.stall = stall or {}
+    server.lock = threading.Lock()
+    server.requests = {}
+    server.not_modified = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# load_inputs from the server with empty caches, returns seconds and the read stages
+def run(server, paths, workers=None, timeouts=ex4_data.FETCH_TIMEOUTS):
+    os.environ['DVC_DATA_MIRROR'] = 'http://127.0.0.1:%d/' % server.server_address[1]
+    with scratch_caches():
+        timing.records.clear()
+        start = time.perf_counter()
+        ex4_data.load_inputs(shape_dir=paths['shape'], workers=workers, timeouts=timeouts)
+        return time.perf_counter() - start, [r for r in timing.records if r['name'].startswith('ex4.read_')]
+
+
+# fetch() through every cache state of one file, returns the number of failed checks
+def check_cache(source):
+    scratch = tempfile.mkdtemp(prefix='dvc-bench-')
+    root, cache = os.path.join(scratch, 'www'), os.path.join(scratch, 'http')
+    os.makedirs(root)
+    name = os.path.basename(source)
+    shutil.copy(source, os.path.join(root, name))
+    server = start_server(root, 0, 1 << 30, 0)
+    url = 'http://127.0.0.1:%d/%s' % (server.server_address[1], name)
+    failed = []
+
+    def check(label, ok, path=None):
+        with open(path or os.devnull, 'rb') as f:
+            size = len(f.read())
+        print('  %-34s %2d requests %2d not modified %9.1f KiB  %s' % (
+            label, server.requests.get(name, 0), server.not_modified, size / 1024, 'ok' if ok else 'FAILED'))
+        if not ok:
+            failed.append(label)
+
+    def read(path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    try:
+        try:
+            fetch.fetch(url, offline=True, cache=cache)
+            check('offline, not cached', False)
+        except FileNotFoundError:
+            check('offline, not cached', server.requests.get(name, 0) == 0)
+
+        first = fetch.fetch(url, cache=cache)
+        check('download', server.requests[name] == 1 and read(first) == read(source), first)
+
+        path = fetch.fetch(url, cache=cache, max_age=60)
+        check('fresh copy', server.requests[name] == 1 and path == first, path)
+
+        path = fetch.fetch(url, cache=cache, max_age=0)
+        check('revalidated, unchanged', server.requests[name] == 2 and server.not_modified == 1 and path == first, path)
+
+        with open(os.path.join(root, name), 'ab') as f:
+            f.write(read(source).splitlines(True)[-1])
+        changed = fetch.fetch(url, cache=cache, max_age=0)
+        check('revalidated, changed', server.requests[name] == 3 and server.not_modified == 1 and
+              changed != first and read(changed) == read(os.path.join(root, name)), changed)
+
+        path = fetch.fetch(url, offline=True, cache=cache)
+        check('offline, cached', server.requests[name] == 3 and path == changed, path)
+
+        server.shutdown()
+        server.server_close()
+        path = fetch.fetch(url, cache=cache, max_age=0, retries=0, timeout=1)
+        check('server gone', path == changed, path)
+    finally:
+        # shutdown() and server_close() return at once when the server is already gone
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(scratch, ignore_errors=True)
+    return len(failed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ex4 input loading from a slow HTTP server')
+    parser.add_argument('--scale', type=float, default=1)
+    parser.add_argument('--delay', type=float, default=0.5, help='seconds before every response')
+    parser.add_argument('--rate', type=float, default=2048, help='KiB/s per response')
+    parser.add_argument('--fail', type=int, default=1, help='503 responses before a file is served')
+    parser.add_argument('--data-dir', default=os.path.join(repo_dir, '.cache', 'bench'))
+    args = parser.parse_args()
+
+    paths = generate(args.scale, os.path.join(args.data_dir, 'scale%g' % args.scale))
+    root = os.path.dirname(paths['demo'])
+    for key in ('demo', 'standard', 'cases'):
+        print('%-48s %8.1f KiB' % (os.path.basename(paths[key]), os.path.getsize(paths[key]) / 1024))
+
+    for name, workers in (('sequential', 1), ('concurrent', None)):
+        server = start_server(root, args.delay, args.rate * 1024, args.fail)
+        try:
+            seconds, stages = run(server, paths, workers)
+        finally:
+            server.shutdown()
+        print('%-12s %8.0f ms' % (name, 1000 * seconds))
+    for r in stages:
+        if r['name'] != 'ex4.read_inputs':
+            print('  %-24s %8.0f ms' % (r['name'], 1000 * r['seconds']))
+
+    # the demographics file stalls for longer than its timeout on every attempt
+    timeout = 1.0
+    server = start_server(root, 0, args.rate * 1024, 0, stall={os.path.basename(paths['demo']): timeout + 1})
+    start = time.perf_counter()
+    failed = 0
+    try:
+        run(server, paths, timeouts=dict(ex4_data.FETCH_TIMEOUTS, demo=timeout))
+        print('stalled      no error raised  FAILED')
+        failed += 1
+    except OSError as e:
+        print('stalled      %8.0f ms  %d requests, %s: %s  ok' % (
+            1000 * (time.perf_counter() - start), server.requests[os.path.basename(paths['demo'])],
+            type(e).__name__, e))
+    finally:
+        server.shutdown()
+
+    print('cache states of %s' % os.path.basename(paths['demo']))
+    failed += check_cache(paths['demo'])
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+
+import numpy as np
+
+from dvc_common import loaders, timing
+from dvc_common.batch import dashboard_module
+from dvc_common.incremental import SmoothedCases
+from dvc_common.timecube import TimeCube
+
+from synthetic import generate
+
+# ====================================================================
+# Incremental ex2 smoothing (dvc_common/incremental.py) vs the full recompute
+#
+# The synthetic case table is fed to SmoothedCases in --chunks growing
+# prefixes, as if upstream published that many updates. The persisted
+# table, as dvc_ex2.load_data(incremental=True) returns it (a float32
+# TimeCube frame), is compared with what dvc_ex2.load_data() computes
+# from the whole file. Then one cumulative count well before the last
+# processed day is revised, and the next update must rebuild the table
+# so that it matches the full path on the revised file again. Last, all
+# counts are raised above 2 ** 24, where float32 no longer holds every
+# integer, and a fresh table must still match the full path.
+#
+# Both paths compute in float64 and round the result to float32 once,
+# so the comparisons are exact (no tolerance); the run fails (exit
+# status 1) otherwise.
+# Run: python benchmarks/bench_incremental.py [--scale 10] [--chunks 20]
+# ====================================================================
+
+
+# The full T1.1/T1.2 path of dvc_ex2.py on a case file, and the seconds of its T1.2 stages
+def full_path(ex2, path):
+    timing.records.clear()
+    with contextlib.redirect_stdout(io.StringIO()):
+        dnc_avg = ex2.load_data(path)
+    seconds = sum(r['seconds'] for r in timing.records
+                  if r['kind'] == 'stage' and r['name'] in ('ex2.ffill', 'ex2.diff', 'ex2.rolling'))
+    return dnc_avg, seconds
+
+
+# The persisted table as the incremental path of dvc_ex2.py returns it
+def incremental_result(smoothed):
+    return TimeCube.from_frame(smoothed.read()).frame()
+
+
+def same(table, expected):
+    return table.shape == expected.shape and (table.index == expected.index).all() and \
+        np.array_equal(table.to_numpy(), expected.to_numpy())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='incremental ex2 smoothing against the full recompute')
+    parser.add_argument('--scale', type=float, default=10)
+    parser.add_argument('--chunks', type=int, default=20)
+    parser.add_argument('--step', type=int, default=3)
+    parser.add_argument('--data-dir', default=os.path.join(repo_dir, '.cache', 'bench'))
+    args = parser.parse_args()
+
+    paths = generate(args.scale, os.path.join(args.data_dir, 'scale%g' % args.scale))
+    scratch = tempfile.mkdtemp(prefix='dvc-bench-')
+    loaders.table_dir = os.path.join(scratch, 'tables')
+    try:
+        ex2 = dashboard_module('ex2')
+        ex2.step = args.step
+        expected, full = full_path(ex2, paths['cases'])
+        raw = loaders.load_cases(paths['cases']).set_index('Date')[expected.columns]
+        smoothed = SmoothedCases(os.path.join(scratch, 'dnc_avg.csv'), args.step)
+        failed = 0
+
+        ends = np.linspace(0, len(raw), args.chunks + 1).astype(int)[1:]
+        seconds = []
+        for end in ends:
+            start = time.perf_counter()
+            smoothed.update(raw.iloc[:end])
+            seconds.append(time.perf_counter() - start)
+        ok = same(incremental_result(smoothed), expected)
+        failed += not ok
+        print('%d days in %d updates: %6.1f ms per update (full recompute %6.1f ms), same table: %s' % (
+            len(raw), len(ends), 1000 * np.mean(seconds), 1000 * full, 'ok' if ok else 'FAILED'))
+
+        # upstream revises a count of an early day (and adds a new one)
+        revised = raw.copy()
+        row, column = len(raw) // 3, raw.columns[0]
+        revised.iloc[row, revised.columns.get_loc(column)] = np.nansum([revised[column].iloc[row], 7])
+        revised_path = os.path.join(scratch, 'revised.csv')
+        revised.reset_index().to_csv(revised_path, index=False)
+        rows = smoothed.state['rows']
+        smoothed.update(revised)
+        ok = smoothed.state['rows'] == len(revised) and \
+            same(incremental_result(smoothed), full_path(ex2, revised_path)[0])
+        failed += not ok
+        print('revised %s on %s (%d of %d processed days back): rebuilt, same table: %s' % (
+            column, revised.index[row].date(), rows - row, rows, 'ok' if ok else 'FAILED'))
+
+        # cumulative counts that float32 cannot hold exactly
+        large = raw + (2 ** 24 + 1)
+        large_path = os.path.join(scratch, 'large.csv')
+        large.reset_index().to_csv(large_path, index=False)
+        smoothed = SmoothedCases(os.path.join(scratch, 'large_dnc_avg.csv'), args.step)
+        smoothed.update(large)
+        ok = same(incremental_result(smoothed), full_path(ex2, large_path)[0])
+        failed += not ok
+        print('counts above 2 ** 24: same table: %s' % ('ok' if ok else 'FAILED'))
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+
+import pandas as pd
+from bokeh.document import Document
+from bokeh.models import ColumnDataSource
+
+from dvc_common.batch import dashboard_module
+from dvc_common.tail import CsvTail
+
+from synthetic import generate
+
+# ====================================================================
+# Live ex3 rows from a growing CSV file (dvc_common/tail.py, T2.6 of dvc_ex3.py)
+#
+# Rows of the synthetic tests file are appended to a scratch CSV file
+# step by step, and every step checks what CsvTail.poll() and since()
+# return: a header-only file, appended rows, a half-written last line,
+# a file that is rewritten (shorter), and a folder that gets a new file.
+#
+# Then dvc_ex3.build_plot starts a live session on an empty folder and
+# on a header-only file, and its poll callback must pick up the first
+# rows appended afterwards.
+#
+# Finally one poll of --append rows at the end of the --scale file is
+# timed against reading the whole file again. The run fails (exit
+# status 1) when a check does not hold. The same checks, without the
+# timing, run in tests/test_tail.py.
+# Run: python benchmarks/bench_tail.py [--scale 1000] [--append 10]
+# ====================================================================
+
+
+def write(path, lines, mode='a'):
+    with open(path, mode) as f:
+        f.write(''.join(lines))
+
+
+# A live dvc_ex3 session on tail; returns its poll callback and the scatter source
+def live_session(ex3, tail):
+    doc = Document()
+    polls = []
+    doc.add_next_tick_callback = lambda fn: fn()
+    doc.add_periodic_callback = lambda fn, ms: polls.append(fn)
+    ex3.curdoc = lambda: doc
+    with contextlib.redirect_stdout(io.StringIO()):
+        root = ex3.build_plot(tail.frame(), server=True, tail=tail)
+    doc.add_root(root)
+    source = [s for s in doc.select({'type': ColumnDataSource}) if 'test_num' in s.data][0]
+    return polls[0], source
+
+
+def main():
+    parser = argparse.ArgumentParser(description='CsvTail and the live ex3 session on growing CSV files')
+    parser.add_argument('--scale', type=float, default=1000)
+    parser.add_argument('--append', type=int, default=10, help='rows appended before the timed poll')
+    parser.add_argument('--data-dir', default=os.path.join(repo_dir, '.cache', 'bench'))
+    args = parser.parse_args()
+
+    paths = generate(args.scale, os.path.join(args.data_dir, 'scale%g' % args.scale))
+    with open(paths['tests']) as f:
+        lines = f.readlines()
+    header, rows = lines[0], lines[1:]
+    failed = []
+
+    def check(label, ok):
+        print('  %-44s %s' % (label, 'ok' if ok else 'FAILED'))
+        if not ok:
+            failed.append(label)
+
+    def dates(frame):
+        return list(frame.date)
+
+    def row_dates(selected):
+        return [line.split(',')[1] for line in selected]
+
+    scratch = tempfile.mkdtemp(prefix='dvc-bench-')
+    try:
+        print('CsvTail')
+        path = os.path.join(scratch, 'tests.csv')
+        write(path, [header], 'w')
+        tail = CsvTail(path, index_col=[0])
+        check('header only: no rows', tail.poll() == 0 and tail.count == 0 and len(tail.frame()) == 0)
+
+        write(path, rows[:3])
+        check('3 rows appended', tail.poll() == 3 and dates(tail.since(0)) == row_dates(rows[:3]))
+
+        write(path, [rows[3], rows[4][:5]])
+        check('half-written line is left for later', tail.poll() == 1 and tail.count == 4)
+
+        write(path, [rows[4][5:], rows[5]])
+        check('completed line and one more', tail.poll() == 2 and tail.count == 6)
+        check('since(4) holds these 2 rows', dates(tail.since(4)) == row_dates(rows[4:6]))
+        check('frame() holds all 6 rows', dates(tail.frame()) == row_dates(rows[:6]))
+
+        generation = tail.generation
+        write(path, [header, rows[10]], 'w')
+        polled = tail.poll()
+        check('rewritten shorter: new generation', tail.generation == generation + 1 and polled == 1 and
+              dates(tail.frame()) == row_dates(rows[10:11]))
+
+        folder = os.path.join(scratch, 'folder')
+        os.makedirs(folder)
+        tail = CsvTail(folder, index_col=[0])
+        check('empty folder: no rows', tail.poll() == 0 and len(tail.frame()) == 0)
+        write(os.path.join(folder, 'a.csv'), [header] + rows[:2])
+        write(os.path.join(folder, 'b.csv'), [header] + rows[2:5])
+        check('two files: rows in name order', tail.poll() == 5 and dates(tail.since(0)) == row_dates(rows[:5]))
+        write(os.path.join(folder, 'b.csv'), rows[5:7])
+        write(os.path.join(folder, 'c.csv'), [header] + rows[7:8])
+        check('appended rows and a new file', tail.poll() == 3 and dates(tail.since(5)) == row_dates(rows[5:8]))
+
+        print('dvc_ex3 live session')
+        ex3 = dashboard_module('ex3')
+        for label, start in (('empty folder', None), ('header-only file', [header])):
+            live = os.path.join(scratch, label.replace(' ', '-'))
+            os.makedirs(live)
+            target = live
+            if start is not None:
+                target = os.path.join(live, 'tests.csv')
+                write(target, start, 'w')
+            tail = CsvTail(target, index_col=[0])
+            tail.poll()
+            poll, source = live_session(ex3, tail)
+            check('%s: session starts empty' % label, len(source.data['x']) == 0)
+            if start is None:
+                write(os.path.join(live, 'tests.csv'), [header] + rows[:40])
+            else:
+                write(target, rows[:40])
+            poll()
+            check('%s: first rows shown after poll' % label, len(source.data['x']) > 0 and
+                  pd.Timestamp(source.data['x'][0]) == pd.Timestamp(rows[0].split(',')[1]))
+
+        print('poll vs read_csv, %d rows + %d appended' % (len(rows) - args.append, args.append))
+        write(path, [header] + rows[:-args.append], 'w')
+        tail = CsvTail(path, index_col=[0])
+        tail.poll()
+        write(path, rows[-args.append:])
+        start = time.perf_counter()
+        polled = tail.poll()
+        seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        full = pd.read_csv(path, index_col=[0])
+        read = time.perf_counter() - start
+        check('poll %.2f ms, read_csv %.2f ms' % (1000 * seconds, 1000 * read),
+              polled == args.append and len(tail.frame()) == len(full))
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,290 @@
+import itertools
+import os
+import shutil
+import string
+import tempfile
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+# ====================================================================
+# Synthetic inputs with the schemas of the real Swiss data sets
+#
+#   demographics.csv                                 (ex4)
+#   demographics_switzerland_bag.csv                 (ex1)
+#   covid19_cases_switzerland_openzh-phase2.csv      (ex2, ex4)
+#   covid_19_cases_switzerland_standard_format.csv   (ex4)
+#   covid19_tests_switzerland_bag.csv                (ex3)
+#   gadm36_CHE_1.shp (+ .shx/.dbf/.prj/.cpg)         (ex4)
+#   gadm36_CHE_3.shp                                 (ex4 municipality level)
+#
+# Scale 1 matches the real inputs: 26 regions, 280 days and about 1800
+# outline vertices per region, with 81 municipalities of about 200
+# vertices per region. A scale of s multiplies regions and days by
+# sqrt(s), so every dates x regions table grows by s, and the vertices
+# per region by s ** 0.25.
+# Region codes stay two characters wide (the dashboards derive them
+# from the last two characters of HASC_1).
+#
+#   with map_data(paths, 'municipality') as data:   ex4 MapData, cold caches
+#   with scratch_caches():                           cold caches only
+#
+# The download, table and outline caches point to a temporary folder
+# inside these blocks, so every run parses and simplifies from scratch.
+# ====================================================================
+
+CANTONS = ['AG', 'AI', 'AR', 'BE', 'BL', 'BS', 'FR', 'GE', 'GL', 'GR', 'JU', 'LU', 'NE',
+           'NW', 'OW', 'SG', 'SH', 'SO', 'SZ', 'TG', 'TI', 'UR', 'VD', 'VS', 'ZG', 'ZH']
+
+AGE_GROUPS = ['0 - 9', '10 - 19', '20 - 29', '30 - 39', '40 - 49', '50 - 59', '60 - 69', '70 - 79', '80+']
+
+# Bounding box of Switzerland, the synthetic regions tile it
+MIN_X, MIN_Y, MAX_X, MAX_Y = 5.96, 45.82, 10.49, 47.81
+
+
+def dimensions(scale):
+    return dict(regions=int(round(26 * scale ** 0.5)),
+                days=int(round(280 * scale ** 0.5)),
+                vertices=int(round(1800 * scale ** 0.25)),
+                municipality_vertices=int(round(200 * scale ** 0.25)))
+
+
+# Two character region codes, the real canton codes first
+def region_codes(n):
+    symbols = string.ascii_uppercase + string.digits
+    extra = (a + b for a, b in itertools.product(symbols, repeat=2) if a + b not in CANTONS and a + b != 'CH')
+    codes = CANTONS[:n] + list(itertools.islice(extra, max(0, n - len(CANTONS))))
+    if len(codes) < n:
+        raise ValueError('at most %d two character region codes' % (len(CANTONS) + 36 * 36 - 27))
+    return codes
+
+
+def demographics(codes, rng):
+    n = len(codes)
+    population = rng.integers(15000, 1500000, n)
+    area = rng.uniform(10, 500, n)
+    return pd.DataFrame({
+        'Canton': codes,
+        'Population': population,
+        'Density': population / rng.uniform(100, 7000, n),
+        'O65': population // 5,
+        'O65P': rng.uniform(0.15, 0.25, n),
+        'Beds': population // 200,
+        'BedsPerCapita': rng.uniform(0.002, 0.008, n),
+        'SettlementAreaHa': area * 100,
+        'SettlementAreaKm2': area,
+    })
+
+
+def demographics_bag(codes, rng):
+    rows = itertools.product(codes + ['CH'], AGE_GROUPS, ['Männlich', 'Weiblich'])
+    frame = pd.DataFrame(list(rows), columns=['canton', 'age_group', 'sex'])
+    frame['pop_size'] = rng.integers(1000, 80000, len(frame))
+    return frame
+
+
+def dates(days):
+    return pd.date_range('2020-02-25', periods=days, freq='D')
+
+
+# Cumulative cases with about 15% missing reports, plus the *_diff, *_pc and *_diff_pc columns
+def cases_openzh(codes, days, population, rng):
+    cum = np.cumsum(rng.poisson(20, (days, len(codes))), axis=0).astype(float)
+    cum[rng.random(cum.shape) < 0.15] = np.nan
+    total = np.nansum(cum, axis=1)
+    values = np.column_stack([cum, total])
+    names = codes + ['CH']
+    pop = np.append(population, population.sum()).astype(float)
+    diff = np.vstack([np.full((1, len(names)), np.nan), np.diff(values, axis=0)])
+    columns = {'Date': dates(days).strftime('%Y-%m-%d')}
+    columns.update({c: values[:, j] for j, c in enumerate(names)})
+    columns.update({c + '_diff': diff[:, j] for j, c in enumerate(names)})
+    columns.update({c + '_pc': values[:, j] / pop[j] for j, c in enumerate(names)})
+    columns.update({c + '_diff_pc': diff[:, j] / pop[j] for j, c in enumerate(names)})
+    return pd.DataFrame(columns)
+
+
+# One row per region and day, plus 'FL' like the real file
+def cases_standard(codes, days, rng):
+    names = codes + ['FL']
+    n = len(names)
+    lat = rng.uniform(MIN_Y, MAX_Y, n)
+    lon = rng.uniform(MIN_X, MAX_X, n)
+    day = np.repeat(dates(days).strftime('%Y-%m-%d'), n)
+    k = days * n
+    return pd.DataFrame({
+        'date': day,
+        'country': np.tile(['CH'] * len(codes) + ['FL'], days),
+        'abbreviation_canton': np.tile(names, days),
+        'lat': np.tile(lat, days),
+        'long': np.tile(lon, days),
+        'hospitalized_with_symptoms': rng.integers(0, 50, k),
+        'intensive_care': rng.integers(0, 10, k),
+        'total_hospitalized': rng.integers(0, 60, k),
+        'home_confinement': np.zeros(k, dtype=int),
+        'total_currently_positive_cases': np.zeros(k, dtype=int),
+        'new_positive_cases': rng.integers(0, 100, k),
+        'recovered': np.zeros(k, dtype=int),
+        'deaths': np.zeros(k, dtype=int),
+        'total_positive_cases': np.zeros(k, dtype=int),
+        'tests_performed': np.zeros(k, dtype=int),
+    })
+
+
+def tests_bag(days, rng):
+    positive = rng.integers(0, 3000, days)
+    negative = rng.integers(0, 30000, days)
+    tests = positive + negative
+    return pd.DataFrame({
+        'date': dates(days).strftime('%Y-%m-%d'),
+        'n_negative': negative,
+        'n_positive': positive,
+        'n_tests': tests,
+        'frac_positive': positive / np.maximum(tests, 1),
+    })
+
+
+# Points along the edge a -> b, displaced sideways by a smooth noise that vanishes at both ends.
+# The noise only depends on `seed`, so both regions sharing an edge get the same vertices.
+def _edge(a, b, count, amplitude, seed):
+    t = np.linspace(0, 1, count + 2)[1:-1]
+    rng = np.random.default_rng(seed)
+    waves = sum(rng.uniform(-1, 1) * np.sin(np.pi * k * t) / k for k in range(1, 6))
+    normal = np.array([a[1] - b[1], b[0] - a[0]])
+    return np.outer(1 - t, a) + np.outer(t, b) + np.outer(amplitude * waves, normal)
+
+
+# Grid cells tiling the bounding box, with wiggly shared borders (a valid polygon coverage),
+# returned row by row
+def _grid(cols, rows, vertices, seed):
+    from shapely.geometry import Polygon
+
+    xs = np.linspace(MIN_X, MAX_X, cols + 1)
+    ys = np.linspace(MIN_Y, MAX_Y, rows + 1)
+    per_edge = max(vertices // 4 - 1, 0)
+
+    def edge(p, q):
+        key = (p, q) if p <= q else (q, p)
+        pts = _edge(np.array(key[0], float), np.array(key[1], float), per_edge, 0.08,
+                    hash(key) % (2 ** 32) + seed)
+        return pts if key == (p, q) else pts[::-1]
+
+    cells = []
+    for r in range(rows):
+        for c in range(cols):
+            corners = [(xs[c], ys[r]), (xs[c + 1], ys[r]), (xs[c + 1], ys[r + 1]), (xs[c], ys[r + 1])]
+            ring = []
+            for i in range(4):
+                p, q = corners[i], corners[(i + 1) % 4]
+                ring.append(np.array([p]))
+                ring.append(edge(p, q))
+            cells.append(Polygon(np.vstack(ring)))
+    return cells
+
+
+def _layout(n):
+    cols = int(np.ceil(np.sqrt(n * (MAX_X - MIN_X) / (MAX_Y - MIN_Y))))
+    return cols, int(np.ceil(n / cols))
+
+
+# GADM level 1: one grid cell per region
+def regions(codes, vertices, seed=0):
+    import geopandas as gpd
+
+    n = len(codes)
+    cols, rows = _layout(n)
+    shapes = _grid(cols, rows, vertices, seed)[:n]
+    return gpd.GeoDataFrame({
+        'GID_0': 'CHE', 'NAME_0': 'Switzerland',
+        'GID_1': ['CHE.%d_1' % (k + 1) for k in range(n)],
+        'NAME_1': codes, 'HASC_1': ['CH.' + c for c in codes],
+    }, geometry=shapes, crs='EPSG:4326')
+
+
+# GADM level 3: every region cell split into side x side municipalities, linked to their region by GID_1
+def municipalities(codes, vertices, side=9, seed=0):
+    import geopandas as gpd
+
+    n = len(codes)
+    cols, rows = _layout(n)
+    cells = _grid(cols * side, rows * side, vertices, seed + 1)
+    shapes, gid_1, gid_3, names = [], [], [], []
+    for k, cell in enumerate(cells):
+        r, c = divmod(k, cols * side)
+        region = (r // side) * cols + c // side
+        if region >= n:
+            continue
+        shapes.append(cell)
+        gid_1.append('CHE.%d_1' % (region + 1))
+        gid_3.append('CHE.%d.1.%d_1' % (region + 1, len(shapes)))
+        names.append('%s-%d' % (codes[region], len(shapes)))
+    return gpd.GeoDataFrame({
+        'GID_0': 'CHE', 'NAME_0': 'Switzerland',
+        'GID_1': gid_1, 'NAME_1': [codes[int(g[4:-2]) - 1] for g in gid_1],
+        'GID_3': gid_3, 'NAME_3': names,
+    }, geometry=shapes, crs='EPSG:4326')
+
+
+# Write all inputs for `scale` into out_dir (skipped if they are already there), returns their paths
+def generate(scale, out_dir, seed=0):
+    dims = dimensions(scale)
+    os.makedirs(out_dir, exist_ok=True)
+    paths = dict(
+        demo=os.path.join(out_dir, 'demographics.csv'),
+        demo_bag=os.path.join(out_dir, 'demographics_switzerland_bag.csv'),
+        cases=os.path.join(out_dir, 'covid19_cases_switzerland_openzh-phase2.csv'),
+        standard=os.path.join(out_dir, 'covid_19_cases_switzerland_standard_format.csv'),
+        tests=os.path.join(out_dir, 'covid19_tests_switzerland_bag.csv'),
+        shape=os.path.join(out_dir, 'gadm36_CHE_1.shp'),
+        municipality=os.path.join(out_dir, 'gadm36_CHE_3.shp'),
+    )
+    if all(os.path.exists(p) for p in paths.values()):
+        return paths
+
+    rng = np.random.default_rng(seed)
+    codes = region_codes(dims['regions'])
+    demo = demographics(codes, rng)
+    demo.to_csv(paths['demo'], index=False)
+    demographics_bag(codes, rng).to_csv(paths['demo_bag'], index=False)
+    cases_openzh(codes, dims['days'], demo.Population.values, rng).to_csv(paths['cases'], index=False)
+    cases_standard(codes, dims['days'], rng).to_csv(paths['standard'], index=False)
+    tests_bag(dims['days'], rng).to_csv(paths['tests'])
+    regions(codes, dims['vertices'], seed).to_file(paths['shape'])
+    municipalities(codes, dims['municipality_vertices'], seed=seed).to_file(paths['municipality'])
+    return paths
+
+
+# Point the fetch, table and ex4 outline caches at a temporary folder, removed afterwards
+@contextmanager
+def scratch_caches():
+    # imported here, so the benchmarks that do not need them do not import dvc_common or ex4_data
+    from dvc_common import fetch, loaders
+    import ex4_data
+
+    saved = fetch.cache_dir, loaders.table_dir, ex4_data.cache_dir
+    scratch = tempfile.mkdtemp(prefix='dvc-bench-')
+    fetch.cache_dir = os.path.join(scratch, 'http')
+    loaders.table_dir = os.path.join(scratch, 'tables')
+    ex4_data.cache_dir = os.path.join(scratch, 'lod')
+    try:
+        yield scratch
+    finally:
+        fetch.cache_dir, loaders.table_dir, ex4_data.cache_dir = saved
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+# load_inputs + prepare of ex4 for one map level on the files of generate()
+def load_map(paths, level='canton'):
+    import ex4_data
+
+    region_dir = paths['municipality'] if level == 'municipality' else None
+    inputs = ex4_data.load_inputs(paths['demo'], paths['standard'], paths['cases'], paths['shape'], region_dir)
+    return ex4_data.prepare(*inputs, shape_dir=region_dir or paths['shape'], level=level)
+
+
+# The ex4 MapData of one level, prepared with cold caches
+@contextmanager
+def map_data(paths, level='canton'):
+    with scratch_caches():
+        yield load_map(paths, level)
@@ -0,0 +1,13 @@
+# Shared data loading helpers for the DVC 2020 exercise dashboards.
+#
+# The exercise scripts live in their own folders and are run from there
+# (python dvc_ex2.py, bokeh serve --show ex4_play.py), so each of them puts
+# the repository root on sys.path before importing this package.
+#
+# python -m dvc_common.batch site.json renders all dashboards to static
+# HTML files without a bokeh server (see batch.py).
+#
+# python -m dvc_common <ex1..ex4|batch|export|timing> runs any of them
+# from the repository root and only imports what that command needs;
+# --importtime before the command prints an import time breakdown
+# (see __main__.py).
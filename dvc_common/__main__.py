@@ -0,0 +1,101 @@
+import os
+import runpy
+import subprocess
+import sys
+from collections import Counter
+
+# ====================================================================
+# Single entry point for the dashboards and tools
+#
+#   python -m dvc_common ex2 [--incremental]      run a dashboard script
+#   python -m dvc_common ex4 --municipality
+#   python -m dvc_common batch site.json --bundle  (batch.py)
+#   python -m dvc_common export FILE...            (export.py)
+#   python -m dvc_common timing FILE.jsonl         (timing.py)
+#   python -m dvc_common --importtime ex1          import time breakdown
+#
+# Nothing heavy is imported before the command is known: a dashboard
+# only loads its own script and what that imports, the tools do not
+# load pandas, bokeh or geopandas unless they render or read data.
+#
+# --importtime runs the command again under python -X importtime and
+# prints the import time of the process by top-level package (self
+# time) and the slowest imports (cumulative), after the command output.
+# ====================================================================
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TOOLS = {'batch': 'dvc_common.batch', 'export': 'dvc_common.export', 'timing': 'dvc_common.timing'}
+
+USAGE = 'usage: python -m dvc_common [--importtime] {ex1,ex2,ex3,ex4,%s} [args...]' % ','.join(TOOLS)
+
+
+def run_command(command, args):
+    if command in TOOLS:
+        sys.argv = [command] + args
+        runpy.run_module(TOOLS[command], run_name='__main__', alter_sys=True)
+        return
+    from dvc_common.batch import DASHBOARDS
+
+    if command not in DASHBOARDS:
+        sys.exit(USAGE)
+    dashboard = DASHBOARDS[command]
+    folder = os.path.join(repo_dir, dashboard.folder)
+    path = os.path.join(folder, dashboard.module + '.py')
+    # like python <script>: the script's folder comes first on sys.path
+    sys.path.insert(0, folder)
+    sys.argv = [path] + args
+    runpy.run_path(path, run_name='__main__')
+
+
+# Parse the -X importtime lines of stderr into (self us, cumulative us, module) and pass on all other lines
+def parse_importtime(lines, out):
+    imports = []
+    for line in lines:
+        if not line.startswith('import time:'):
+            out.write(line)
+            continue
+        fields = line[len('import time:'):].split('|')
+        if fields[0].strip().isdigit():
+            imports.append((int(fields[0]), int(fields[1]), fields[2].strip()))
+    return imports
+
+
+def report_importtime(imports, out, top=15):
+    total = sum(s for s, _, _ in imports)
+    # e.g. the command failed before python printed any import times
+    if not total:
+        out.write('no import times recorded\n')
+        return
+    packages = Counter()
+    for self_us, _, module in imports:
+        packages[module.split('.')[0]] += self_us
+    out.write('import time %.1f ms in %d modules (self time by top-level package)\n' % (total / 1000, len(imports)))
+    for package, us in packages.most_common(top):
+        out.write('  %-36s %8.1f ms %5.1f%%\n' % (package, us / 1000, 100 * us / total))
+    out.write('slowest imports (cumulative)\n')
+    for _, cumulative, module in sorted(imports, key=lambda i: -i[1])[:top]:
+        out.write('  %-36s %8.1f ms\n' % (module, cumulative / 1000))
+
+
+def importtime(command, args):
+    proc = subprocess.Popen([sys.executable, '-X', 'importtime', '-m', 'dvc_common', command] + args,
+                            stderr=subprocess.PIPE, universal_newlines=True)
+    imports = parse_importtime(proc.stderr, sys.stderr)
+    code = proc.wait()
+    report_importtime(imports, sys.stderr)
+    return code
+
+
+def main(argv):
+    if argv[:1] == ['--importtime']:
+        if len(argv) < 2:
+            sys.exit(USAGE)
+        sys.exit(importtime(argv[1], argv[2:]))
+    if not argv or argv[0] in ('-h', '--help'):
+        sys.exit(USAGE)
+    run_command(argv[0], argv[1:])
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
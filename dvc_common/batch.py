@@ -0,0 +1,244 @@
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import namedtuple
+
+from dvc_common.export import COMPRESSIONS, page_html, write_bundle, write_output
+from dvc_common.fetch import MissingInput
+from dvc_common.timing import stage
+
+# ====================================================================
+# Headless batch rendering of the dashboards
+#
+#   python -m dvc_common.batch site.json [--workers 4] [--output-dir site]
+#
+# The config lists jobs, each rendering one dashboard into standalone
+# HTML files (CDN resources, no bokeh server):
+#
+#   {"output_dir": "site",
+#    "jobs": [
+#      {"dashboard": "ex1", "output": "population.html"},
+#      {"dashboard": "ex4", "output": "map/{date}.html",
+#       "dates": {"start": "2020-03-01", "freq": "W-SUN"}},
+#      {"dashboard": "ex4", "data": {"level": "municipality"},
+#       "output": "municipalities.html"}]}
+#
+#   dashboard  ex1 .. ex4 (DASHBOARDS below)
+#   output     file name below output_dir; {date} is the snapshot date
+#   data       keyword arguments of the dashboard's load function
+#   options    keyword arguments of its build function
+#   dates      one file per date of pd.date_range(start, end, freq=freq);
+#              start and end default to the first and last date of the data
+#   title      page title (default: the dashboard name)
+#
+# A job whose optional input is missing (MissingInput, e.g. the
+# municipality shape file) is skipped with a warning, and the run exits
+# with status 1. Any other error stops the run.
+#
+# By default every page is self-contained and loads BokehJS from the
+# CDN. With --bundle (or "bundle": true) the pages share one BokehJS
+# file below output_dir/static instead and work without CDN access;
+# --compress gz br (or "compress": ["gz", "br"]) also writes
+# precompressed variants of every file (see export.py).
+#
+# Every distinct (dashboard, data) input is loaded once in the parent
+# process and handed to the worker pool through its initializer. With
+# the default fork start method on Linux the workers share those pages
+# copy-on-write instead of reading and preprocessing the inputs again.
+# Every file is written through a temporary file and os.replace, so a
+# web server or a concurrent run never sees a half-written page.
+# ====================================================================
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# pandas (like bokeh) is only imported once data is loaded or pages are rendered,
+# so python -m dvc_common (see __main__.py) can use this table without loading them
+def _index_dates(frame):
+    import pandas as pd
+    return pd.to_datetime(frame.index)
+
+
+def _column_dates(frame):
+    import pandas as pd
+    return pd.to_datetime(frame.date)
+
+
+# folder and module of every dashboard, the names of its load and build functions,
+# the build keyword that receives the snapshot date, and the load result -> dates function.
+# For ex1-ex3 these are load_data() and build_plot() of the exercise scripts.
+Dashboard = namedtuple('Dashboard', ['folder', 'module', 'load', 'build', 'date_arg', 'dates'])
+
+DASHBOARDS = {
+    'ex1': Dashboard('DVC_2020_Exercise1', 'dvc_ex1_15915085', 'load_data', 'build_plot', None, None),
+    'ex2': Dashboard('DVC_2020_Exercise2', 'dvc_ex2', 'load_data', 'build_plot', 'end', _index_dates),
+    'ex3': Dashboard('DVC_2020_Exercise3', 'dvc_ex3', 'load_data', 'build_plot', 'end', _column_dates),
+    'ex4': Dashboard('DVC_2020_Exercise4', 'ex4_play', 'ex4_data.preprocess', 'build_document', 'date',
+                     lambda data: data.dates),
+}
+
+# ex4 has no server in a static file: browser-side slider, Play button and color switch
+DEFAULT_OPTIONS = {'ex4': dict(client_side=True, standalone=True)}
+
+Task = namedtuple('Task', ['dashboard', 'key', 'output', 'title', 'options'])
+
+
+# Import the module of a dashboard from its exercise folder
+def dashboard_module(name, module=None):
+    dashboard = DASHBOARDS[name]
+    folder = os.path.join(repo_dir, dashboard.folder)
+    if folder not in sys.path:
+        sys.path.insert(0, folder)
+    return importlib.import_module(module or dashboard.module)
+
+
+# The load or build function of a dashboard, 'module.function' names another module of its folder
+def dashboard_function(name, function):
+    module, _, function = function.rpartition('.')
+    return getattr(dashboard_module(name, module or None), function)
+
+
+def data_key(job):
+    return job['dashboard'], json.dumps(job.get('data', {}), sort_keys=True)
+
+
+# The input of every job and the jobs skipped for a MissingInput
+def load_datasets(jobs):
+    datasets, missing, skipped = {}, {}, []
+    for job in jobs:
+        key = data_key(job)
+        if key not in datasets and key not in missing:
+            name, kwargs = job['dashboard'], job.get('data', {})
+            try:
+                with stage('batch.load', dashboard=name, **kwargs):
+                    datasets[key] = dashboard_function(name, DASHBOARDS[name].load)(**kwargs)
+            except MissingInput as e:
+                missing[key] = e
+        if key in missing:
+            skipped.append(job)
+            print('warning: skipping %s %s: %s' % (job['dashboard'], job.get('output'), missing[key]),
+                  file=sys.stderr)
+    return datasets, skipped
+
+
+# One task per output file of every job
+def expand(jobs, datasets):
+    import pandas as pd
+
+    tasks = []
+    for job in jobs:
+        name = job['dashboard']
+        dashboard = DASHBOARDS[name]
+        options = dict(DEFAULT_OPTIONS.get(name, {}), **job.get('options', {}))
+        title = job.get('title', name)
+        key = data_key(job)
+        if 'dates' not in job:
+            tasks.append(Task(name, key, job['output'], title, options))
+            continue
+        if dashboard.date_arg is None:
+            raise ValueError('%s has no date to render snapshots for' % name)
+        available = dashboard.dates(datasets[key])
+        spec = job['dates']
+        days = pd.date_range(spec.get('start', available.min()), spec.get('end', available.max()),
+                             freq=spec.get('freq', 'D'))
+        for day in days:
+            tasks.append(Task(name, key, job['output'].format(date=day.strftime('%Y-%m-%d')),
+                              title + ' ' + day.strftime('%Y-%m-%d'),
+                              dict(options, **{dashboard.date_arg: day})))
+    return tasks
+
+
+# Datasets of the current worker process, set by _init
+_datasets = {}
+
+
+def _init(datasets):
+    _datasets.update(datasets)
+
+
+# Build and write one page, return its name, seconds and sizes by compression ('' is the plain file)
+def render(task, output_dir, bundle=None, encodings=()):
+    from bokeh.embed import file_html
+    from bokeh.resources import CDN
+
+    start = time.perf_counter()
+    path = os.path.abspath(os.path.join(output_dir, task.output))
+    build = dashboard_function(task.dashboard, DASHBOARDS[task.dashboard].build)
+    root = build(_datasets[task.key], **task.options)
+    html = page_html(root, task.title, path, bundle) if bundle else file_html(root, CDN, task.title)
+    sizes = write_output(path, html.encode('utf-8'), encodings)
+    return task.output, time.perf_counter() - start, sizes
+
+
+def _render(args):
+    return render(*args)
+
+
+def run(config, output_dir=None, workers=None, bundle=None, encodings=None):
+    jobs = config['jobs']
+    unknown = sorted({job['dashboard'] for job in jobs} - set(DASHBOARDS))
+    if unknown:
+        raise ValueError('unknown dashboards: %s' % ', '.join(unknown))
+    output_dir = output_dir or config.get('output_dir', 'site')
+    bundle = config.get('bundle', False) if bundle is None else bundle
+    encodings = tuple(config.get('compress', ()) if encodings is None else encodings)
+
+    bundle_path = None
+    if bundle:
+        bundle_path, bundle_sizes = write_bundle(output_dir, encodings)
+        print('%-48s %s' % (os.path.relpath(bundle_path, output_dir), _sizes(bundle_sizes)), file=sys.stderr)
+
+    datasets, skipped = load_datasets(jobs)
+    tasks = expand([job for job in jobs if data_key(job) in datasets], datasets)
+    workers = max(min(workers or os.cpu_count() or 1, len(tasks)), 1)
+    print('%d files from %d inputs on %d workers' % (len(tasks), len(datasets), workers), file=sys.stderr)
+
+    start = time.perf_counter()
+    results = []
+
+    def progress(rendered):
+        for result in rendered:
+            results.append(result)
+            print('%-48s %s %8.0f ms' % (result[0], _sizes(result[2]), 1000 * result[1]), file=sys.stderr)
+
+    with stage('batch.render', files=len(tasks), workers=workers):
+        if workers <= 1:
+            _init(datasets)
+            progress(render(task, output_dir, bundle_path, encodings) for task in tasks)
+        else:
+            with multiprocessing.Pool(workers, initializer=_init, initargs=(datasets,)) as pool:
+                progress(pool.imap_unordered(_render, [(task, output_dir, bundle_path, encodings) for task in tasks]))
+
+    # what a visitor downloads for all pages (the bundle once), per compression
+    totals = {e: sum(r[2][e] for r in results) + (bundle_sizes[e] if bundle else 0) for e in ('',) + encodings}
+    print('%d files in %.1f s, all pages %s' % (len(results), time.perf_counter() - start, _sizes(totals)),
+          file=sys.stderr)
+    if skipped:
+        print('%d of %d jobs skipped' % (len(skipped), len(jobs)), file=sys.stderr)
+    return results, skipped
+
+
+def _sizes(sizes):
+    return '  '.join('%s %9.1f KiB' % (e or 'raw', n / 1024) for e, n in sizes.items())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Render the dashboards to standalone HTML files')
+    parser.add_argument('config', help='JSON file with the jobs to render')
+    parser.add_argument('--workers', type=int, help='worker processes (default: one per CPU)')
+    parser.add_argument('--output-dir', help='overrides output_dir of the config')
+    parser.add_argument('--bundle', action='store_true', default=None,
+                        help='share one local BokehJS file instead of loading it from the CDN')
+    parser.add_argument('--compress', nargs='+', choices=COMPRESSIONS, help='also write .gz/.br variants')
+    args = parser.parse_args(argv)
+
+    with open(args.config) as f:
+        config = json.load(f)
+    _, skipped = run(config, args.output_dir, args.workers, args.bundle, args.compress)
+    return 1 if skipped else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,85 @@
+import time
+
+# ====================================================================
+# Coalescing of rapid widget events (e.g. a dragged slider)
+#
+#   latest = Coalescer(update, document_scheduler(slider), interval=0.05)
+#   slider.on_change('value', lambda attr, old, new: latest.submit(new))
+#
+# submit() only stores the value. update(value) runs at most once per
+# `interval` seconds and always with the newest value submitted so far;
+# values that are replaced before then are dropped without any work.
+# The first value after a quiet period runs on the next tick and later
+# ones wait for the rest of the interval, so a drag costs about
+# 1/interval updates per second however many events the browser sends,
+# and every value is shown (or replaced) at most `interval` seconds
+# after it arrived, plus the time of the update itself.
+#
+# With interval=0 every value runs on the next tick, so events that
+# arrive together become one update. A zoom or pan sends start and end
+# of a range (and of both axes on a map) as separate events; submitting
+# all of them to one Coalescer updates once, with every new bound in
+# place, instead of once per half-updated range:
+#
+#   bounds = Coalescer(update, document_scheduler(plot), interval=0)
+#   plot.x_range.on_change('start', lambda attr, old, new: bounds.submit(None))
+#   plot.x_range.on_change('end', lambda attr, old, new: bounds.submit(None))
+#
+# cancel() drops a pending value, e.g. when a full update for the final
+# value runs anyway. The counters (submitted, applied, max_delay) show
+# how much work was saved and how stale the shown value got.
+# ====================================================================
+
+
+# schedule(callback, seconds) on the bokeh document of `model`, which is only known once the model is in one
+def document_scheduler(model):
+    def schedule(callback, seconds):
+        if seconds <= 0:
+            model.document.add_next_tick_callback(callback)
+        else:
+            model.document.add_timeout_callback(callback, 1000 * seconds)
+    return schedule
+
+
+class Coalescer:
+
+    def __init__(self, fn, schedule, interval=0.05, clock=time.monotonic):
+        self.fn = fn
+        self.schedule = schedule
+        self.interval = interval
+        self.clock = clock
+        self.pending = None
+        self.has_pending = False
+        self.scheduled = False
+        self.last_run = None
+        self.since = None
+        self.submitted = 0
+        self.applied = 0
+        self.max_delay = 0.0
+
+    def submit(self, value):
+        self.submitted += 1
+        if not self.has_pending:
+            # arrival of the oldest value that is not shown yet
+            self.since = self.clock()
+        self.pending, self.has_pending = value, True
+        if self.scheduled:
+            return
+        wait = 0 if self.last_run is None else self.last_run + self.interval - self.clock()
+        self.scheduled = True
+        self.schedule(self._run, max(wait, 0))
+
+    def cancel(self):
+        self.pending, self.has_pending = None, False
+
+    def _run(self):
+        self.scheduled = False
+        if not self.has_pending:
+            return
+        value = self.pending
+        self.cancel()
+        now = self.clock()
+        self.max_delay = max(self.max_delay, now - self.since)
+        self.last_run = now
+        self.applied += 1
+        self.fn(value)
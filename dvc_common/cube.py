@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+
+# ====================================================================
+# Dense cube of a value over categorical dimensions
+#
+#   cube = CategoricalCube.from_frame(df, ['canton', 'age_group', 'sex'], 'pop_size')
+#   cube.sum('canton')                        national totals per age group and sex
+#   cube.select(canton='ZH')                  one canton
+#   cube.select(age_group=['70 - 79', '80+']) some age bands
+#   factors, stacks = cube.stack_columns('sex')
+#
+# The frame is aggregated once, with np.add.at over the category codes.
+# Every slice after that is NumPy indexing and summing. Labels keep the
+# order of their first appearance, and every value is addressed by its
+# labels rather than by row position. Label combinations missing from
+# the frame are 0, rows with a missing label are left out.
+# ====================================================================
+
+
+class CategoricalCube:
+
+    def __init__(self, values, dims, levels):
+        self.values = values
+        self.dims = list(dims)
+        self.levels = {d: list(levels[d]) for d in self.dims}
+
+    @classmethod
+    def from_frame(cls, frame, dims, value):
+        codes, levels = [], {}
+        for d in dims:
+            cat = pd.Categorical(frame[d], categories=pd.unique(frame[d].dropna()))
+            codes.append(cat.codes)
+            levels[d] = list(cat.categories)
+        shape = tuple(len(levels[d]) for d in dims)
+        data = frame[value].to_numpy()
+        # rows with a missing label have code -1, which would index the last category: leave them out
+        labelled = np.logical_and.reduce([c >= 0 for c in codes])
+        values = np.zeros(shape, dtype=data.dtype)
+        np.add.at(values, tuple(c[labelled] for c in codes), data[labelled])
+        return cls(values, dims, levels)
+
+    def _axis(self, dim):
+        return self.dims.index(dim)
+
+    # Sub-cube for the given labels. A single label removes its dimension, a list keeps it in that order.
+    def select(self, **labels):
+        index, dims, levels = [], [], {}
+        for d in self.dims:
+            if d not in labels:
+                index.append(slice(None))
+                dims.append(d)
+                levels[d] = self.levels[d]
+                continue
+            positions = {label: i for i, label in enumerate(self.levels[d])}
+            if isinstance(labels[d], (list, tuple, np.ndarray, pd.Index)):
+                index.append([positions[label] for label in labels[d]])
+                dims.append(d)
+                levels[d] = list(labels[d])
+            else:
+                index.append(positions[labels[d]])
+        # index the axes one at a time, so several label lists do not broadcast against each other
+        values = self.values
+        axis = 0
+        for i in index:
+            if isinstance(i, int):
+                values = np.take(values, i, axis=axis)
+            else:
+                values = values[(slice(None),) * axis + (i,)]
+                axis += 1
+        return CategoricalCube(values, dims, levels)
+
+    # Sub-cube without the given labels of dim
+    def exclude(self, dim, labels):
+        return self.select(**{dim: [label for label in self.levels[dim] if label not in labels]})
+
+    # Sum over the given dimensions
+    def sum(self, *dims):
+        keep = [d for d in self.dims if d not in dims]
+        values = self.values.sum(axis=tuple(self._axis(d) for d in dims))
+        return CategoricalCube(values, keep, self.levels)
+
+    # vbar_stack inputs: the factors over all other dimensions (tuples if there are several),
+    # and one flat column per label of stack_dim, aligned with the factors
+    def stack_columns(self, stack_dim):
+        other = [d for d in self.dims if d != stack_dim]
+        values = np.moveaxis(self.values, self._axis(stack_dim), -1)
+        values = values.reshape(-1, values.shape[-1])
+        if len(other) == 1:
+            factors = list(self.levels[other[0]])
+        else:
+            factors = list(pd.MultiIndex.from_product([self.levels[d] for d in other]))
+        return factors, {label: values[:, k] for k, label in enumerate(self.levels[stack_dim])}
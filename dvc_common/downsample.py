@@ -0,0 +1,67 @@
+import numpy as np
+
+# ====================================================================
+# Downsampling of several series that share one x axis
+# ====================================================================
+
+
+# Bokeh datetime range values arrive as milliseconds since the epoch from the browser
+# and as datetimes when they were set in Python
+def as_datetime64(value):
+    if isinstance(value, (int, float, np.number)):
+        return np.datetime64(int(value), 'ms')
+    return np.datetime64(value)
+
+
+# Rows lo:hi of the sorted datetime64 array x between start and end, plus `margin` times
+# the window length on each side (so short pans need no new query). Binary search, O(log n).
+def window_rows(x, start, end, margin=0.5):
+    start, end = as_datetime64(start), as_datetime64(end)
+    pad = (end - start) * margin if margin else 0
+    lo = int(np.searchsorted(x, start - pad, side='left'))
+    hi = int(np.searchsorted(x, end + pad, side='right'))
+    return lo, hi
+
+
+# Min/max envelope of the rows lo:hi of x and every column in `columns`.
+# The window is cut into at most `buckets` buckets of equal length; each bucket contributes
+# two points per series, its minimum and maximum in the order they occur, placed at the
+# first and the last x of the bucket. All series keep sharing the returned x, and the
+# result has about 2 * buckets rows however long the window is.
+# Windows with at most 2 * buckets rows are returned unchanged.
+def minmax_envelope(x, columns, buckets, lo=0, hi=None):
+    hi = len(x) if hi is None else hi
+    lo, hi = max(lo, 0), min(hi, len(x))
+    n = hi - lo
+    if n <= 2 * buckets:
+        return x[lo:hi], {k: np.asarray(v)[lo:hi] for k, v in columns.items()}
+
+    size = -(-n // buckets)
+    count = -(-n // size)
+    pad = count * size - n
+
+    # bucket edges in x: first and last row of each bucket
+    first = lo + np.arange(count) * size
+    last = np.minimum(first + size - 1, hi - 1)
+    xs = np.empty(2 * count, dtype=x.dtype)
+    xs[0::2] = x[first]
+    xs[1::2] = x[last]
+
+    rows = np.arange(count)
+    out = {}
+    for k, v in columns.items():
+        v = np.asarray(v)[lo:hi]
+        # integer columns (e.g. counts) become float64, the padding of the last bucket is NaN
+        if not np.issubdtype(v.dtype, np.floating):
+            v = v.astype(np.float64)
+        block = np.concatenate([v, np.full(pad, np.nan, dtype=v.dtype)]).reshape(count, size)
+        missing = np.isnan(block)
+        imin = np.where(missing, np.inf, block).argmin(axis=1)
+        imax = np.where(missing, -np.inf, block).argmax(axis=1)
+        vmin, vmax = block[rows, imin], block[rows, imax]
+        early = imin <= imax
+        ys = np.empty(2 * count, dtype=v.dtype)
+        ys[0::2] = np.where(early, vmin, vmax)
+        ys[1::2] = np.where(early, vmax, vmin)
+        out[k] = ys
+    return xs, out
@@ -0,0 +1,97 @@
+import gzip
+import hashlib
+import os
+import sys
+
+try:
+    import brotli
+except ImportError:  # optional, without it only .gz variants are written
+    brotli = None
+
+from dvc_common.fetch import write_atomic
+
+# ====================================================================
+# Shared BokehJS bundle and precompressed outputs
+#
+# A standalone page carries BokehJS itself (inline, about 1.2 MB) or
+# loads it from cdn.bokeh.org. In bundle mode every page only holds its
+# document JSON and loads one shared script,
+#   <output_dir>/static/bokeh-<version>-<hash>.min.js
+# which is copied from the installed bokeh package (no CDN access is
+# needed). The content hash in the name lets a web server cache it
+# forever, so a visitor downloads it once for all dashboards.
+#
+# Every file can also be written as .gz (and .br with the brotli
+# package), e.g. for nginx gzip_static / brotli_static.
+#
+#   python -m dvc_common.batch site.json --bundle --compress gz br
+#   python -m dvc_common.export dvc_ex2.html ...   precompress existing files
+# ====================================================================
+
+# Everything the dashboards use (ex4 widgets and WebGL circles); tables and MathJax are left out
+BUNDLE_COMPONENTS = ['bokeh', 'bokeh-gl', 'bokeh-widgets']
+
+COMPRESSIONS = ('gz', 'br')
+
+
+def compress(data, encoding):
+    if encoding == 'gz':
+        # mtime=0 keeps the output identical between runs
+        return gzip.compress(data, 9, mtime=0)
+    if encoding == 'br':
+        if brotli is None:
+            raise ImportError('.br output needs the brotli package (pip install brotli)')
+        return brotli.compress(data, quality=11)
+    raise ValueError('unknown compression %r' % encoding)
+
+
+# Write data and its compressed variants atomically, return the sizes by suffix ('' is the plain file)
+def write_output(path, data, encodings=()):
+    write_atomic(path, data)
+    sizes = {'': len(data)}
+    for encoding in encodings:
+        packed = compress(data, encoding)
+        write_atomic(path + '.' + encoding, packed)
+        sizes[encoding] = len(packed)
+    return sizes
+
+
+# Write the shared BokehJS bundle below output_dir, return its path and sizes
+def write_bundle(output_dir, encodings=(), components=BUNDLE_COMPONENTS):
+    import bokeh
+    from bokeh.resources import Resources
+
+    resources = Resources(mode='inline', components=list(components))
+    data = '\n'.join(resources.js_raw).encode('utf-8')
+    name = 'bokeh-%s-%s.min.js' % (bokeh.__version__, hashlib.sha256(data).hexdigest()[:12])
+    path = os.path.join(os.path.abspath(output_dir), 'static', name)
+    # the name changes with the content, so an existing file is up to date
+    if os.path.exists(path) and all(os.path.exists(path + '.' + e) for e in encodings):
+        return path, dict({'': len(data)}, **{e: os.path.getsize(path + '.' + e) for e in encodings})
+    return path, write_output(path, data, encodings)
+
+
+# Page template: bokeh's file.html with the bundle script in place of the inline/CDN resources
+PAGE = """{% extends "file.html" %}
+{% block js_resources %}
+    <script type="text/javascript" src="{{ bundle_url }}"></script>
+{% endblock %}
+"""
+
+
+# HTML of root that loads the bundle at bundle_path, relative to the page at path
+def page_html(root, title, path, bundle_path):
+    from bokeh.core.templates import get_env
+    from bokeh.embed import file_html
+
+    bundle_url = os.path.relpath(bundle_path, os.path.dirname(os.path.abspath(path))).replace(os.sep, '/')
+    return file_html(root, None, title, template=get_env().from_string(PAGE),
+                     template_variables=dict(bundle_url=bundle_url))
+
+
+if __name__ == '__main__':
+    encodings = COMPRESSIONS if brotli is not None else ('gz',)
+    for path in sys.argv[1:]:
+        with open(path, 'rb') as f:
+            sizes = write_output(path, f.read(), encodings)
+        print('%-48s %s' % (path, '  '.join('%s %.1f KiB' % (e or 'raw', n / 1024) for e, n in sizes.items())))
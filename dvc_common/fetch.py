@@ -0,0 +1,220 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+# ====================================================================
+# On-disk cache for the upstream CSV files
+#
+# Downloads are stored content-addressed (objects/<sha256 of the body>)
+# and every URL has a small index entry with the content hash and the
+# ETag / Last-Modified headers, which are sent back as conditional
+# request headers to revalidate the cached copy.
+#
+# Environment variables:
+#   DVC_CACHE_DIR    cache location (default: <repo>/.cache/http)
+#   DVC_OFFLINE=1    only serve cached copies, never touch the network
+#   DVC_DATA_MIRROR  replaces UPSTREAM in URLs, e.g. a local stand-in server
+#   DVC_CACHE_MAX_AGE  seconds a cached copy is used without asking the
+#                    server again (default MAX_AGE, 0 revalidates every time)
+#
+# A copy that was downloaded or revalidated less than max_age seconds
+# ago is served without any request, so startup does not wait on the
+# network (or on the retries of an unreachable one) for files that were
+# checked recently. Older copies are revalidated with a conditional
+# request, which costs a round trip but no body when nothing changed.
+#
+# Every download attempt has a deadline (timeout seconds for connecting
+# and reading the whole body, not per socket read). Timeouts, connection
+# errors and 429/5xx responses are retried `retries` times with
+# exponential backoff before a cached copy is served or the error is
+# raised.
+#
+# run_concurrently() fetches and parses independent sources in a thread
+# pool: threads waiting on the network do not hold the GIL, so all
+# downloads run at the same time and a finished source is parsed while
+# the others are still downloading. Startup then takes about as long as
+# the slowest source instead of the sum of all of them.
+# ====================================================================
+
+UPSTREAM = 'https://raw.githubusercontent.com/daenuprobst/covid19-cases-switzerland/master/'
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+cache_dir = os.environ.get('DVC_CACHE_DIR', os.path.join(repo_dir, '.cache', 'http'))
+
+# Defaults of fetch(): seconds per attempt, retries after the first attempt, and the first backoff delay
+TIMEOUT = 30
+RETRIES = 2
+BACKOFF = 0.5
+
+# Seconds a cached copy counts as fresh (the upstream files change about once a day)
+MAX_AGE = 3600
+
+# HTTP status codes worth retrying
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+# An input that is not in the repo and cannot be downloaded (e.g. the municipality shape file),
+# the batch renderer skips the jobs that need it
+class MissingInput(FileNotFoundError):
+    pass
+
+
+def offline_mode():
+    return os.environ.get('DVC_OFFLINE', '') not in ('', '0')
+
+
+def max_age_default():
+    return float(os.environ.get('DVC_CACHE_MAX_AGE', MAX_AGE))
+
+
+# Point upstream URLs at DVC_DATA_MIRROR when it is set
+def resolve_url(url):
+    mirror = os.environ.get('DVC_DATA_MIRROR')
+    if mirror and url.startswith(UPSTREAM):
+        return mirror.rstrip('/') + '/' + url[len(UPSTREAM):]
+    return url
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _index_path(url, cache=None):
+    return os.path.join(cache or cache_dir, 'index', _sha256(url.encode('utf-8')) + '.json')
+
+
+def _object_path(digest, cache=None):
+    return os.path.join(cache or cache_dir, 'objects', digest[:2], digest)
+
+
+# Write via a temporary file in the same folder, so readers never see a partial file.
+# data is bytes, or a function writing to the binary file object it is given.
+def write_atomic(path, data):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            if callable(data):
+                data(f)
+            else:
+                f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+# Index entry of a cached URL, or None if the URL (or its object) is not cached
+def cache_entry(url, cache=None):
+    path = _index_path(url, cache)
+    try:
+        with open(path) as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not os.path.exists(_object_path(entry['sha256'], cache)):
+        return None
+    return entry
+
+
+# Body of one GET request, raises TimeoutError when it takes longer than timeout seconds in total
+def _download(request, timeout):
+    deadline = time.monotonic() + timeout
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        chunks = []
+        while True:
+            chunk = response.read(1 << 16)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            if time.monotonic() > deadline:
+                raise TimeoutError('%s took longer than %g s' % (request.full_url, timeout))
+        return b''.join(chunks), response.headers
+
+
+# Return the local path of a cached copy of url, downloading or revalidating it first
+# unless it was checked less than max_age seconds ago.
+# Non-URL paths are returned unchanged. With offline=True (or DVC_OFFLINE=1) only the
+# cache is used and a FileNotFoundError is raised for URLs that were never fetched.
+# If the server cannot be reached after all retries, a cached copy is served instead.
+def fetch(url, offline=None, timeout=None, cache=None, retries=None, max_age=None):
+    if not url.startswith(('http://', 'https://')):
+        return url
+    url = resolve_url(url)
+    if offline is None:
+        offline = offline_mode()
+    timeout = TIMEOUT if timeout is None else timeout
+    retries = RETRIES if retries is None else retries
+    max_age = max_age_default() if max_age is None else max_age
+    entry = cache_entry(url, cache)
+
+    if offline:
+        if entry is None:
+            raise FileNotFoundError('%s is not cached and offline mode is on' % url)
+        return _object_path(entry['sha256'], cache)
+
+    if entry is not None and time.time() - entry.get('checked', 0) < max_age:
+        return _object_path(entry['sha256'], cache)
+
+    request = urllib.request.Request(url)
+    if entry is not None:
+        if entry.get('etag'):
+            request.add_header('If-None-Match', entry['etag'])
+        if entry.get('last_modified'):
+            request.add_header('If-Modified-Since', entry['last_modified'])
+
+    for attempt in range(retries + 1):
+        try:
+            body, headers = _download(request, timeout)
+            break
+        except urllib.error.HTTPError as e:
+            if e.code == 304 and entry is not None:
+                entry['checked'] = time.time()
+                write_atomic(_index_path(url, cache), json.dumps(entry).encode('utf-8'))
+                return _object_path(entry['sha256'], cache)
+            if e.code not in RETRY_STATUS or attempt == retries:
+                if e.code in RETRY_STATUS and entry is not None:
+                    return _object_path(entry['sha256'], cache)
+                raise
+        except (urllib.error.URLError, OSError):
+            if attempt == retries:
+                if entry is None:
+                    raise
+                return _object_path(entry['sha256'], cache)
+        time.sleep(BACKOFF * 2 ** attempt)
+
+    digest = _sha256(body)
+    path = _object_path(digest, cache)
+    if not os.path.exists(path):
+        write_atomic(path, body)
+    entry = dict(url=url, sha256=digest, size=len(body),
+                 etag=headers.get('ETag'), last_modified=headers.get('Last-Modified'),
+                 checked=time.time())
+    write_atomic(_index_path(url, cache), json.dumps(entry).encode('utf-8'))
+    return path
+
+
+# pd.read_csv on the cached copy of url (pandas is imported here, so fetch() alone stays light)
+def read_csv(url, offline=None, timeout=None, retries=None, **kwargs):
+    import pandas as pd
+    return pd.read_csv(fetch(url, offline=offline, timeout=timeout, retries=retries), **kwargs)
+
+
+# Call every function of tasks ({name: fn}) in a thread pool of `workers` threads (default: one per task)
+# and return {name: result}. All tasks run to the end; then the first error in task order is raised.
+def run_concurrently(tasks, workers=None):
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=workers or len(tasks) or 1, thread_name_prefix='dvc-load') as pool:
+        futures = {name: pool.submit(fn) for name, fn in tasks.items()}
+    return {name: future.result() for name, future in futures.items()}
+
+
+# Remove the whole cache
+def clear_cache(cache=None):
+    shutil.rmtree(cache or cache_dir, ignore_errors=True)
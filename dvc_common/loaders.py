@@ -0,0 +1,99 @@
+import hashlib
+import os
+
+import pandas as pd
+
+from dvc_common.fetch import UPSTREAM, fetch, repo_dir, write_atomic
+
+# ====================================================================
+# Typed loaders for the shared input tables
+#
+# Parsed tables are cached as Feather files next to the HTTP cache, which
+# pyarrow reads back much faster than the CSV is parsed (into ordinary
+# numpy-backed frames). The cache key is the content hash of the
+# source file (plus SCHEMA_VERSION), so a new upstream file or a schema
+# change writes a new cache file. Without pyarrow the CSV is parsed every
+# time.
+#
+# load_distinct() reads only the requested columns of a long table, in
+# chunks that are deduplicated as they arrive, so only the distinct rows
+# (e.g. one location per canton) are ever held in memory.
+# ====================================================================
+
+CASES_URL = UPSTREAM + 'covid19_cases_switzerland_openzh-phase2.csv'
+
+CANTONS = ['AG', 'AI', 'AR', 'BE', 'BL', 'BS', 'FR', 'GE', 'GL', 'GR', 'JU', 'LU', 'NE',
+           'NW', 'OW', 'SG', 'SH', 'SO', 'SZ', 'TG', 'TI', 'UR', 'VD', 'VS', 'ZG', 'ZH']
+
+# Bump when the dtypes or parse options below change
+SCHEMA_VERSION = 1
+
+table_dir = os.environ.get('DVC_TABLE_DIR', os.path.join(repo_dir, '.cache', 'tables'))
+
+
+# Content hash of a fetched or local file. Objects in the fetch cache are already named by their sha256.
+def _content_key(path):
+    name = os.path.basename(path)
+    if len(name) == 64 and os.path.basename(os.path.dirname(path)) == name[:2]:
+        return name
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+# dtype schema of the openzh-phase2 table: 'Date' is parsed as datetime64,
+# every other column (cumulative cases, *_diff, *_pc, *_diff_pc) is float64
+def cases_dtypes(columns):
+    return {c: 'float64' for c in columns if c != 'Date'}
+
+
+# Malformed lines are skipped; pandas 1.3 replaced error_bad_lines (removed in 2.0) with on_bad_lines
+if tuple(int(v) for v in pd.__version__.split('.')[:2]) >= (1, 3):
+    SKIP_BAD_LINES = dict(on_bad_lines='skip')
+else:
+    SKIP_BAD_LINES = dict(error_bad_lines=False)
+
+
+def _read_cases_csv(path):
+    columns = pd.read_csv(path, nrows=0).columns
+    return pd.read_csv(path, dtype=cases_dtypes(columns), parse_dates=['Date'], **SKIP_BAD_LINES)
+
+
+def _read_cached(path, name, parse):
+    try:
+        import pyarrow.feather as feather
+    except ImportError:
+        return parse(path)
+
+    cached = os.path.join(table_dir, '%s-v%d-%s.feather' % (name, SCHEMA_VERSION, _content_key(path)))
+    if not os.path.exists(cached):
+        frame = parse(path)
+        write_atomic(cached, lambda f: feather.write_feather(frame, f))
+    return feather.read_table(cached).to_pandas()
+
+
+# The openzh-phase2 case table with 'Date' as a datetime64 column and float64 values.
+# Used by both ex2 and ex4, so both dashboards work on identical frames.
+def load_cases(url=CASES_URL, offline=None, timeout=None, retries=None):
+    return _read_cached(fetch(url, offline=offline, timeout=timeout, retries=retries), 'openzh-phase2', _read_cases_csv)
+
+
+def _read_distinct(path, columns, chunksize):
+    distinct = None
+    for chunk in pd.read_csv(path, usecols=columns, chunksize=chunksize):
+        chunk = chunk[columns].drop_duplicates()
+        distinct = chunk if distinct is None else pd.concat([distinct, chunk]).drop_duplicates()
+    # a file with only the header gives no chunks
+    if distinct is None:
+        return pd.DataFrame(columns=columns)
+    return distinct.reset_index(drop=True)
+
+
+# Distinct rows of `columns` in the table at url, in the order of their first appearance.
+# Memory is bounded by the chunk and the number of distinct rows, not by the length of the file.
+def load_distinct(url, columns, chunksize=100000, offline=None, timeout=None, retries=None):
+    columns = list(columns)
+    return _read_cached(fetch(url, offline=offline, timeout=timeout, retries=retries), 'distinct-%s' % '-'.join(columns),
+                        lambda path: _read_distinct(path, columns, chunksize))
@@ -0,0 +1,114 @@
+import glob
+import io
+import os
+
+import pandas as pd
+
+# ====================================================================
+# Rows appended to a growing CSV file (or a folder of CSV files)
+#
+#   tail = shared_tail('covid19_tests_switzerland_bag.csv', index_col=[0])
+#   tail.poll()              read what was appended since the last poll
+#   rows = tail.since(n)     all rows after the first n, as one frame
+#
+# Only the bytes after the last complete line that was read are parsed,
+# a line that is still being written is left for the next poll. A folder
+# is read as the concatenation of its *.csv files in name order, so new
+# files and rows appended to the last file both arrive as new rows.
+# A file that shrinks or disappears starts everything over: the tail
+# drops its rows and increments `generation`, which tells readers to
+# reload instead of appending.
+#
+# shared_tail() keeps one tail per path and process, so every session
+# of a bokeh server reads the new bytes once and takes its rows from it.
+# ====================================================================
+
+
+class CsvTail:
+
+    def __init__(self, path, **kwargs):
+        self.path = path
+        self.kwargs = kwargs
+        self.generation = 0
+        self.reset()
+
+    def reset(self):
+        self.offsets = {}
+        self.headers = {}
+        self.chunks = []
+        self.count = 0
+        self._frame = None
+        self.generation += 1
+
+    def files(self):
+        if os.path.isdir(self.path):
+            return sorted(glob.glob(os.path.join(self.path, '*.csv')))
+        return [self.path]
+
+    # Parse the complete lines appended to one file since the last poll, or return None
+    def _read(self, path, size):
+        offset = self.offsets.get(path, 0)
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            data = f.read(size - offset)
+        end = data.rfind(b'\n') + 1
+        if end == 0:
+            return None
+        begin = 0
+        if offset == 0:
+            begin = data.find(b'\n') + 1
+            self.headers[path] = data[:begin]
+        self.offsets[path] = offset + end
+        if begin == end:
+            return None
+        return pd.read_csv(io.BytesIO(self.headers[path] + data[begin:end]), **self.kwargs)
+
+    # Read the rows appended since the last poll, return how many there are
+    def poll(self):
+        files = self.files()
+        sizes = {}
+        for path in files:
+            try:
+                sizes[path] = os.path.getsize(path)
+            except FileNotFoundError:
+                sizes[path] = -1
+        if any(sizes.get(path, -1) < offset for path, offset in self.offsets.items()):
+            self.reset()
+        new = []
+        for path in files:
+            if sizes[path] > self.offsets.get(path, 0):
+                frame = self._read(path, sizes[path])
+                if frame is not None and len(frame):
+                    new.append(frame)
+        if new:
+            self.chunks.extend(new)
+            self.count += sum(len(frame) for frame in new)
+            self._frame = None
+        return sum(len(frame) for frame in new)
+
+    # All rows read so far
+    def frame(self):
+        if self._frame is None:
+            self._frame = pd.concat(self.chunks) if self.chunks else pd.DataFrame()
+            # later chunks build on this one, so since() stays cheap
+            self.chunks = [self._frame] if self.chunks else []
+        return self._frame
+
+    # Rows after the first `count`
+    def since(self, count):
+        skipped, out = 0, []
+        for chunk in self.chunks:
+            if skipped + len(chunk) > count:
+                out.append(chunk.iloc[max(count - skipped, 0):])
+            skipped += len(chunk)
+        return pd.concat(out) if out else self.frame().iloc[:0]
+
+
+_shared = {}
+
+
+def shared_tail(path, **kwargs):
+    path = os.path.abspath(path)
+    if path not in _shared:
+        _shared[path] = CsvTail(path, **kwargs)
+    return _shared[path]
@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+
+# ====================================================================
+# Compact dates x regions time series
+#
+#   cube = TimeCube.from_frame(raw, CANTONS)   one float32 block
+#   cube.values[0] = 0
+#   cube.ffill().diff().fillna(0)              in place, no copies
+#   avg = cube.rolling_mean(3).fillna(0)       one new block
+#   avg.astype(np.float64)                     the same values in another dtype
+#   avg.frame()                                DataFrame over the same memory
+#   avg.window(start, end)                     view of some dates
+#
+# All values of a cube are one C-contiguous float32 array: row i holds
+# dates[i] of every region, so row i is also frame i of the ex4 browser
+# animation and values.ravel() is a view. float32 keeps about 7
+# significant digits, enough for case counts up to 16 million and for
+# per-capita rates. Missing values are NaN and mask() returns where
+# they are. A cube can also be float64 (from_frame(dtype=...)), e.g. to
+# run a pipeline in float64 and round the result to float32 once with
+# astype; every operation keeps the dtype of its input.
+#
+# ffill, diff and fillna overwrite the cube and return it, so a pipeline
+# only ever holds one block. rolling_mean needs the input while it
+# writes, so it allocates one new block. from_frame copies one column at
+# a time, so a float64 frame is never duplicated as a whole.
+# ====================================================================
+
+
+class TimeCube:
+
+    def __init__(self, values, dates, regions, dtype=np.float32):
+        self.values = np.ascontiguousarray(values, dtype=dtype)
+        self.dates = pd.DatetimeIndex(dates)
+        self.regions = pd.Index(regions)
+
+    # Cube of the given columns of a date-indexed frame (or of `dates`), columns missing from the frame are NaN.
+    # The regions are named after the columns unless `regions` gives other names.
+    @classmethod
+    def from_frame(cls, frame, columns=None, dates=None, regions=None, dtype=np.float32):
+        columns = list(frame.columns if columns is None else columns)
+        values = np.empty((len(frame), len(columns)), dtype=dtype)
+        for j, c in enumerate(columns):
+            values[:, j] = frame[c].to_numpy() if c in frame.columns else np.nan
+        return cls(values, frame.index if dates is None else dates, columns if regions is None else regions, dtype)
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes
+
+    # The same cube with values of another dtype (itself if they already are)
+    def astype(self, dtype):
+        if self.values.dtype == dtype:
+            return self
+        return TimeCube(self.values, self.dates, self.regions, dtype)
+
+    def mask(self):
+        return np.isnan(self.values)
+
+    # The same values with one row per day from the first to the last date, days without a row are NaN
+    def daily(self):
+        days = pd.date_range(self.dates[0], self.dates[-1], freq='D') if len(self.dates) else self.dates
+        if days.equals(self.dates):
+            return self
+        values = np.full((len(days), len(self.regions)), np.nan, dtype=self.values.dtype)
+        values[days.get_indexer(self.dates)] = self.values
+        return TimeCube(values, days, self.regions, values.dtype)
+
+    # Fill NaN with the last value of the same region (in place)
+    def ffill(self):
+        v = self.values
+        for i in range(1, len(v)):
+            np.copyto(v[i], v[i - 1], where=np.isnan(v[i]))
+        return self
+
+    # Change from the previous row, NaN on the first row (in place, like DataFrame.diff)
+    def diff(self):
+        v = self.values
+        for i in range(len(v) - 1, 0, -1):
+            v[i] -= v[i - 1]
+        if len(v):
+            v[0] = np.nan
+        return self
+
+    def fillna(self, value):
+        np.copyto(self.values, value, where=np.isnan(self.values))
+        return self
+
+    # Mean of the last `step` rows, NaN for the first step - 1 rows and windows with a NaN
+    # (like DataFrame.rolling(step).mean()), in a new cube
+    def rolling_mean(self, step):
+        v = self.values
+        out = np.full(v.shape, np.nan, dtype=v.dtype)
+        if len(v) >= step:
+            windows = np.lib.stride_tricks.sliding_window_view(v, step, axis=0)
+            np.sum(windows, axis=-1, out=out[step - 1:])
+            out[step - 1:] /= step
+        return TimeCube(out, self.dates, self.regions, out.dtype)
+
+    # The rows between start and end (inclusive), sharing the values of this cube
+    def window(self, start=None, end=None):
+        lo = 0 if start is None else self.dates.searchsorted(pd.Timestamp(start), side='left')
+        hi = len(self.dates) if end is None else self.dates.searchsorted(pd.Timestamp(end), side='right')
+        return TimeCube(self.values[lo:hi], self.dates[lo:hi], self.regions, self.values.dtype)
+
+    # DataFrame indexed by date with one column per region, over the values of this cube
+    def frame(self):
+        frame = pd.DataFrame(self.values, index=self.dates, columns=self.regions, copy=False)
+        frame.index.name = self.dates.name
+        return frame
@@ -0,0 +1,278 @@
+import atexit
+import bisect
+import collections
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# ====================================================================
+# Stage timings and callback latency histograms
+#
+#   with stage('ex2.load'):          one record per pipeline stage
+#       raw = load_cases(url)
+#
+#   @timed_callback('ex4.callback')  latency histogram of a bokeh callback
+#   def callback(attr, old, new): ...
+#
+# Stage records hold the wall time, the peak RSS of the process after the
+# stage and its growth during the stage. While tracemalloc is tracing
+# (python -X tracemalloc or PYTHONTRACEMALLOC=1), they also hold the
+# peak of traced Python allocations during the stage. tracemalloc has a
+# single peak for the process, so it is only reset when no other stage
+# is running; a stage that starts inside another one (nested, or in
+# another thread like the ex4.read_* stages) gets the peak since the
+# outer stage started, an upper bound marked with '<=' in the report.
+#
+#   footprint('ex2.ffill', raw=cube)  bytes held by the named objects
+#
+# footprint() records what a stage leaves behind: arrays, frames, indexes
+# and the containers and objects holding them (e.g. a MapData). Arrays
+# that share memory (views, a frame over a TimeCube) are counted once.
+#
+# Recording is always on and only costs two perf_counter calls. Output is
+# controlled by DVC_TIMING:
+#   DVC_TIMING=1             print a report to stderr when the process exits
+#   DVC_TIMING=<file.jsonl>  append all records to that file as JSON lines
+# Under bokeh serve the callback histograms are written when the server
+# shuts down. Every session adds records, so at most MAX_RECORDS are
+# kept: with a file they are written out whenever that many have
+# collected, otherwise the oldest ones are dropped. An exported file is shown with
+#   python -m dvc_common.timing <file.jsonl>
+# ====================================================================
+
+# Upper bucket edges of the latency histograms in milliseconds, the last bucket is unbounded
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+# Records kept in memory (DVC_TIMING_MAX_RECORDS)
+MAX_RECORDS = int(os.environ.get('DVC_TIMING_MAX_RECORDS', 10000))
+
+records = collections.deque(maxlen=MAX_RECORDS)
+histograms = {}
+
+# Stages running right now (in any thread), the tracemalloc peak is only reset when there are none
+_active = 0
+_active_lock = threading.Lock()
+
+
+# Peak resident set size of the process in bytes (ru_maxrss is in KiB on Linux, in bytes on macOS)
+def _peak_rss():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def _add(record):
+    records.append(record)
+    if len(records) >= MAX_RECORDS and _target() not in ('', '0', '1'):
+        flush()
+
+
+@contextmanager
+def stage(name, **tags):
+    global _active
+    rss = _peak_rss()
+    tracing = tracemalloc.is_tracing()
+    with _active_lock:
+        outermost = _active == 0
+        _active += 1
+        if tracing:
+            if outermost:
+                tracemalloc.reset_peak()
+            traced = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record = dict(kind='stage', name=name, seconds=time.perf_counter() - start, time=time.time())
+        with _active_lock:
+            _active -= 1
+            if tracing:
+                record['traced_peak'] = tracemalloc.get_traced_memory()[1] - traced
+                if not outermost:
+                    record['traced_peak_bound'] = True
+        if rss is not None:
+            record['peak_rss'] = _peak_rss()
+            record['peak_rss_growth'] = record['peak_rss'] - rss
+        record.update(tags)
+        _add(record)
+
+
+def _nbytes(obj, seen):
+    # numpy arrays: count the array owning the memory, once
+    if hasattr(obj, 'nbytes') and hasattr(obj, 'base') and hasattr(obj, 'dtype'):
+        while getattr(obj.base, 'nbytes', None) is not None:
+            obj = obj.base
+        if id(obj) in seen:
+            return 0
+        seen.add(id(obj))
+        if obj.dtype.kind == 'O':
+            return obj.nbytes + sum(sys.getsizeof(x) for x in obj.ravel())
+        return obj.nbytes
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    # pandas frames, series and indexes
+    if hasattr(obj, 'memory_usage'):
+        usage = obj.memory_usage(deep=True)
+        return int(usage.sum() if hasattr(usage, 'sum') else usage)
+    if isinstance(obj, dict):
+        return sum(_nbytes(k, seen) + _nbytes(v, seen) for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set)):
+        return sys.getsizeof(obj) + sum(_nbytes(v, seen) for v in obj)
+    if hasattr(obj, '__dict__'):
+        return sum(_nbytes(v, seen) for v in vars(obj).values())
+    return sys.getsizeof(obj)
+
+
+# Bytes held by the given objects together
+def nbytes(*objects):
+    seen = set()
+    return sum(_nbytes(obj, seen) for obj in objects)
+
+
+# Record the bytes held by every named object, memory shared with an earlier one is not counted again
+def footprint(name, **objects):
+    seen = set()
+    _add(dict(kind='memory', name=name, time=time.time(),
+              bytes={k: _nbytes(v, seen) for k, v in objects.items()}))
+
+
+class Histogram:
+
+    def __init__(self, name):
+        self.name = name
+        self.reset()
+
+    def reset(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        ms = 1000 * seconds
+        self.counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    # Upper bucket edge below which a fraction q of the calls fall
+    def quantile(self, q):
+        rank, seen = q * self.count, 0
+        for edge, n in zip(BUCKETS_MS + (float('inf'),), self.counts):
+            seen += n
+            if seen >= rank:
+                return min(edge, self.max)
+        return self.max
+
+    def record(self):
+        return dict(kind='latency', name=self.name, count=self.count, total_ms=self.total,
+                    max_ms=self.max, buckets_ms=list(BUCKETS_MS), counts=self.counts, time=time.time())
+
+
+def histogram(name):
+    if name not in histograms:
+        histograms[name] = Histogram(name)
+    return histograms[name]
+
+
+# Decorator adding the run time of every call to the histogram `name`.
+# functools.wraps keeps the signature visible, which bokeh checks for on_change/on_click callbacks.
+def timed_callback(name):
+    def decorate(fn):
+        h = histogram(name)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                h.add(time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+# All stage records followed by one record per histogram
+def all_records():
+    return list(records) + [h.record() for h in histograms.values() if h.count]
+
+
+def export(path):
+    with open(path, 'a') as f:
+        for record in all_records():
+            f.write(json.dumps(record) + '\n')
+
+
+def report(items=None, out=None):
+    out = out or sys.stderr
+    items = all_records() if items is None else items
+    stages = [r for r in items if r['kind'] == 'stage']
+    if stages:
+        out.write('%-32s %10s %14s %14s\n' % ('stage', 'ms', 'peak RSS MiB', 'traced MiB'))
+        for r in stages:
+            out.write('%-32s %10.1f %14s %14s\n' % (
+                r['name'], 1000 * r['seconds'],
+                '%.1f' % (r['peak_rss'] / 2 ** 20) if 'peak_rss' in r else '-',
+                ('<=' if r.get('traced_peak_bound') else '') + '%.1f' % (r['traced_peak'] / 2 ** 20)
+                if 'traced_peak' in r else '-'))
+    memory = [r for r in items if r['kind'] == 'memory']
+    if memory:
+        out.write('%-32s %-20s %12s\n' % ('memory', 'object', 'MiB'))
+        for r in memory:
+            for key, n in r['bytes'].items():
+                out.write('%-32s %-20s %12.2f\n' % (r['name'], key, n / 2 ** 20))
+    # histograms of the same callback (e.g. from several flushes) are added up
+    merged = {}
+    for r in items:
+        if r['kind'] == 'latency':
+            h = merged.setdefault(r['name'], Histogram(r['name']))
+            h.counts = [a + b for a, b in zip(h.counts, r['counts'])]
+            h.count += r['count']
+            h.total += r['total_ms']
+            h.max = max(h.max, r['max_ms'])
+    if merged:
+        out.write('%-32s %8s %10s %10s %10s %10s\n' % ('callback', 'calls', 'mean ms', 'p50 ms', 'p95 ms', 'max ms'))
+        for h in merged.values():
+            out.write('%-32s %8d %10.1f %10.1f %10.1f %10.1f\n' % (
+                h.name, h.count, h.total / h.count, h.quantile(0.5), h.quantile(0.95), h.max))
+
+
+# Write the records according to DVC_TIMING and forget them, so a later flush does not repeat them
+def _target():
+    return os.environ.get('DVC_TIMING', '')
+
+
+def flush():
+    target = _target()
+    if target in ('', '0'):
+        return
+    if target == '1':
+        report()
+    else:
+        export(target)
+    records.clear()
+    for h in histograms.values():
+        h.reset()
+
+
+atexit.register(flush)
+
+
+if __name__ == '__main__':
+    items = []
+    for path in sys.argv[1:]:
+        with open(path) as f:
+            items.extend(json.loads(line) for line in f if line.strip())
+    report(items, sys.stdout)
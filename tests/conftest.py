@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Run with: python -m pytest tests
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
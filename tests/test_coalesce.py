@@ -0,0 +1,69 @@
+import heapq
+
+from dvc_common.coalesce import Coalescer
+
+
+# A fake event loop: the clock only moves when run_until() runs the callbacks that are due
+class Loop:
+
+    def __init__(self):
+        self.now = 0.0
+        self.queue = []
+        self.count = 0
+
+    def clock(self):
+        return self.now
+
+    def schedule(self, callback, seconds):
+        self.count += 1
+        heapq.heappush(self.queue, (self.now + seconds, self.count, callback))
+
+    def run_until(self, t):
+        while self.queue and self.queue[0][0] <= t:
+            self.now, _, callback = heapq.heappop(self.queue)
+            callback()
+        self.now = max(self.now, t)
+
+
+def test_burst_of_100_slider_events():
+    loop, shown = Loop(), []
+    latest = Coalescer(shown.append, loop.schedule, interval=0.1, clock=loop.clock)
+    # a one second drag, one event every 10 ms
+    for i in range(100):
+        loop.run_until(i * 0.01)
+        latest.submit(i)
+    loop.run_until(2)
+
+    assert latest.submitted == 100
+    # one update on the first event, then one per interval
+    assert latest.applied == len(shown) == 11
+    assert latest.max_delay <= 0.1 + 1e-9
+    assert shown[0] == 0 and shown[-1] == 99
+    assert shown == sorted(shown)
+
+
+def test_burst_within_one_tick_runs_once():
+    loop, shown = Loop(), []
+    latest = Coalescer(shown.append, loop.schedule, interval=0, clock=loop.clock)
+    for i in range(100):
+        latest.submit(i)
+    loop.run_until(0)
+
+    assert shown == [99]
+    assert latest.max_delay == 0
+
+
+def test_cancel_drops_the_pending_value():
+    loop, shown = Loop(), []
+    latest = Coalescer(shown.append, loop.schedule, interval=0.1, clock=loop.clock)
+    latest.submit(1)
+    loop.run_until(0)
+    latest.submit(2)
+    latest.cancel()
+    loop.run_until(1)
+
+    assert shown == [1]
+    # a value submitted after the cancel still runs
+    latest.submit(3)
+    loop.run_until(2)
+    assert shown == [1, 3]
@@ -0,0 +1,170 @@
+import hashlib
+import http.server
+import os
+import threading
+import time
+
+import pytest
+
+from dvc_common import fetch
+
+
+# Stand-in for the upstream server: serves the files of server.root with an ETag
+# (a hash of the body) and answers a matching If-None-Match with 304.
+# The first server.fail requests of a file get a 503, server.stall delays files by name.
+class Handler(http.server.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        server = self.server
+        name = os.path.basename(self.path)
+        with server.lock:
+            server.requests[name] = server.requests.get(name, 0) + 1
+            count = server.requests[name]
+        if count <= server.fail:
+            self.send_error(503)
+            return
+        time.sleep(server.stall.get(name, 0))
+        path = os.path.join(server.root, name)
+        if not os.path.exists(path):
+            self.send_error(404)
+            return
+        with open(path, 'rb') as f:
+            body = f.read()
+        etag = '"%s"' % hashlib.sha256(body).hexdigest()[:16]
+        if self.headers.get('If-None-Match') == etag:
+            with server.lock:
+                server.not_modified += 1
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client gave up (timeout)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server(tmp_path):
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    server.root = str(tmp_path / 'www')
+    server.lock = threading.Lock()
+    server.requests = {}
+    server.not_modified = 0
+    server.fail, server.stall = 0, {}
+    os.makedirs(server.root)
+    with open(os.path.join(server.root, 'cases.csv'), 'w') as f:
+        f.write('Date,AG\n2020-03-01,1\n')
+    server.url = 'http://127.0.0.1:%d/cases.csv' % server.server_address[1]
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return str(tmp_path / 'http')
+
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+
+def test_offline_miss_raises_without_a_request(server, cache):
+    with pytest.raises(FileNotFoundError):
+        fetch.fetch(server.url, offline=True, cache=cache)
+    assert server.requests == {}
+
+
+def test_download_then_fresh_copy(server, cache):
+    path = fetch.fetch(server.url, cache=cache)
+    assert read(path) == 'Date,AG\n2020-03-01,1\n'
+    # content-addressed: the object is named by the hash of the body
+    assert os.path.basename(path) == hashlib.sha256(b'Date,AG\n2020-03-01,1\n').hexdigest()
+    assert fetch.fetch(server.url, cache=cache, max_age=60) == path
+    assert server.requests['cases.csv'] == 1
+
+
+def test_revalidation(server, cache):
+    first = fetch.fetch(server.url, cache=cache)
+    assert fetch.fetch(server.url, cache=cache, max_age=0) == first
+    assert server.requests['cases.csv'] == 2 and server.not_modified == 1
+
+    with open(os.path.join(server.root, 'cases.csv'), 'a') as f:
+        f.write('2020-03-02,3\n')
+    changed = fetch.fetch(server.url, cache=cache, max_age=0)
+    assert changed != first
+    assert read(changed).endswith('2020-03-02,3\n')
+    assert server.not_modified == 1
+
+
+def test_cached_copy_offline_and_when_the_server_is_gone(server, cache):
+    path = fetch.fetch(server.url, cache=cache)
+    assert fetch.fetch(server.url, offline=True, cache=cache) == path
+    assert server.requests['cases.csv'] == 1
+
+    server.shutdown()
+    server.server_close()
+    assert fetch.fetch(server.url, cache=cache, max_age=0, retries=0, timeout=1) == path
+
+
+def test_local_paths_are_not_fetched(tmp_path, cache):
+    path = str(tmp_path / 'local.csv')
+    assert fetch.fetch(path, cache=cache) == path
+
+
+# Timeouts and retries of the concurrent ex4 loading (fetch.run_concurrently)
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(fetch, 'BACKOFF', 0.01)
+
+
+def test_503_is_retried(server, cache, no_backoff):
+    server.fail = 2
+    path = fetch.fetch(server.url, cache=cache, retries=2)
+    assert read(path).startswith('Date,AG')
+    assert server.requests['cases.csv'] == 3
+
+
+def test_stalled_source_times_out_after_the_retries(server, cache, no_backoff):
+    server.stall['cases.csv'] = 1
+    start = time.perf_counter()
+    with pytest.raises(OSError):
+        fetch.fetch(server.url, cache=cache, retries=1, timeout=0.2)
+    assert server.requests['cases.csv'] == 2
+    # each attempt gives up after its timeout, not after the stall
+    assert time.perf_counter() - start < 1
+
+
+def test_sources_run_at_the_same_time():
+    start = time.perf_counter()
+    results = fetch.run_concurrently({name: (lambda name=name: time.sleep(0.2) or name) for name in 'abcd'})
+    assert results == dict(a='a', b='b', c='c', d='d')
+    assert time.perf_counter() - start < 0.6
+
+
+def test_first_error_in_task_order_is_raised():
+    done = []
+
+    def fail(message, seconds):
+        def run():
+            time.sleep(seconds)
+            raise ValueError(message)
+        return run
+
+    tasks = dict(first=fail('first', 0.1), second=fail('second', 0), slow=lambda: done.append(time.sleep(0.2)))
+    with pytest.raises(ValueError, match='first'):
+        fetch.run_concurrently(tasks)
+    # the other tasks still ran to the end
+    assert done == [None]
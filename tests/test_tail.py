@@ -0,0 +1,129 @@
+import contextlib
+import io
+
+import pandas as pd
+import pytest
+from bokeh.document import Document
+from bokeh.models import ColumnDataSource, LinearColorMapper
+
+from dvc_common.batch import dashboard_module
+from dvc_common.tail import CsvTail
+
+HEADER = ',date,n_negative,n_positive,n_tests,frac_positive\n'
+
+
+# Lines of the tests file, one day each from 2020-03-01
+def rows(n, start=0, rate=0.1):
+    days = pd.date_range('2020-03-01', periods=start + n)[start:]
+    return ['%d,%s,%d,%d,%d,%g\n' % (start + i, day.strftime('%Y-%m-%d'), 90, 10, 100, rate)
+            for i, day in enumerate(days)]
+
+
+def write(path, lines, mode='a'):
+    with open(path, mode) as f:
+        f.write(''.join(lines))
+
+
+def dates(frame):
+    return list(frame.date)
+
+
+def line_dates(lines):
+    return [line.split(',')[1] for line in lines]
+
+
+def test_appended_rows(tmp_path):
+    path = str(tmp_path / 'tests.csv')
+    write(path, [HEADER], 'w')
+    tail = CsvTail(path, index_col=[0])
+    assert tail.poll() == 0 and len(tail.frame()) == 0
+
+    lines = rows(6)
+    write(path, lines[:3])
+    assert tail.poll() == 3
+    # a line that is still being written is left for the next poll
+    write(path, [lines[3], lines[4][:5]])
+    assert tail.poll() == 1
+    write(path, [lines[4][5:], lines[5]])
+    assert tail.poll() == 2
+    assert dates(tail.since(4)) == line_dates(lines[4:6])
+    assert dates(tail.frame()) == line_dates(lines)
+
+
+def test_rewritten_file_starts_over(tmp_path):
+    path = str(tmp_path / 'tests.csv')
+    write(path, [HEADER] + rows(5), 'w')
+    tail = CsvTail(path, index_col=[0])
+    tail.poll()
+    generation = tail.generation
+    write(path, [HEADER] + rows(1, 10), 'w')
+    assert tail.poll() == 1
+    assert tail.generation == generation + 1
+    assert dates(tail.frame()) == line_dates(rows(1, 10))
+
+
+def test_folder_of_files(tmp_path):
+    lines = rows(8)
+    tail = CsvTail(str(tmp_path), index_col=[0])
+    assert tail.poll() == 0
+    write(str(tmp_path / 'a.csv'), [HEADER] + lines[:2])
+    write(str(tmp_path / 'b.csv'), [HEADER] + lines[2:5])
+    assert tail.poll() == 5
+    write(str(tmp_path / 'b.csv'), lines[5:7])
+    write(str(tmp_path / 'c.csv'), [HEADER] + lines[7:])
+    assert tail.poll() == 3
+    assert dates(tail.since(5)) == line_dates(lines[5:])
+
+
+# A live dvc_ex3 session on tail; returns its poll callback, the scatter and overview sources and the document
+@pytest.fixture
+def session(monkeypatch):
+    ex3 = dashboard_module('ex3')
+
+    def start(tail):
+        doc = Document()
+        polls = []
+        doc.add_next_tick_callback = lambda fn: fn()
+        doc.add_periodic_callback = lambda fn, ms: polls.append(fn)
+        monkeypatch.setattr(ex3, 'curdoc', lambda: doc)
+        with contextlib.redirect_stdout(io.StringIO()):
+            doc.add_root(ex3.build_plot(tail.frame(), server=True, tail=tail))
+        sources = [s for s in doc.select({'type': ColumnDataSource}) if 'pos_num' in s.data]
+        source = [s for s in sources if 'test_num' in s.data][0]
+        overview = [s for s in sources if 'test_num' not in s.data][0]
+        return polls[0], source, overview, doc
+    return start
+
+
+@pytest.mark.parametrize('header', [False, True], ids=['empty folder', 'header-only file'])
+def test_live_session_starts_without_rows(tmp_path, session, header):
+    target = str(tmp_path / 'tests.csv') if header else str(tmp_path)
+    if header:
+        write(target, [HEADER], 'w')
+    tail = CsvTail(target, index_col=[0])
+    tail.poll()
+    poll, source, overview, _ = session(tail)
+    assert len(source.data['x']) == 0
+
+    lines = rows(40)
+    write(str(tmp_path / 'tests.csv'), ([] if header else [HEADER]) + lines)
+    poll()
+    assert len(source.data['x']) > 0
+    assert pd.Timestamp(source.data['x'][0]) == pd.Timestamp(line_dates(lines)[0])
+
+
+def test_live_session_streams_appended_rows(tmp_path, session):
+    path = str(tmp_path / 'tests.csv')
+    write(path, [HEADER] + rows(40), 'w')
+    tail = CsvTail(path, index_col=[0])
+    tail.poll()
+    poll, source, overview, doc = session(tail)
+    data, points = overview.data, len(overview.data['x'])
+
+    write(path, rows(5, 40, rate=0.9))
+    poll()
+    # only the new rows are added to the overview line, its columns are not replaced
+    assert overview.data is data
+    assert len(overview.data['x']) == points + 5
+    # the color range widens to the new rates
+    assert max(m.high for m in doc.select({'type': LinearColorMapper})) == pytest.approx(0.9)